@@ -0,0 +1,311 @@
+# ------- Gestion des absences en ligne de commande (sans interface graphique) -------
+# Usage: python absences_cli.py [--json] {stats,export,backup,restore,verify,import} ...
+#   python absences_cli.py stats --from 2025-01-01 --to 2025-01-31 --classe BTS1
+#   python absences_cli.py export --directory exports --format jsonl
+#   python absences_cli.py --json backup          (tâche cron de la nuit)
+#   python absences_cli.py restore [--upto auto_backup_..._incr.sql.gz]
+#   python absences_cli.py import etudiants.csv
+# Aucun module Qt n'est chargé: seule la couche d'accès aux données (absences_core).
+# Avec --json, chaque commande écrit un seul objet JSON sur la sortie standard
+# (la progression ne s'affiche pas); le code de retour vaut 0 en cas de succès,
+# 1 en cas d'erreur et 130 pour un export annulé (Ctrl+C).
+# Les paramètres de connexion sont lus dans app_config.ini (section [DATABASE]);
+# le mot de passe vient de --password, de la variable ABSENCES_DB_PASSWORD ou est demandé.
+
+import argparse                              # Sous-commandes et options
+import configparser                          # Lecture de app_config.ini
+import csv                                   # Export CSV des statistiques
+import dataclasses                           # Statistiques converties en JSON
+import getpass                               # Saisie du mot de passe sans écho
+import json                                  # Sortie lisible par les scripts (--json)
+import os                                    # Variables d'environnement
+import signal                                # Ctrl+C annule proprement un export
+import sys                                   # Codes de retour et sortie d'erreur
+import threading                             # Drapeau d'annulation partagé avec les threads d'export
+from datetime import date, datetime, timedelta
+
+import mysql.connector                       # Connexion à MySQL
+
+from absences_core import migrate, DatabasePool  # Couche d'accès aux données
+from absences_core import BackupChain, BackupIntegrityError, manifest_path
+from absences_core import AbsenceFilter, compute_statistics
+from absences_core import EXPORT_DELIMITER, EXPORT_WRITERS, export_snapshot, SnapshotError
+from absences_core import STUDENT_EXPORT_FIELDS, ABSENCE_EXPORT_FIELDS, students_export_query, students_count_query
+from absences_core import absences_query, absences_count_query
+from absences_core import import_csv, ImportFormatError
+
+
+def read_config(path="app_config.ini"):
+    """Database and backup settings saved by the application"""
+    config = configparser.ConfigParser()
+    config.read(path)
+    database = config['DATABASE'] if 'DATABASE' in config else {}
+    backup = config['BACKUP'] if 'BACKUP' in config else {}
+    return {
+        'host': database.get('host', 'localhost'),
+        'user': database.get('user', 'root'),
+        'database': database.get('database', 'gestion_absences_BTS'),
+        'directory': backup.get('directory', "backups"),
+        'full_every': int(backup.get('full_every', 7)),
+        'retention': int(backup.get('retention', 20))
+    }
+
+
+def connection_params(args, config):
+    """Connection settings from the command line options, falling back on app_config.ini"""
+    password = args.password
+    if password is None:
+        password = os.environ.get("ABSENCES_DB_PASSWORD")
+    if password is None:
+        password = getpass.getpass("Mot de passe MySQL: ")
+    return {
+        'host': args.host or config['host'],
+        'user': args.user or config['user'],
+        'password': password,
+        'database': args.database or config['database']
+    }
+
+
+def connect(args, config):
+    """Open a connection, with the schema migrated as when the application connects"""
+    connection = mysql.connector.connect(**connection_params(args, config))
+    try:
+        migrate(connection)  # Tables annexes (cumul, journal) absentes d'une base neuve
+    except BaseException:
+        connection.close()
+        raise
+    return connection
+
+
+def open_pool(args, config):
+    """Connection pools for the commands reading on several connections at once (export)"""
+    db = DatabasePool(**connection_params(args, config), interactive_size=1, background_size=2)
+    try:
+        db.run(migrate, retry=False)
+    except BaseException:
+        db.close()
+        raise
+    return db
+
+
+def parse_date(text):
+    """argparse type of the --from/--to options"""
+    try:
+        return date.fromisoformat(text).isoformat()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"date invalide '{text}' (AAAA-MM-JJ)")
+
+
+def emit(args, result, text):
+    """Print the result of a command: one JSON object with --json, text otherwise"""
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, default=str))
+    else:
+        print(text)
+
+
+def progress_printer(args, template):
+    """Progress callback writing template.format(*values) on stderr (none with --json)"""
+    if args.json:
+        return None
+
+    def progress(*values):
+        print("\r" + template.format(*values), end="", file=sys.stderr, flush=True)
+    return progress
+
+
+def end_progress(args):
+    if not args.json:
+        print(file=sys.stderr)
+
+
+def cmd_stats(args, config):
+    """Statistics of a period (30 days up to today by default)"""
+    date_to = args.date_to or date.today().isoformat()
+    date_from = args.date_from or (date.fromisoformat(date_to) - timedelta(days=30)).isoformat()
+    spec = AbsenceFilter(classe=args.classe, date_from=date_from, date_to=date_to)
+    connection = connect(args, config)
+    try:
+        stats = compute_statistics(connection, spec, top_n=args.top)
+    finally:
+        connection.close()
+    if args.csv:
+        with open(args.csv, 'w', newline='', encoding='utf-8') as f:
+            csv.writer(f, delimiter=EXPORT_DELIMITER).writerows(stats.csv_rows())
+    result = dataclasses.asdict(stats)
+    result['total_absences'] = stats.total_absences
+    emit(args, result, stats.format_report())
+    return 0
+
+
+def cmd_export(args, config):
+    """Export the students and the absences from one consistent snapshot, with a manifest"""
+    os.makedirs(args.directory, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    extension = EXPORT_WRITERS[args.format].extension
+    students_file = os.path.join(args.directory, f"etudiants_{timestamp}{extension}")
+    absences_file = os.path.join(args.directory, f"absences_{timestamp}{extension}")
+    manifest_file = os.path.join(args.directory, f"export_{timestamp}.manifest.json")
+    spec = AbsenceFilter(classe=args.classe, statut=args.statut, date_from=args.date_from, date_to=args.date_to)
+    targets = [
+        (students_file, args.format, students_export_query(), students_count_query(), STUDENT_EXPORT_FIELDS),
+        (absences_file, args.format, absences_query(spec), absences_count_query(spec), ABSENCE_EXPORT_FIELDS)
+    ]
+
+    db = open_pool(args, config)  # Mot de passe demandé avant: Ctrl+C doit pouvoir l'interrompre
+    cancelled = threading.Event()
+    previous_handler = signal.getsignal(signal.SIGINT)
+    try:
+        signal.signal(signal.SIGINT, lambda *_: cancelled.set())
+        manifest = export_snapshot(db, targets, manifest_file,
+                                   progress=progress_printer(args, "{} / {} lignes exportées"),
+                                   cancelled=cancelled.is_set)
+    finally:
+        signal.signal(signal.SIGINT, previous_handler)
+        db.close()
+    end_progress(args)
+    if manifest is None:
+        emit(args, {'cancelled': True}, "Export annulé")
+        return 130
+    manifest['manifest'] = manifest_file
+    emit(args, manifest, "\n".join(
+        [f"{entry['file']}: {entry['rows']} lignes" for entry in manifest['files']]
+        + [f"Manifeste: {manifest_file}"]
+    ))
+    return 0
+
+
+def cmd_backup(args, config):
+    """Write the next backup of the chain (full or incremental, as in the application)"""
+    chain = BackupChain(args.directory or config['directory'],
+                        full_every=config['full_every'], keep_chains=config['retention'])
+    connection = connect(args, config)
+    try:
+        path = chain.run(connection, full=args.full,
+                         progress=progress_printer(args, "Sauvegarde: {} ({} lignes)"))
+    finally:
+        connection.close()
+    end_progress(args)
+    with open(manifest_path(path), encoding='utf-8') as f:
+        manifest = json.load(f)
+    manifest['path'] = path
+    emit(args, manifest, f"Sauvegarde {'complète' if manifest['full'] else 'incrémentale'} créée: {path}")
+    return 0
+
+
+def cmd_restore(args, config):
+    """Replay a backup chain into the database"""
+    chain = BackupChain(args.directory or config['directory'])
+    plan = chain.restore_plan(args.upto)
+    if not args.json:
+        print(f"Restauration de {len(plan)} fichier(s):")
+        for path in plan:
+            print(f"  {os.path.basename(path)}")
+
+    connection = connect(args, config)
+    try:
+        rows = chain.restore(connection, args.upto, batch_rows=args.batch_rows,
+                             progress=progress_printer(args, "{} lignes restaurées ({:.0f} lignes/s)"))
+    finally:
+        connection.close()
+    end_progress(args)
+    emit(args, {'files': [os.path.basename(path) for path in plan], 'rows': rows},
+         f"Restauration terminée: {rows} lignes")
+    return 0
+
+
+def cmd_verify(args, config):
+    """Check the backups against their manifests (old .sql dumps are not counted as damaged)"""
+    chain = BackupChain(args.directory or config['directory'])
+    results = chain.verify()
+    lines = []
+    for filename, problems in results.items():
+        if problems is None:
+            lines.append(f"{filename}: non vérifiable (pas de manifeste)")
+        else:
+            lines.append(f"{filename}: {'; '.join(problems) if problems else 'OK'}")
+    emit(args, results, "\n".join(lines))
+    return 1 if any(results.values()) else 0
+
+
+def cmd_import(args, config):
+    """Import a students or absences CSV file"""
+    connection = connect(args, config)
+    try:
+        report = import_csv(connection, args.file, batch_rows=args.batch_rows,
+                            progress=progress_printer(args, "{0.imported} ligne(s) importée(s)"))
+    finally:
+        connection.close()
+    end_progress(args)
+    emit(args, {
+        'table': report.table,
+        'lines': report.lines,
+        'imported': report.imported,
+        'errors': [{'line': line, 'message': message} for line, message in report.errors]
+    }, report.summary())
+    return 1 if report.errors else 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Gestion des absences BTS en ligne de commande")
+    parser.add_argument("--config", default="app_config.ini", help="fichier de configuration")
+    parser.add_argument("--host", help="serveur MySQL (défaut: app_config.ini)")
+    parser.add_argument("--user", help="utilisateur MySQL (défaut: app_config.ini)")
+    parser.add_argument("--database", help="base de données (défaut: app_config.ini)")
+    parser.add_argument("--password", help="mot de passe (défaut: $ABSENCES_DB_PASSWORD)")
+    parser.add_argument("--json", action="store_true", help="résultat en JSON sur la sortie standard")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    stats = commands.add_parser("stats", help="statistiques des absences d'une période")
+    stats.add_argument("--from", dest="date_from", type=parse_date, help="début (défaut: 30 jours avant --to)")
+    stats.add_argument("--to", dest="date_to", type=parse_date, help="fin (défaut: aujourd'hui)")
+    stats.add_argument("--classe", help="une seule classe")
+    stats.add_argument("--top", type=int, default=5, help="étudiants les plus absents à lister")
+    stats.add_argument("--csv", help="écrire aussi les statistiques dans ce fichier CSV")
+    stats.set_defaults(handler=cmd_stats)
+
+    export = commands.add_parser("export", help="exporter les étudiants et les absences")
+    export.add_argument("--directory", default=".", help="dossier de destination")
+    export.add_argument("--format", choices=sorted(EXPORT_WRITERS), default="csv", help="format des fichiers")
+    export.add_argument("--classe", help="absences d'une seule classe")
+    export.add_argument("--statut", help="absences d'un seul statut")
+    export.add_argument("--from", dest="date_from", type=parse_date, help="absences à partir de cette date")
+    export.add_argument("--to", dest="date_to", type=parse_date, help="absences jusqu'à cette date")
+    export.set_defaults(handler=cmd_export)
+
+    backup = commands.add_parser("backup", help="sauvegarder la base")
+    backup.add_argument("--directory", help="dossier des sauvegardes")
+    backup.add_argument("--full", action="store_true", help="sauvegarde complète même si une incrémentale suffit")
+    backup.set_defaults(handler=cmd_backup)
+
+    restore = commands.add_parser("restore", help="restaurer une sauvegarde")
+    restore.add_argument("--directory", help="dossier des sauvegardes")
+    restore.add_argument("--upto", help="dernier fichier à rejouer (défaut: le plus récent)")
+    restore.add_argument("--batch-rows", type=int, default=20000, help="lignes par transaction")
+    restore.set_defaults(handler=cmd_restore)
+
+    verify = commands.add_parser("verify", help="vérifier les sauvegardes")
+    verify.add_argument("--directory", help="dossier des sauvegardes")
+    verify.set_defaults(handler=cmd_verify)
+
+    import_parser = commands.add_parser("import", help="importer un fichier CSV d'étudiants ou d'absences")
+    import_parser.add_argument("file", help="fichier CSV (format des exports)")
+    import_parser.add_argument("--batch-rows", type=int, default=500, help="lignes par transaction")
+    import_parser.set_defaults(handler=cmd_import)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    config = read_config(args.config)
+    try:
+        return args.handler(args, config)
+    except (mysql.connector.Error, BackupIntegrityError, ImportFormatError, SnapshotError, OSError) as e:
+        if args.json:
+            print(json.dumps({'error': str(e)}, ensure_ascii=False))
+        print(f"\nErreur: {e}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
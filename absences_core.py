@@ -0,0 +1,2591 @@
+# ------- Couche d'accès aux données (sans PyQt5) -------
+# Partagée par l'interface graphique et les traitements en arrière-plan
+# (sauvegardes, exports), elle ne doit importer aucun module Qt.
+
+# ------- Connexion à la base de données MySQL -------
+import mysql.connector                       # Connexion à MySQL
+from mysql.connector import errors           # Erreurs de connexion (perte du serveur, timeout)
+from mysql.connector import pooling          # Pools de connexions
+
+# ------- Fichiers (sauvegardes, configuration) -------
+import configparser                          # État de la chaîne de sauvegardes (backup_state.ini)
+import csv                                   # Import des étudiants et absences
+import gzip                                  # Compression des sauvegardes (.sql.gz)
+import hashlib                               # Sommes de contrôle SHA-256 des sauvegardes
+import io                                    # Pièces jointes CSV des bilans
+import json                                  # Manifestes des sauvegardes
+import os                                    # Dossiers et fichiers de sauvegarde
+import queue                                 # Lecture des sauvegardes en parallèle de la restauration
+import zlib                                  # Erreurs de décompression (archive corrompue)
+
+# ------- Envoi des emails -------
+import email.utils                           # Date et identifiant des messages
+import smtplib                               # Session SMTP partagée par un lot de messages
+import uuid                                  # Noms des messages en attente
+from email.message import EmailMessage       # Messages de la file d'envoi
+from html import escape                      # Bilans au format HTML
+
+# ------- Outils -------
+import bisect                                # Index triés de l'annuaire des étudiants
+import heapq                                 # Classement des étudiants les plus absents
+import importlib.util                        # Présence de pyarrow (export Parquet facultatif)
+import itertools                             # Numérotation des pools créés
+import re                                    # Tables lues par une requête (cache)
+import sys                                   # Taille estimée des résultats en cache
+import threading                             # Attente d'une connexion libre dans un pool
+import time                                  # Débit de la restauration
+import unicodedata                           # En-têtes CSV sans accents (Prénom/Prenom)
+from collections import OrderedDict          # Cache des requêtes (ordre LRU)
+from concurrent.futures import ThreadPoolExecutor  # Export des tables en parallèle
+from contextlib import contextmanager, ExitStack  # Emprunt/restitution des connexions avec "with"
+from datetime import date, datetime, timedelta  # Dates des requêtes et des sauvegardes
+from decimal import Decimal                  # Valeurs numériques renvoyées par MySQL
+from dataclasses import dataclass, field     # Résultats structurés (statistiques)
+from typing import List, Optional
+
+pyarrow = None  # Importé au premier export Parquet: un import long, inutile au démarrage
+
+
+class DatabasePool:
+    """Pools de connexions MySQL avec contrôle de santé et reconnexion automatique.
+
+    Deux pools séparés: "interactive" pour les lectures et écritures de
+    l'interface, "background" pour les sauvegardes et exports, afin qu'un
+    long export ne bloque jamais les requêtes interactives. Chaque emprunt
+    passe par le ping du pool, qui reconnecte une connexion coupée (timeout
+    d'inactivité, coupure réseau).
+    """
+
+    # Erreurs qui signalent une connexion perdue plutôt qu'une requête invalide
+    RETRYABLE_ERRORS = (errors.OperationalError, errors.InterfaceError)
+    _counter = itertools.count(1)
+
+    def __init__(self, host, user, password, database, interactive_size=4, background_size=2):
+        self.params = {
+            'host': host,
+            'user': user,
+            'password': password,
+            'database': database
+        }
+        number = next(self._counter)
+        self._pools = {}
+        for role, size in (("interactive", interactive_size), ("background", background_size)):
+            pool = pooling.MySQLConnectionPool(
+                pool_name=f"absences_{role}_{number}",
+                pool_size=size,
+                **self.params
+            )
+            # get_connection() échoue quand le pool est vide: on attend une place libre
+            self._pools[role] = (pool, threading.BoundedSemaphore(size))
+
+    @contextmanager
+    def connection(self, role="interactive"):
+        """Borrow a healthy connection from the pool, returned on exit"""
+        pool, slots = self._pools[role]
+        with slots:
+            connection = pool.get_connection()  # ping + reconnexion si nécessaire
+            try:
+                yield connection
+            finally:
+                connection.close()  # Rend la connexion au pool
+
+    @contextmanager
+    def transaction(self, role="interactive"):
+        """Yield a cursor in a transaction, committed on success, rolled back on error"""
+        with self.connection(role) as connection:
+            cursor = connection.cursor(dictionary=True)
+            try:
+                yield cursor
+                connection.commit()
+            except BaseException:
+                if connection.is_connected():
+                    connection.rollback()
+                raise
+            finally:
+                cursor.close()
+
+    def run(self, job, role="interactive", retry=True):
+        """Run job(connection) on a pooled connection.
+
+        Idempotent jobs (reads, exports that rewrite their file) are retried
+        once on a fresh connection when the server connection was lost.
+        """
+        try:
+            with self.connection(role) as connection:
+                return job(connection)
+        except self.RETRYABLE_ERRORS:
+            if not retry:
+                raise
+        with self.connection(role) as connection:
+            return job(connection)
+
+    def close(self):
+        """Close every idle connection of both pools"""
+        for pool, _ in self._pools.values():
+            # Pas d'API publique pour vider un pool dans mysql-connector
+            pool._remove_connections()
+
+
+# ------- Schéma de la base et migrations -------
+
+class MigrationError(Exception):
+    """Raised when the schema cannot be migrated"""
+
+
+class QueryPlanError(Exception):
+    """Raised when a hot query falls back to a full table scan"""
+
+
+class BackupIntegrityError(Exception):
+    """Raised when a backup does not match its manifest"""
+
+
+def _add_column(cursor, table, name, definition):
+    """Add a column unless it already exists"""
+    cursor.execute(
+        "SELECT COUNT(*) AS n FROM information_schema.columns "
+        "WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s",
+        (table, name)
+    )
+    if not cursor.fetchone()['n']:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+
+
+def _create_index(cursor, table, name, columns):
+    """Create an index unless it already exists (MySQL has no CREATE INDEX IF NOT EXISTS)"""
+    cursor.execute(
+        "SELECT COUNT(*) AS n FROM information_schema.statistics "
+        "WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s",
+        (table, name)
+    )
+    if not cursor.fetchone()['n']:
+        cursor.execute(f"CREATE INDEX {name} ON {table} ({columns})")
+
+
+# Migrations ordonnées: (version, description, étapes). Une étape est une
+# requête SQL ou une fonction recevant le curseur. Ne jamais modifier une
+# migration déjà publiée: en ajouter une nouvelle.
+MIGRATIONS = [
+    (1, "Tables etudiants et absences", [
+        """
+        CREATE TABLE IF NOT EXISTS etudiants (
+            code_massar VARCHAR(50) PRIMARY KEY,
+            cin VARCHAR(50),
+            nom VARCHAR(100) NOT NULL,
+            prenom VARCHAR(100) NOT NULL,
+            classe VARCHAR(20) NOT NULL,
+            date_ajout TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS absences (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            code_massar VARCHAR(50) NOT NULL,
+            date_absence DATE NOT NULL,
+            raison VARCHAR(100) NOT NULL,
+            statut VARCHAR(20) NOT NULL,
+            notes TEXT,
+            date_ajout TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (code_massar) REFERENCES etudiants(code_massar)
+            ON DELETE CASCADE
+        )
+        """,
+    ]),
+    (2, "Index des filtres par date, statut et étudiant", [
+        # Grille et statistiques: plage de dates, tri par date puis id (clé primaire implicite)
+        lambda cursor: _create_index(cursor, "absences", "idx_absences_date", "date_absence"),
+        # Filtre par statut sur une plage de dates
+        lambda cursor: _create_index(cursor, "absences", "idx_absences_statut_date", "statut, date_absence"),
+        # Jointure depuis les étudiants d'une classe (remplace l'index de la clé étrangère)
+        lambda cursor: _create_index(cursor, "absences", "idx_absences_massar_date", "code_massar, date_absence"),
+    ]),
+    (3, "Index des étudiants par classe et par nom", [
+        lambda cursor: _create_index(cursor, "etudiants", "idx_etudiants_classe_nom", "classe, nom, prenom"),
+        lambda cursor: _create_index(cursor, "etudiants", "idx_etudiants_nom", "nom, prenom"),
+    ]),
+    (4, "Cumul journalier des absences par classe et statut", [
+        """
+        CREATE TABLE IF NOT EXISTS absences_daily_rollup (
+            date_absence DATE NOT NULL,
+            classe VARCHAR(20) NOT NULL,
+            statut VARCHAR(20) NOT NULL,
+            absences_count INT NOT NULL,
+            students_count INT NOT NULL,
+            PRIMARY KEY (date_absence, classe, statut)
+        )
+        """,
+        # Classement par étudiant sur une période: parcours de l'index seul
+        lambda cursor: _create_index(cursor, "absences", "idx_absences_date_massar_statut",
+                                     "date_absence, code_massar, statut"),
+        lambda cursor: rebuild_rollup(cursor),
+    ]),
+    (5, "Suivi des modifications et suppressions (sauvegardes incrémentales)", [
+        lambda cursor: _add_column(cursor, "etudiants", "date_modif",
+                                   "TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP"),
+        lambda cursor: _add_column(cursor, "absences", "date_modif",
+                                   "TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP"),
+        lambda cursor: _create_index(cursor, "etudiants", "idx_etudiants_modif", "date_modif"),
+        lambda cursor: _create_index(cursor, "absences", "idx_absences_modif", "date_modif"),
+        """
+        CREATE TABLE IF NOT EXISTS journal_suppressions (
+            id BIGINT AUTO_INCREMENT PRIMARY KEY,
+            table_name VARCHAR(30) NOT NULL,
+            cle VARCHAR(50) NOT NULL,
+            date_suppression TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            INDEX idx_journal_date (date_suppression)
+        )
+        """,
+    ]),
+    (6, "Email des étudiants et envois des bilans", [
+        lambda cursor: _add_column(cursor, "etudiants", "email", "VARCHAR(255) NULL AFTER classe"),
+        # Une période n'est envoyée qu'une fois, même avec plusieurs postes ouverts
+        """
+        CREATE TABLE IF NOT EXISTS envois_bilans (
+            date_debut DATE NOT NULL,
+            date_fin DATE NOT NULL,
+            date_envoi TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (date_debut, date_fin)
+        )
+        """,
+    ]),
+]
+
+
+def migrate(connection):
+    """Apply the pending MIGRATIONS in order and return the versions applied.
+
+    Each applied version is recorded in schema_version; a named lock keeps
+    two clients connecting at the same time from migrating concurrently.
+    """
+    cursor = connection.cursor(dictionary=True)
+    applied = []
+    try:
+        cursor.execute("SELECT GET_LOCK('gestion_absences_migrations', 30) AS locked")
+        if not cursor.fetchone()['locked']:
+            raise MigrationError("Une autre migration du schéma est en cours")
+        try:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INT PRIMARY KEY,
+                    description VARCHAR(200) NOT NULL,
+                    date_application TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            cursor.execute("SELECT COALESCE(MAX(version), 0) AS version FROM schema_version")
+            current = cursor.fetchone()['version']
+            for version, description, steps in MIGRATIONS:
+                if version <= current:
+                    continue
+                for step in steps:
+                    if callable(step):
+                        step(cursor)
+                    else:
+                        cursor.execute(step)
+                cursor.execute(
+                    "INSERT INTO schema_version (version, description) VALUES (%s, %s)",
+                    (version, description)
+                )
+                connection.commit()
+                applied.append(version)
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK('gestion_absences_migrations') AS released")
+            cursor.fetchone()
+            # Termine la transaction implicite des lectures: l'appelant peut ouvrir un instantané
+            connection.commit()
+    finally:
+        cursor.close()
+    return applied
+
+
+# Requêtes les plus fréquentes (grille, comptage, statistiques, exports) avec
+# des paramètres représentatifs, vérifiées par check_query_plans.
+HOT_QUERIES = {
+    "absences par période": (
+        "SELECT a.id FROM absences a JOIN etudiants e ON a.code_massar = e.code_massar "
+        "WHERE a.date_absence BETWEEN %s AND %s ORDER BY a.date_absence DESC, a.id DESC LIMIT 200",
+        ("{date_from}", "{date_to}")
+    ),
+    "absences par classe et période": (
+        "SELECT a.id FROM absences a JOIN etudiants e ON a.code_massar = e.code_massar "
+        "WHERE e.classe = %s AND a.date_absence BETWEEN %s AND %s ORDER BY a.date_absence DESC",
+        ("BTS1", "{date_from}", "{date_to}")
+    ),
+    "absences par statut et période": (
+        "SELECT a.id FROM absences a JOIN etudiants e ON a.code_massar = e.code_massar "
+        "WHERE a.statut = %s AND a.date_absence BETWEEN %s AND %s ORDER BY a.date_absence DESC",
+        ("Justifie", "{date_from}", "{date_to}")
+    ),
+    "statistiques par étudiant": (
+        "SELECT code_massar, COUNT(*) FROM absences "
+        "WHERE date_absence BETWEEN %s AND %s GROUP BY code_massar",
+        ("{date_from}", "{date_to}")
+    ),
+    "étudiants d'une classe": (
+        "SELECT code_massar FROM etudiants WHERE classe = %s ORDER BY nom, prenom",
+        ("BTS1",)
+    ),
+}
+
+
+def check_query_plans(connection, min_rows=1000):
+    """EXPLAIN every HOT_QUERIES entry and raise QueryPlanError on full table scans.
+
+    Scans estimated under min_rows rows are tolerated: on small tables the
+    optimizer rightly prefers reading the whole table.
+    """
+    today = date.today()
+    values = {
+        'date_from': (today - timedelta(days=30)).isoformat(),
+        'date_to': today.isoformat()
+    }
+    cursor = connection.cursor(dictionary=True)
+    problems = []
+    try:
+        for name, (query, params) in HOT_QUERIES.items():
+            cursor.execute("EXPLAIN " + query, [p.format(**values) for p in params])
+            for step in cursor.fetchall():
+                if step['type'] == 'ALL' and (step['rows'] or 0) >= min_rows:
+                    problems.append(f"{name}: parcours complet de {step['table']} (~{step['rows']} lignes)")
+    finally:
+        cursor.close()
+    if problems:
+        raise QueryPlanError("\n".join(problems))
+
+
+# ------- Statistiques des absences -------
+
+# L'interface enregistre les statuts sans accent; les anciennes saisies peuvent en avoir
+JUSTIFIED_STATUSES = ("Justifie", "Justifié")
+UNJUSTIFIED_STATUSES = ("Non justifie", "Non justifié")
+
+
+@dataclass
+class ClassStats:
+    """Absence totals of one class over a period"""
+    classe: str
+    total_students: int = 0
+    total_absences: int = 0
+    justified: int = 0
+    unjustified: int = 0
+    students_affected: int = 0
+
+    @property
+    def absence_rate(self):
+        """Average number of absences per student of the class"""
+        return self.total_absences / self.total_students if self.total_students else 0.0
+
+    def format_report(self):
+        """Lines of the class in the report (the class must have absences)"""
+        report = f"Classe: {self.classe}\n"
+        report += f"- Total des absences: {self.total_absences}\n"
+        report += f"  - Justifiées: {self.justified} ({self.justified/self.total_absences:.1%})\n"
+        report += f"  - Non justifiées: {self.unjustified} ({self.unjustified/self.total_absences:.1%})\n"
+        report += f"- Étudiants concernés: {self.students_affected}/{self.total_students}\n"
+        report += f"- Taux d'absence moyen: {self.absence_rate:.1f} absences/étudiant\n"
+        return report
+
+
+@dataclass
+class StudentAbsences:
+    """Absence count of one student over a period"""
+    code_massar: str
+    nom: str
+    prenom: str
+    classe: str
+    absence_count: int
+    justified: int
+
+
+@dataclass
+class AbsenceStatistics:
+    """Result of compute_statistics, shared by the report, the CSV export and the email"""
+    date_from: str
+    date_to: str
+    classe: Optional[str]
+    classes: List[ClassStats] = field(default_factory=list)
+    top_students: List[StudentAbsences] = field(default_factory=list)
+
+    @property
+    def total_absences(self):
+        return sum(stat.total_absences for stat in self.classes)
+
+    def format_report(self):
+        """Plain-text report shown in the statistics tab and sent by email"""
+        report = f"Rapport des absences du {self.date_from} au {self.date_to}\n\n"
+        report += "="*50 + "\n\n"
+        
+        stats = [stat for stat in self.classes if stat.total_absences]
+        if not stats:
+            report += "Aucune absence enregistrée pour cette période.\n"
+        else:
+            for stat in stats:
+                report += stat.format_report() + "\n"
+        
+        if self.top_students:
+            report += f"Top {len(self.top_students)} des étudiants les plus absents:\n"
+            for i, student in enumerate(self.top_students, 1):
+                report += f"{i}. {student.nom} {student.prenom} ({student.classe}): {student.absence_count} absences\n"
+        return report
+
+    def csv_rows(self):
+        """Rows (header included) for the statistics CSV export"""
+        rows = [['Classe', 'Étudiants', 'Absences', 'Justifiées', 'Non justifiées',
+                 'Étudiants concernés', 'Absences/étudiant']]
+        for stat in self.classes:
+            rows.append([stat.classe, stat.total_students, stat.total_absences, stat.justified,
+                         stat.unjustified, stat.students_affected, f"{stat.absence_rate:.2f}"])
+        rows.append([])
+        rows.append(['Rang', 'Code Massar', 'Nom', 'Prénom', 'Classe', 'Absences', 'Justifiées'])
+        for i, student in enumerate(self.top_students, 1):
+            rows.append([i, student.code_massar, student.nom, student.prenom, student.classe,
+                         student.absence_count, student.justified])
+        return rows
+
+
+def compute_statistics(connection, spec, top_n=5):
+    """Compute the per-class statistics and the top-N ranking of spec (an AbsenceFilter).
+
+    Class sizes and absence totals come from absences_daily_rollup, so they
+    cost O(days) whatever the number of absences. Affected students and the
+    ranking cannot be summed from daily rows: one grouped query reads them
+    from the (date_absence, code_massar, statut) index, joined to etudiants
+    for the affected students only. The status of spec is ignored: the
+    report always splits justified and unjustified absences.
+    """
+    date_from, date_to, classe = spec.date_from, spec.date_to, spec.classe
+    period, period_params = AbsenceFilter(date_from=date_from, date_to=date_to).where()
+    justified = ', '.join(['%s'] * len(JUSTIFIED_STATUSES))
+    unjustified = ', '.join(['%s'] * len(UNJUSTIFIED_STATUSES))
+    class_query = f"""
+        SELECT s.classe, s.total_students,
+               COALESCE(r.total_absences, 0) AS total_absences,
+               COALESCE(r.justified, 0) AS justified,
+               COALESCE(r.unjustified, 0) AS unjustified
+        FROM (SELECT classe, COUNT(*) AS total_students FROM etudiants GROUP BY classe) s
+        LEFT JOIN (
+            SELECT classe,
+                   SUM(absences_count) AS total_absences,
+                   SUM(CASE WHEN statut IN ({justified}) THEN absences_count ELSE 0 END) AS justified,
+                   SUM(CASE WHEN statut IN ({unjustified}) THEN absences_count ELSE 0 END) AS unjustified
+            FROM absences_daily_rollup a
+            WHERE 1=1{period}
+            GROUP BY classe
+        ) r ON r.classe = s.classe
+    """
+    class_params = [*JUSTIFIED_STATUSES, *UNJUSTIFIED_STATUSES, *period_params]
+    student_query = f"""
+        WITH per_student AS (
+            SELECT code_massar,
+                   COUNT(*) AS absence_count,
+                   SUM(statut IN ({justified})) AS justified
+            FROM absences a
+            WHERE 1=1{period}
+            GROUP BY code_massar
+        )
+        SELECT e.code_massar, e.nom, e.prenom, e.classe, p.absence_count, p.justified
+        FROM per_student p
+        JOIN etudiants e ON e.code_massar = p.code_massar
+    """
+    student_params = [*JUSTIFIED_STATUSES, *period_params]
+    if classe:
+        class_query += " WHERE s.classe = %s"
+        class_params.append(classe)
+        student_query += " WHERE e.classe = %s"
+        student_params.append(classe)
+
+    classes = {}
+    absent_students = []
+    cursor = connection.cursor(dictionary=True)
+    try:
+        cursor.execute(class_query, class_params)
+        for row in cursor:
+            classes[row['classe']] = ClassStats(
+                row['classe'], int(row['total_students']), int(row['total_absences']),
+                int(row['justified']), int(row['unjustified'])
+            )
+        cursor.execute(student_query, student_params)
+        for row in cursor:
+            stat = classes.get(row['classe'])
+            if stat is not None:
+                stat.students_affected += 1
+            absent_students.append(StudentAbsences(
+                row['code_massar'], row['nom'], row['prenom'], row['classe'],
+                int(row['absence_count']), int(row['justified'])
+            ))
+    finally:
+        cursor.close()
+
+    top_students = heapq.nsmallest(
+        top_n, absent_students, key=lambda s: (-s.absence_count, s.nom, s.prenom)
+    )
+    return AbsenceStatistics(
+        date_from, date_to, classe,
+        [classes[name] for name in sorted(classes)],
+        top_students
+    )
+
+
+# ------- Cumul journalier des absences -------
+# absences_daily_rollup garde, par (date, classe, statut), le nombre
+# d'absences et d'étudiants distincts. Il est tenu à jour dans la même
+# transaction que chaque écriture sur les absences, en recalculant seulement
+# les clés touchées.
+
+def rollup_keys(cursor, where, params):
+    """Return the (date_absence, classe, statut) keys of the absences matching `where`"""
+    cursor.execute(
+        "SELECT DISTINCT a.date_absence, e.classe, a.statut FROM absences a "
+        "JOIN etudiants e ON a.code_massar = e.code_massar WHERE " + where,
+        params
+    )
+    return {(row['date_absence'], row['classe'], row['statut']) for row in cursor.fetchall()}
+
+
+def refresh_rollup(cursor, keys):
+    """Recompute the rollup rows of the given keys from the absences table"""
+    for date_absence, classe, statut in keys:
+        cursor.execute(
+            "DELETE FROM absences_daily_rollup WHERE date_absence = %s AND classe = %s AND statut = %s",
+            (date_absence, classe, statut)
+        )
+        cursor.execute("""
+            INSERT INTO absences_daily_rollup
+                (date_absence, classe, statut, absences_count, students_count)
+            SELECT a.date_absence, e.classe, a.statut, COUNT(*), COUNT(DISTINCT a.code_massar)
+            FROM absences a
+            JOIN etudiants e ON a.code_massar = e.code_massar
+            WHERE a.date_absence = %s AND e.classe = %s AND a.statut = %s
+            GROUP BY a.date_absence, e.classe, a.statut
+        """, (date_absence, classe, statut))
+
+
+def rebuild_rollup(cursor):
+    """Regenerate the whole rollup table from the absences table"""
+    cursor.execute("DELETE FROM absences_daily_rollup")
+    cursor.execute("""
+        INSERT INTO absences_daily_rollup
+            (date_absence, classe, statut, absences_count, students_count)
+        SELECT a.date_absence, e.classe, a.statut, COUNT(*), COUNT(DISTINCT a.code_massar)
+        FROM absences a
+        JOIN etudiants e ON a.code_massar = e.code_massar
+        GROUP BY a.date_absence, e.classe, a.statut
+    """)
+
+
+# ------- Pagination par clé -------
+
+def seek_condition(columns, key, operator):
+    """SQL condition selecting the rows after (">") or before ("<") `key` in the order of `columns`.
+
+    (a, b, c) > (x, y, z) is written a > x OR (a = x AND (b > y OR (b = y
+    AND c > z))), which MySQL turns into a range scan of the matching index.
+    Returns the condition and its parameters.
+    """
+    condition, params = f"{columns[-1]} {operator} %s", [key[-1]]
+    for column, value in zip(reversed(columns[:-1]), reversed(key[:-1])):
+        condition = f"{column} {operator} %s OR ({column} = %s AND ({condition}))"
+        params = [value, value] + params
+    return f"({condition})", params
+
+
+# ------- Filtre des absences et requêtes préparables -------
+
+@dataclass(frozen=True)
+class AbsenceFilter:
+    """Filter shared by the absences grid, the exports and the statistics.
+
+    None means "no restriction". The SQL built from a filter only depends
+    on which fields are set, never on their values, so the few possible
+    statements can be prepared once and reused with new parameters.
+    """
+    classe: Optional[str] = None
+    statut: Optional[str] = None
+    date_from: Optional[str] = None
+    date_to: Optional[str] = None
+
+    def statuses(self):
+        """Stored spellings of the status filter ("Justifié" also finds "Justifie")"""
+        folded = StudentDirectory.fold(self.statut)
+        for statuses in (JUSTIFIED_STATUSES, UNJUSTIFIED_STATUSES):
+            if folded == StudentDirectory.fold(statuses[0]):
+                return statuses
+        return (self.statut,)
+
+    def where(self):
+        """Conditions (each starting with AND) on absences a JOIN etudiants e, and their parameters"""
+        conditions, params = "", []
+        if self.classe:
+            conditions += " AND e.classe = %s"
+            params.append(self.classe)
+        if self.statut:
+            statuses = self.statuses()
+            conditions += f" AND a.statut IN ({', '.join(['%s'] * len(statuses))})"
+            params.extend(statuses)
+        if self.date_from:
+            conditions += " AND a.date_absence >= %s"
+            params.append(self.date_from)
+        if self.date_to:
+            conditions += " AND a.date_absence <= %s"
+            params.append(self.date_to)
+        return conditions, params
+
+    def matches(self, classe, statut, date_absence):
+        """Whether an absence passes the filter, with the same rules as where()"""
+        date_absence = str(date_absence)
+        return ((not self.classe or classe == self.classe)
+                and (not self.statut or StudentDirectory.fold(statut) in
+                     {StudentDirectory.fold(status) for status in self.statuses()})
+                and (not self.date_from or self.date_from <= date_absence)
+                and (not self.date_to or date_absence <= self.date_to))
+
+    def contains(self, other):
+        """Whether every absence passing other also passes this filter"""
+        return ((not self.classe or self.classe == other.classe)
+                and (not self.statut or (other.statut and self.statuses() == other.statuses()))
+                and (not self.date_from or (other.date_from or "") >= self.date_from)
+                and (not self.date_to or (other.date_to is not None and other.date_to <= self.date_to)))
+
+
+# Une seule liste de colonnes pour la grille et les exports: moins de requêtes différentes
+ABSENCE_COLUMNS = ("a.id, e.code_massar, e.nom, e.prenom, CONCAT(e.nom, ' ', e.prenom) AS nom_complet, "
+                   "e.classe, a.date_absence, a.raison, a.statut, a.notes")
+
+
+def absences_query(spec, order="DESC", after=None, limit=None):
+    """SELECT of the absences passing spec, sorted on (date_absence, id).
+
+    With `after`, only the rows following that (date_absence, id) key in
+    `order` are read (keyset pagination). Returns the query and its
+    parameters.
+    """
+    conditions, params = spec.where()
+    if after is not None:
+        seek, seek_params = seek_condition(["a.date_absence", "a.id"], after, "<" if order == "DESC" else ">")
+        conditions += " AND " + seek
+        params.extend(seek_params)
+    query = (f"SELECT {ABSENCE_COLUMNS} FROM absences a "
+             f"JOIN etudiants e ON a.code_massar = e.code_massar WHERE 1=1{conditions} "
+             f"ORDER BY a.date_absence {order}, a.id {order}")
+    if limit is not None:
+        query += " LIMIT %s"
+        params.append(limit)
+    return query, params
+
+
+def absences_count_query(spec):
+    """COUNT(*) AS total of the absences passing spec, and its parameters"""
+    conditions, params = spec.where()
+    return ("SELECT COUNT(*) AS total FROM absences a "
+            f"JOIN etudiants e ON a.code_massar = e.code_massar WHERE 1=1{conditions}"), params
+
+
+# ------- Annuaire des étudiants en mémoire -------
+
+class StudentDirectory:
+    """Annuaire des étudiants gardé en mémoire.
+
+    Un dict par code Massar et des index triés par nom (global et par
+    classe) servent la liste des étudiants, le formulaire et l'appel sans
+    requête; un index de préfixes (code Massar, CIN, nom, prénom) sert la
+    recherche au fil de la saisie. L'empreinte (nombre de lignes et
+    dernière modification) permet de vérifier en une requête légère que
+    l'annuaire est toujours à jour.
+    """
+
+    def __init__(self, students=(), fingerprint=None):
+        self.students = {}
+        self._by_name = []   # Clés de tri (sort_key), dans l'ordre d'affichage
+        self._by_class = {}  # classe -> clés de tri
+        self._terms = []     # (terme sans accents en minuscules, code Massar), trié
+        self._terms_of = {}  # code Massar -> termes de l'étudiant
+        self.fingerprint = fingerprint
+        self.version = None  # data_version() lue avec l'annuaire (load)
+        # Construction en bloc: un tri par index plutôt qu'une insertion par étudiant
+        for student in students:
+            student = dict(student)
+            key = self.sort_key(student)
+            self.students[student['code_massar']] = student
+            self._by_name.append(key)
+            self._by_class.setdefault(student['classe'], []).append(key)
+            self._terms_of[student['code_massar']] = terms = self._student_terms(student)
+            self._terms.extend((term, student['code_massar']) for term in terms)
+        for keys in [self._by_name, self._terms] + list(self._by_class.values()):
+            keys.sort()
+
+    @staticmethod
+    def sort_key(student):
+        return (student['nom'].lower(), student['prenom'].lower(), student['code_massar'])
+
+    @staticmethod
+    def read_fingerprint(cursor):
+        """(row count, last date_modif) of etudiants, read through a dict cursor"""
+        cursor.execute("SELECT COUNT(*) AS total, MAX(date_modif) AS modif FROM etudiants")
+        row = cursor.fetchone()
+        return (row['total'], row['modif'])
+
+    @classmethod
+    def load(cls, connection):
+        """Read every student (in one snapshot with the fingerprint and data_version(), kept in .version)"""
+        cursor = connection.cursor(dictionary=True)
+        try:
+            connection.start_transaction(consistent_snapshot=True, readonly=True)
+            fingerprint = cls.read_fingerprint(cursor)
+            version = data_version(cursor)
+            cursor.execute("SELECT code_massar, cin, nom, prenom, classe, email FROM etudiants")
+            directory = cls(cursor.fetchall(), fingerprint)
+            directory.version = version
+            connection.commit()
+            return directory
+        finally:
+            cursor.close()
+
+    def __len__(self):
+        return len(self.students)
+
+    def get(self, code_massar):
+        return self.students.get(code_massar)
+
+    def put(self, student, old_code=None):
+        """Add or replace (old_code: previous code Massar) a student"""
+        self.remove(old_code or student['code_massar'])
+        student = dict(student)
+        key = self.sort_key(student)
+        self.students[student['code_massar']] = student
+        bisect.insort(self._by_name, key)
+        bisect.insort(self._by_class.setdefault(student['classe'], []), key)
+        terms = self._student_terms(student)
+        self._terms_of[student['code_massar']] = terms
+        for term in terms:
+            bisect.insort(self._terms, (term, student['code_massar']))
+
+    def remove(self, code_massar):
+        student = self.students.pop(code_massar, None)
+        if student is None:
+            return
+        key = self.sort_key(student)
+        for keys in (self._by_name, self._by_class[student['classe']]):
+            del keys[bisect.bisect_left(keys, key)]
+        for term in self._terms_of.pop(code_massar):
+            del self._terms[bisect.bisect_left(self._terms, (term, code_massar))]
+
+    @staticmethod
+    def fold(text):
+        """Lower case text without accents, as indexed for search"""
+        text = unicodedata.normalize("NFKD", text or "").encode("ascii", "ignore").decode()
+        return text.lower()
+
+    def _student_terms(self, student):
+        words = [student['code_massar'], student['cin']] + student['nom'].split() + student['prenom'].split()
+        return tuple(sorted({self.fold(word) for word in words if word}))
+
+    def search(self, text, limit=20):
+        """Students with a term (code Massar, CIN, word of the name) starting with each word of text.
+
+        The most selective word is looked up in the sorted prefix index and
+        its candidates are checked against the other words, stopping at
+        `limit` results: the cost depends on the results, not on the
+        number of students.
+        """
+        words = self.fold(text).split()
+        if not words:
+            return []
+        ranges = [(bisect.bisect_left(self._terms, (word,)),
+                   bisect.bisect_left(self._terms, (word + "\uffff",)), word) for word in words]
+        start, end, guide = min(ranges, key=lambda found: found[1] - found[0])
+        others = [word for word in words if word != guide]
+        found = []
+        for index in range(start, end):
+            code = self._terms[index][1]
+            if code in found:
+                continue
+            terms = self._terms_of[code]
+            if all(any(term.startswith(word) for term in terms) for word in others):
+                found.append(code)
+                if len(found) >= limit:
+                    break
+        return [self.students[code] for code in found]
+
+    def position(self, code_massar):
+        """Rank of a student in the name order"""
+        return bisect.bisect_left(self._by_name, self.sort_key(self.students[code_massar]))
+
+    def by_name(self, classe=None):
+        """Students sorted by name, of one class or all"""
+        keys = self._by_name if classe is None else self._by_class.get(classe, [])
+        return [self.students[key[2]] for key in keys]
+
+    def page(self, after=None, before=None, limit=100):
+        """Up to `limit` students following the sort key `after` or preceding `before`"""
+        if before is not None:
+            end = bisect.bisect_left(self._by_name, tuple(before))
+            keys = self._by_name[max(0, end - limit):end]
+        else:
+            start = 0 if after is None else bisect.bisect_right(self._by_name, tuple(after))
+            keys = self._by_name[start:start + limit]
+        return [self.students[key[2]] for key in keys]
+
+
+# ------- Version des données -------
+
+def data_version(cursor):
+    """Fingerprint of the students and absences data, read through a dict cursor.
+
+    It changes with every insert or update (date_modif, new absence id) and
+    every journaled deletion, and costs four index lookups, so a client can
+    tell whether someone else changed the data since its last full load.
+    """
+    cursor.execute("""
+        SELECT (SELECT MAX(date_modif) FROM etudiants) AS etudiants_modif,
+               (SELECT MAX(date_modif) FROM absences) AS absences_modif,
+               (SELECT MAX(id) FROM absences) AS absences_id,
+               (SELECT MAX(id) FROM journal_suppressions) AS suppressions_id
+    """)
+    row = cursor.fetchone()
+    return (row['etudiants_modif'], row['absences_modif'], row['absences_id'], row['suppressions_id'])
+
+
+# ------- Cache des résultats de requêtes -------
+
+class QueryCache:
+    """Résultats de requêtes gardés en mémoire, invalidés par version de table.
+
+    Une entrée est indexée par la requête normalisée (espaces réduits) et
+    ses paramètres, et retient la version de chaque table lue au moment de
+    la requête; bump(table) après une écriture suffit à la rendre périmée.
+    Les écritures des autres postes sont repérées par data_version(), relue
+    au plus une fois par REVALIDATE_SECONDS. Les entrées les moins
+    récemment utilisées sont évincées au-delà de max_bytes (taille estimée)
+    et un résultat plus gros que max_bytes // 4 n'est jamais gardé.
+    Partagé entre les threads de requêtes: toutes les méthodes sont
+    protégées par un verrou.
+    """
+
+    REVALIDATE_SECONDS = 1.0
+    # Composantes de data_version() -> tables concernées
+    VERSION_TABLES = (("etudiants",), ("absences",), ("absences",), ("etudiants", "absences"))
+    TABLE_PATTERN = re.compile(r"\b(?:FROM|JOIN)\s+`?(\w+)", re.IGNORECASE)
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_bytes // 4
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # clé -> (versions des tables, résultat, taille)
+        self._versions = {}
+        self._epoch = 0  # Changé par bump() sans table: périme aussi les lectures en cours
+        self._bytes = 0
+        self._data_version = None
+        self._checked = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize(query):
+        return " ".join(query.split())
+
+    @classmethod
+    def tables_of(cls, query):
+        """Tables read by a SELECT (FROM and JOIN clauses)"""
+        return tuple(sorted({table.lower() for table in cls.TABLE_PATTERN.findall(query)}))
+
+    def bump(self, *tables):
+        """Invalidate the results that read these tables (all tables if none given)"""
+        with self._lock:
+            if not tables:
+                self._epoch += 1
+                self._entries.clear()
+                self._bytes = 0
+                return
+            for table in tables:
+                self._versions[table] = self._versions.get(table, 0) + 1
+
+    def clear(self):
+        """Forget everything (other database)"""
+        self.bump()
+        with self._lock:
+            self._data_version = None
+
+    def revalidate(self, connection):
+        """Bump the tables changed by other clients since the last check"""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._checked < self.REVALIDATE_SECONDS:
+                return
+        cursor = connection.cursor(dictionary=True)
+        try:
+            version = data_version(cursor)
+        finally:
+            cursor.close()
+        with self._lock:
+            previous, self._data_version, self._checked = self._data_version, version, now
+        if previous is None:
+            self.bump()
+            return
+        changed = set()
+        for old, new, tables in zip(previous, version, self.VERSION_TABLES):
+            if old != new:
+                changed.update(tables)
+        if changed:
+            self.bump(*changed)
+
+    def _key(self, query, params):
+        return (self.normalize(query), tuple(params))
+
+    def _current(self, tables):
+        return (self._epoch,) + tuple(self._versions.get(table, 0) for table in tables)
+
+    def _snapshot(self, tables):
+        with self._lock:
+            return self._current(tables)
+
+    def get(self, query, params=(), tables=None):
+        """(True, result) if a valid result is cached, else (False, None)"""
+        tables = self.tables_of(query) if tables is None else tables
+        key = self._key(query, params)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == self._current(tables):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, entry[1]
+            self.misses += 1
+            return False, None
+
+    def put(self, query, params, result, versions, size=None):
+        """Keep a result read when the tables were at `versions` (see _snapshot)"""
+        size = estimate_size(result) if size is None else size
+        if size > self.max_entry_bytes:
+            return
+        key = self._key(query, params)
+        with self._lock:
+            if versions[0] != self._epoch:
+                return
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._entries[key] = (versions, result, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, _, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+
+    def fetch(self, connection, query, params=(), compute=None, tables=None):
+        """Cached rows (dicts) of a SELECT, or of compute(connection) keyed by query.
+
+        Without compute, query is run on a dict cursor; with it, query is
+        only a cache key and tables must name the tables compute reads.
+        """
+        tables = self.tables_of(query) if tables is None else tuple(tables)
+        self.revalidate(connection)
+        hit, result = self.get(query, params, tables)
+        if hit:
+            return result
+        versions = self._snapshot(tables)  # Avant la lecture: une écriture concurrente la périme
+        if compute is not None:
+            result = compute(connection)
+        else:
+            cursor = connection.cursor(dictionary=True)
+            try:
+                cursor.execute(query, params)
+                result = cursor.fetchall()
+            finally:
+                cursor.close()
+        self.put(query, params, result, versions)
+        return result
+
+    def stream(self, connection, query, params=(), batch_rows=500):
+        """Yield the rows of a SELECT, from the cache or fetched in batches.
+
+        A result read from the server is kept while it stays under
+        max_entry_bytes, so a large export never holds more than that in
+        memory. Closing the generator early drains the unbuffered result so
+        that the connection can be reused.
+        """
+        tables = self.tables_of(query)
+        self.revalidate(connection)
+        hit, rows = self.get(query, params, tables)
+        if hit:
+            yield from rows
+            return
+        versions = self._snapshot(tables)
+        kept, size = [], 0
+        cursor = connection.cursor(dictionary=True)
+        try:
+            cursor.execute(query, params)
+            while True:
+                batch = cursor.fetchmany(batch_rows)
+                if not batch:
+                    break
+                if kept is not None:
+                    kept.extend(batch)
+                    size += sum(estimate_size(row) for row in batch)
+                    if size > self.max_entry_bytes:
+                        kept = None
+                try:
+                    yield from batch
+                except GeneratorExit:
+                    while cursor.fetchmany(batch_rows):
+                        pass
+                    raise
+        finally:
+            cursor.close()
+        if kept is not None:
+            self.put(query, params, kept, versions, size)
+
+
+def estimate_size(value, _seen=None):
+    """Approximate memory used by a query result (rows, dicts, dataclasses)"""
+    if _seen is None:
+        _seen = set()
+    if id(value) in _seen:
+        return 0
+    _seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(estimate_size(item, _seen) for item in value.values())
+    elif isinstance(value, (list, tuple, set)):
+        size += sum(estimate_size(item, _seen) for item in value)
+    elif hasattr(value, "__dict__"):
+        size += estimate_size(vars(value), _seen)
+    return size
+
+
+# ------- Sauvegardes SQL -------
+
+# Ordre d'écriture et de restauration: les étudiants avant leurs absences
+BACKUP_TABLES = ("etudiants", "absences")
+
+# Échappements MySQL des chaînes (mode SQL par défaut, sans NO_BACKSLASH_ESCAPES)
+_SQL_ESCAPES = str.maketrans({
+    "\\": "\\\\",
+    "'": "\\'",
+    "\0": "\\0",
+    "\n": "\\n",
+    "\r": "\\r",
+    "\x1a": "\\Z",
+})
+
+
+def sql_literal(value):
+    """Format a Python value returned by mysql-connector as a SQL literal"""
+    if value is None:
+        return "NULL"
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, (int, float, Decimal)):
+        return str(value)
+    if isinstance(value, datetime):
+        return f"'{value.isoformat(sep=' ')}'"
+    if isinstance(value, date):
+        return f"'{value.isoformat()}'"
+    if isinstance(value, timedelta):
+        seconds = int(value.total_seconds())
+        sign = "-" if seconds < 0 else ""
+        hours, rest = divmod(abs(seconds), 3600)
+        return f"'{sign}{hours:02d}:{rest // 60:02d}:{rest % 60:02d}'"
+    if isinstance(value, (bytes, bytearray)):
+        return f"X'{bytes(value).hex()}'"
+    return "'" + str(value).translate(_SQL_ESCAPES) + "'"
+
+
+def write_table_rows(cursor, out, table, batch_rows=500, max_statement_bytes=1024 * 1024, upsert=False,
+                     progress=None):
+    """Stream the rows of an executed cursor into bounded multi-row INSERT statements.
+
+    Each row is written on its own line so that a statement never exceeds
+    batch_rows rows nor about max_statement_bytes bytes (well under the
+    server's max_allowed_packet). With upsert, existing rows are updated
+    (ON DUPLICATE KEY UPDATE). progress(table, rows), if given, is called
+    after each fetched batch. Returns the number of rows written.
+    """
+    columns = ", ".join(f"`{name}`" for name in cursor.column_names)
+    header = f"INSERT INTO `{table}` ({columns}) VALUES\n"
+    suffix = ""
+    if upsert:
+        suffix = "\nON DUPLICATE KEY UPDATE " + ", ".join(
+            f"`{name}` = VALUES(`{name}`)" for name in cursor.column_names)
+    count = 0
+    in_statement = 0
+    statement_bytes = 0
+    while True:
+        rows = cursor.fetchmany(batch_rows)
+        if not rows:
+            break
+        for row in rows:
+            line = "(" + ", ".join(sql_literal(value) for value in row) + ")"
+            if in_statement and (in_statement >= batch_rows
+                                 or statement_bytes + len(line) > max_statement_bytes):
+                out.write(f"{suffix};\n")
+                in_statement = 0
+            if in_statement:
+                out.write(",\n")
+            else:
+                out.write(header)
+                statement_bytes = len(header)
+            out.write(line)
+            in_statement += 1
+            statement_bytes += len(line) + 2
+            count += 1
+        if progress:
+            progress(table, count)
+    if in_statement:
+        out.write(f"{suffix};\n")
+    return count
+
+
+@contextmanager
+def read_snapshot(connection):
+    """Open a consistent read-only snapshot and yield the server time it was taken at"""
+    connection.start_transaction(consistent_snapshot=True, readonly=True)
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT NOW()")
+        yield cursor.fetchone()[0]
+    finally:
+        cursor.close()
+        connection.rollback()  # Fin de l'instantané
+
+
+def write_sql_backup(connection, out, tables=BACKUP_TABLES, batch_rows=500, progress=None):
+    """Write a full SQL dump of the tables to the text stream `out`.
+
+    All tables are read in one consistent snapshot through an unbuffered
+    cursor, so memory stays flat whatever the table size. Returns the
+    snapshot's server time (the high-water mark of the next incremental
+    backup) and the number of rows written per table.
+    """
+    counts = {}
+    with read_snapshot(connection) as mark:
+        cursor = connection.cursor()  # Non bufferisé: les lignes arrivent au fil de fetchmany
+        try:
+            out.write(f"-- Sauvegarde complète Gestion Absences BTS du {mark}\n")
+            out.write("SET FOREIGN_KEY_CHECKS=0;\n\n")
+            for table in tables:
+                cursor.execute(f"SHOW CREATE TABLE `{table}`")
+                create_table = cursor.fetchone()[1]
+                out.write(f"-- Table: {table}\n")
+                out.write(f"DROP TABLE IF EXISTS `{table}`;\n")
+                out.write(f"{create_table};\n\n")
+
+                cursor.execute(f"SELECT * FROM `{table}`")
+                counts[table] = write_table_rows(cursor, out, table, batch_rows=batch_rows,
+                                                 progress=progress)
+                out.write("\n")
+            out.write("SET FOREIGN_KEY_CHECKS=1;\n")
+        finally:
+            cursor.close()
+    return mark, counts
+
+
+# Clé primaire de chaque table sauvegardée (journal des suppressions)
+TABLE_KEYS = {"etudiants": "code_massar", "absences": "id"}
+
+
+def record_deletion(cursor, table, key):
+    """Journal a deleted row so the next incremental backup replays the deletion"""
+    cursor.execute(
+        "INSERT INTO journal_suppressions (table_name, cle) VALUES (%s, %s)",
+        (table, str(key))
+    )
+
+
+def write_incremental_backup(connection, out, since, tables=BACKUP_TABLES, batch_rows=500, progress=None):
+    """Write the changes made since `since` (server time) to the text stream `out`.
+
+    Deletions journaled since then are written first, then the rows added
+    or modified (date_modif) as upserts, so a row deleted and added again
+    survives the replay. Returns the new high-water mark and the counts.
+    """
+    counts = {}
+    with read_snapshot(connection) as mark:
+        cursor = connection.cursor()
+        try:
+            out.write(f"-- Sauvegarde incrémentale Gestion Absences BTS du {mark} depuis {since}\n")
+            out.write("SET FOREIGN_KEY_CHECKS=0;\n\n")
+            # Suppressions, enfants avant parents
+            for table in reversed(tables):
+                cursor.execute(
+                    "SELECT DISTINCT cle FROM journal_suppressions "
+                    "WHERE table_name = %s AND date_suppression >= %s",
+                    (table, since)
+                )
+                keys = [row[0] for row in cursor.fetchall()]
+                counts[f"{table}_suppressions"] = len(keys)
+                for start in range(0, len(keys), batch_rows):
+                    batch = ", ".join(sql_literal(key) for key in keys[start:start + batch_rows])
+                    if table == "etudiants":
+                        # FOREIGN_KEY_CHECKS=0 désactive aussi le ON DELETE CASCADE
+                        out.write(f"DELETE FROM `absences` WHERE `code_massar` IN ({batch});\n")
+                    out.write(f"DELETE FROM `{table}` WHERE `{TABLE_KEYS[table]}` IN ({batch});\n")
+            out.write("\n")
+            for table in tables:
+                out.write(f"-- Table: {table}\n")
+                cursor.execute(f"SELECT * FROM `{table}` WHERE date_modif >= %s", (since,))
+                counts[table] = write_table_rows(cursor, out, table, batch_rows=batch_rows, upsert=True,
+                                                 progress=progress)
+                out.write("\n")
+            out.write("SET FOREIGN_KEY_CHECKS=1;\n")
+        finally:
+            cursor.close()
+    return mark, counts
+
+
+def iter_sql_statements(lines):
+    """Split a backup written by this module into statements.
+
+    String literals never contain a raw newline (they are escaped), so a
+    statement ends on the first line ending with ';'.
+    """
+    statement = []
+    for line in lines:
+        if not statement and (not line.strip() or line.startswith("--")):
+            continue
+        statement.append(line)
+        if line.rstrip().endswith(";"):
+            text = "".join(statement).strip()
+            statement = []
+            if text != ";":
+                yield text
+
+
+class BackupDigest:
+    """Row counts, sizes and SHA-256 per table of a backup's SQL text.
+
+    A table's section runs from its "-- Table:" line to the next one; the
+    text before the first section (header, deletions) is kept under "".
+    Used as a pass-through writer when the backup is written, and fed line
+    by line by verify_backup, so both sides hash exactly the same text.
+    """
+
+    def __init__(self, out=None):
+        self.out = out
+        self.tables = {}
+        self._pending = ""
+        self._section("")
+
+    def _section(self, name):
+        self._current = self.tables.setdefault(name, [0, 0, hashlib.sha256()])
+
+    def feed_line(self, line):
+        if line.startswith("-- Table: "):
+            self._section(line[len("-- Table: "):].strip())
+        data = line.encode('utf-8')
+        section = self._current
+        if line.startswith("("):  # Une ligne de valeurs par enregistrement (write_table_rows)
+            section[0] += 1
+        section[1] += len(data)
+        section[2].update(data)
+
+    def write(self, text):
+        self.out.write(text)
+        lines = (self._pending + text).split("\n")
+        self._pending = lines.pop()
+        for line in lines:
+            self.feed_line(line + "\n")
+
+    def summary(self):
+        """Per-table {"rows", "bytes", "sha256"}, once all the text has been fed"""
+        if self._pending:
+            self.feed_line(self._pending)
+            self._pending = ""
+        return {name: {"rows": rows, "bytes": size, "sha256": sha.hexdigest()}
+                for name, (rows, size, sha) in self.tables.items()}
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """SHA-256 and size of a file, read in chunks"""
+    sha = hashlib.sha256()
+    size = 0
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha.update(chunk)
+            size += len(chunk)
+    return sha.hexdigest(), size
+
+
+def manifest_path(path):
+    """Manifest written next to a compressed backup"""
+    return path[:-len(".sql.gz")] + ".manifest.json"
+
+
+def open_backup(path):
+    """Open a backup for reading as text, compressed (.sql.gz) or not (.sql)"""
+    if path.endswith(".gz"):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    return open(path, encoding='utf-8')
+
+
+def verify_backup(path):
+    """Check a compressed backup against its manifest without loading it in memory.
+
+    The archive's checksum is checked first, then the SQL text is streamed
+    through a BackupDigest and compared table by table. Returns the list of
+    problems found (empty when the backup is intact), or None for the old
+    .sql dumps, which have no manifest to check against.
+    """
+    if not path.endswith(".sql.gz"):
+        return None  # Ancien format, toujours restaurable comme sauvegarde complète
+    try:
+        with open(manifest_path(path), encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        return [f"Manifeste illisible: {e}"]
+
+    sha256, size = file_sha256(path)
+    if size != manifest["compressed_bytes"] or sha256 != manifest["sha256"]:
+        return [f"Archive modifiée ou tronquée ({size} octets, attendu {manifest['compressed_bytes']})"]
+
+    digest = BackupDigest()
+    try:
+        with open_backup(path) as f:
+            for line in f:
+                digest.feed_line(line)
+    except (OSError, EOFError, zlib.error, UnicodeDecodeError) as e:
+        return [f"Archive illisible: {e}"]
+
+    problems = []
+    found = digest.summary()
+    for table, expected in manifest["tables"].items():
+        actual = found.pop(table, None)
+        if actual is None:
+            problems.append(f"Table {table or '(en-tête)'} absente")
+        elif actual != expected:
+            problems.append(f"Table {table or '(en-tête)'}: {actual['rows']} lignes / {actual['bytes']} octets, "
+                            f"attendu {expected['rows']} / {expected['bytes']}")
+    for table in found:
+        problems.append(f"Table {table} inattendue")
+    return problems
+
+
+def iter_backup_statements(path, skip=0, prefetch=256):
+    """Yield the (index, statement) of a backup from the `skip`-th statement on.
+
+    The file is read and decompressed by a separate thread into a bounded
+    queue, so the server is never waiting on the disk (and the other way
+    round) while a restore replays it.
+    """
+    statements = queue.Queue(maxsize=prefetch)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                statements.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def reader():
+        try:
+            with open_backup(path) as f:
+                for index, statement in enumerate(iter_sql_statements(f)):
+                    if index >= skip and not put((index, statement)):
+                        return
+            put(None)
+        except Exception as e:
+            put(e)
+
+    thread = threading.Thread(target=reader, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = statements.get()
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+def _replayable(statement):
+    """Variant of a statement that can run twice (first batch after a resume)"""
+    if statement.startswith("INSERT INTO "):
+        return "INSERT IGNORE INTO " + statement[len("INSERT INTO "):]
+    if statement.startswith("CREATE TABLE "):
+        return "CREATE TABLE IF NOT EXISTS " + statement[len("CREATE TABLE "):]
+    return statement
+
+
+class BackupChain:
+    """Chaîne de sauvegardes: une complète puis des incrémentales.
+
+    Chaque sauvegarde est compressée (.sql.gz) et accompagnée d'un manifeste
+    (lignes, taille et SHA-256 par table) qui permet de la vérifier. Le
+    point de reprise (heure du serveur au moment de l'instantané) est
+    gardé dans backup_state.ini. Chaque incrémentale repart un peu avant ce
+    point (OVERLAP) pour ne pas manquer une transaction validée pendant la
+    sauvegarde précédente; rejouer une ligne deux fois est sans effet.
+    """
+
+    PREFIX = "auto_backup_"
+    STATE_FILE = "backup_state.ini"
+    RESTORE_STATE_FILE = ".restore_state.json"
+    OVERLAP = timedelta(minutes=5)
+
+    def __init__(self, directory="backups", full_every=7, keep_chains=20):
+        self.directory = directory
+        self.full_every = full_every
+        self.keep_chains = keep_chains
+
+    def _read_state(self):
+        config = configparser.ConfigParser()
+        config.read(os.path.join(self.directory, self.STATE_FILE))
+        if 'CHAIN' not in config:
+            return None, 0
+        section = config['CHAIN']
+        return datetime.fromisoformat(section['mark']), section.getint('increments', 0)
+
+    def _write_state(self, mark, increments):
+        config = configparser.ConfigParser()
+        config['CHAIN'] = {'mark': mark.isoformat(), 'increments': str(increments)}
+        with open(os.path.join(self.directory, self.STATE_FILE), 'w') as configfile:
+            config.write(configfile)
+
+    def files(self):
+        """Backup files of the directory, oldest first"""
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(f for f in os.listdir(self.directory)
+                      if f.startswith(self.PREFIX) and f.endswith((".sql", ".sql.gz")))
+
+    @staticmethod
+    def is_full(filename):
+        # Les sauvegardes d'avant les incrémentales (auto_backup_<date>.sql) sont complètes
+        return not filename.endswith(("_incr.sql", "_incr.sql.gz"))
+
+    def run(self, connection, full=False, progress=None):
+        """Write the next backup of the chain and return its path.
+
+        progress(table, rows) is called while the tables are dumped.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        mark, increments = self._read_state()
+        full = full or mark is None or increments >= self.full_every - 1 or not self.files()
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        path = os.path.join(self.directory, f"{self.PREFIX}{timestamp}_{'full' if full else 'incr'}.sql.gz")
+
+        # Écriture dans un fichier temporaire: une sauvegarde interrompue ne remplace rien
+        with gzip.open(path + ".part", 'wt', encoding='utf-8', newline="\n", compresslevel=6) as f:
+            digest = BackupDigest(f)
+            if full:
+                new_mark, _ = write_sql_backup(connection, digest, progress=progress)
+            else:
+                new_mark, _ = write_incremental_backup(connection, digest, mark - self.OVERLAP, progress=progress)
+        sha256, size = file_sha256(path + ".part")
+        manifest = {
+            "format": 1,
+            "file": os.path.basename(path),
+            "full": full,
+            "mark": new_mark.isoformat(),
+            "compressed_bytes": size,
+            "sha256": sha256,
+            "tables": digest.summary()
+        }
+        # Le manifeste d'abord: une archive présente a toujours le sien
+        with open(manifest_path(path), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(path + ".part", path)
+        self._write_state(new_mark, 0 if full else increments + 1)
+        if full:
+            # Les suppressions antérieures à la sauvegarde complète ne serviront plus
+            cursor = connection.cursor()
+            cursor.execute("DELETE FROM journal_suppressions WHERE date_suppression < %s",
+                           (new_mark - self.OVERLAP,))
+            connection.commit()
+            cursor.close()
+        self.prune()
+        return path
+
+    def chains(self):
+        """Group the backup files into chains, each starting with a full backup"""
+        chains = []
+        for filename in self.files():
+            if self.is_full(filename) or not chains:
+                chains.append([])
+            chains[-1].append(filename)
+        return chains
+
+    def prune(self):
+        """Delete the oldest chains beyond keep_chains"""
+        for chain in self.chains()[:-self.keep_chains]:
+            for filename in chain:
+                path = os.path.join(self.directory, filename)
+                os.remove(path)
+                if path.endswith(".sql.gz") and os.path.exists(manifest_path(path)):
+                    os.remove(manifest_path(path))
+
+    def verify(self):
+        """Verify every backup of the directory: {filename: problems, or None when unverifiable}"""
+        return {filename: verify_backup(os.path.join(self.directory, filename)) for filename in self.files()}
+
+    def restore_plan(self, upto=None):
+        """Files to replay, in order, to restore the state of `upto` (default: latest)"""
+        for chain in reversed(self.chains()):
+            if upto is None:
+                return [os.path.join(self.directory, f) for f in chain]
+            if upto in chain:
+                return [os.path.join(self.directory, f) for f in chain[:chain.index(upto) + 1]]
+        raise FileNotFoundError(upto or "Aucune sauvegarde complète")
+
+    def _read_restore_state(self, plan):
+        try:
+            with open(os.path.join(self.directory, self.RESTORE_STATE_FILE), encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = {}
+        if state.get("plan") != plan:  # Point de reprise d'une autre restauration
+            state = {"plan": plan, "file": 0, "statement": 0, "rows": 0}
+        return state
+
+    def _write_restore_state(self, state):
+        path = os.path.join(self.directory, self.RESTORE_STATE_FILE)
+        with open(path + ".part", 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(path + ".part", path)
+
+    def restore(self, connection, upto=None, batch_rows=20000, progress=None):
+        """Replay the chain ending at `upto` and rebuild the statistics rollup.
+
+        The multi-row INSERTs of the backups run with autocommit, foreign key
+        and unique checks off, committed every batch_rows rows. After each
+        commit the position is saved in RESTORE_STATE_FILE: a restore that
+        failed resumes after the last committed batch when run again.
+        progress(rows, rows_per_second) is called after each commit. Once
+        done, the chain state and the deletion journal are cleared so that
+        the next backup is a full one. Returns the number of rows restored.
+        """
+        plan = self.restore_plan(upto)
+        # Vérifier toute la chaîne avant de toucher à la base
+        for path in plan:
+            problems = verify_backup(path) if path.endswith(".gz") else []
+            if problems:
+                raise BackupIntegrityError(f"{os.path.basename(path)}: {'; '.join(problems)}")
+
+        state = self._read_restore_state([os.path.basename(path) for path in plan])
+        # Le dernier lot a pu être validé sans que sa position soit enregistrée
+        resuming = state["file"] > 0 or state["statement"] > 0
+        rows = state["rows"]
+        started = time.monotonic()
+        restored = 0
+
+        def checkpoint(file_index, statement_index):
+            state.update({"file": file_index, "statement": statement_index, "rows": rows})
+            self._write_restore_state(state)
+            if progress:
+                progress(rows, restored / max(time.monotonic() - started, 1e-6))
+
+        autocommit = connection.autocommit
+        connection.autocommit = False
+        cursor = connection.cursor()
+        try:
+            cursor.execute("SET FOREIGN_KEY_CHECKS=0")
+            cursor.execute("SET UNIQUE_CHECKS=0")
+            for file_index in range(state["file"], len(plan)):
+                skip = state["statement"] if file_index == state["file"] else 0
+                pending = 0
+                for index, statement in iter_backup_statements(plan[file_index], skip):
+                    cursor.execute(_replayable(statement) if resuming else statement)
+                    if statement.startswith("INSERT"):
+                        count = statement.count("\n(")  # Une ligne par enregistrement
+                        pending += count
+                        restored += count
+                        rows += count
+                        if pending < batch_rows:
+                            continue
+                    # Les DROP/CREATE valident implicitement: même point de reprise
+                    connection.commit()
+                    pending = 0
+                    resuming = False
+                    checkpoint(file_index, index + 1)
+                connection.commit()
+                resuming = False
+                checkpoint(file_index + 1, 0)
+            rebuild_rollup(cursor)
+            # La base ne suit plus l'ancienne chaîne: une incrémentale écrite dessus ferait
+            # revenir, au prochain rejeu, les lignes annulées (ou supprimer les recréées)
+            cursor.execute("DELETE FROM journal_suppressions")
+            connection.commit()
+            os.remove(os.path.join(self.directory, self.RESTORE_STATE_FILE))
+            state_file = os.path.join(self.directory, self.STATE_FILE)
+            if os.path.exists(state_file):
+                os.remove(state_file)  # La prochaine sauvegarde sera complète
+            return rows
+        finally:
+            if connection.is_connected():
+                connection.rollback()  # Lot en cours d'une restauration interrompue
+                cursor.execute("SET UNIQUE_CHECKS=1")
+                cursor.execute("SET FOREIGN_KEY_CHECKS=1")
+                connection.autocommit = autocommit
+            cursor.close()
+
+
+# ------- Import CSV des étudiants et des absences -------
+
+class ImportFormatError(Exception):
+    """Raised when a CSV file is neither a students nor an absences file"""
+
+
+# En-têtes reconnus (sans accents ni majuscules) et colonnes correspondantes.
+# Ce sont ceux des exports: les autres colonnes (ID, Nom d'une absence...) sont ignorées.
+CSV_COLUMNS = {
+    "code massar": "code_massar",
+    "cin": "cin",
+    "nom": "nom",
+    "prenom": "prenom",
+    "classe": "classe",
+    "email": "email",
+    "e-mail": "email",
+    "date": "date_absence",
+    "raison": "raison",
+    "statut": "statut",
+    "notes": "notes",
+}
+
+# Longueurs maximales des colonnes (schéma de la migration 1)
+COLUMN_LIMITS = {"code_massar": 50, "cin": 50, "nom": 100, "prenom": 100, "classe": 20,
+                 "raison": 100, "statut": 20, "email": 255}
+
+# Adresse plausible (un seul @, un domaine avec un point): l'envoi dira le reste
+EMAIL_PATTERN = re.compile(r"^[^@\s,;]+@[^@\s,;]+\.[^@\s,;]+$")
+
+
+@dataclass
+class ImportReport:
+    """Result of import_csv: rows inserted and rejected rows with their reason"""
+    table: str
+    imported: int = 0
+    lines: int = 0
+    errors: List[tuple] = field(default_factory=list)  # (numéro de ligne, message)
+
+    def summary(self, max_errors=20):
+        """Human readable report (French, like the rest of the UI)"""
+        lines = [f"{self.imported} ligne(s) importée(s) dans {self.table}, {len(self.errors)} rejetée(s)"]
+        for line, message in self.errors[:max_errors]:
+            lines.append(f"Ligne {line}: {message}")
+        if len(self.errors) > max_errors:
+            lines.append(f"... et {len(self.errors) - max_errors} autre(s)")
+        return "\n".join(lines)
+
+
+def _header_key(name):
+    name = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode()
+    return " ".join(name.lower().split())
+
+
+def _parse_date(text):
+    for fmt in ("%Y-%m-%d", "%d/%m/%Y"):
+        try:
+            return datetime.strptime(text, fmt).date()
+        except ValueError:
+            pass
+    raise ValueError(f"date invalide '{text}' (AAAA-MM-JJ ou JJ/MM/AAAA)")
+
+
+def _check_lengths(values):
+    for column, value in values.items():
+        limit = COLUMN_LIMITS.get(column)
+        if limit and value and len(value) > limit:
+            raise ValueError(f"{column} dépasse {limit} caractères")
+
+
+def _student_params(values):
+    """Validate a students row and return its INSERT parameters"""
+    nom, prenom, classe = values.get("nom"), values.get("prenom"), values.get("classe")
+    if not nom or not prenom or not classe:
+        raise ValueError("nom, prénom et classe sont obligatoires")
+    cin = values.get("cin") or ""
+    code_massar = values.get("code_massar")
+    if not code_massar:  # Même code par défaut que le formulaire
+        code_massar = f"{nom[:3]}{prenom[:3]}{cin[-4:]}" if cin else f"{nom[:3]}{prenom[:3]}"
+    email = values.get("email") or None
+    if email and not EMAIL_PATTERN.match(email):
+        raise ValueError(f"email invalide '{email}'")
+    _check_lengths({"code_massar": code_massar, "cin": cin, "nom": nom, "prenom": prenom, "classe": classe,
+                    "email": email})
+    return (code_massar, cin, nom, prenom, classe, email)
+
+
+def _absence_params(values):
+    """Validate an absences row and return its INSERT parameters"""
+    code_massar, raison, statut = values.get("code_massar"), values.get("raison"), values.get("statut")
+    if not code_massar or not values.get("date_absence") or not raison or not statut:
+        raise ValueError("code Massar, date, raison et statut sont obligatoires")
+    if statut not in JUSTIFIED_STATUSES + UNJUSTIFIED_STATUSES:
+        raise ValueError(f"statut inconnu '{statut}'")
+    _check_lengths({"code_massar": code_massar, "raison": raison, "statut": statut})
+    return (code_massar, _parse_date(values["date_absence"]), raison, statut, values.get("notes") or None)
+
+
+def _refresh_absences_rollup(cursor, params):
+    # Les dates importées suffisent: refresh_rollup recalcule chaque clé depuis la table
+    dates = sorted({row[1] for row in params})
+    if dates:
+        placeholders = ", ".join(["%s"] * len(dates))
+        refresh_rollup(cursor, rollup_keys(cursor, f"a.date_absence IN ({placeholders})", dates))
+
+
+IMPORTS = {
+    "etudiants": ("INSERT INTO etudiants (code_massar, cin, nom, prenom, classe, email) "
+                  "VALUES (%s, %s, %s, %s, %s, %s)",
+                  _student_params, None),
+    "absences": ("INSERT INTO absences (code_massar, date_absence, raison, statut, notes) "
+                 "VALUES (%s, %s, %s, %s, %s)",
+                 _absence_params, _refresh_absences_rollup),
+}
+
+
+def _insert_batch(connection, cursor, table, batch, report):
+    """Insert a batch of (line, params) in one transaction.
+
+    The whole batch goes in one executemany (a single multi-row INSERT).
+    If the server rejects it, it is replayed row by row so that only the
+    faulty rows (duplicate code, unknown student...) are reported.
+    """
+    query, _, after = IMPORTS[table]
+    try:
+        cursor.executemany(query, [params for _, params in batch])
+        inserted = [params for _, params in batch]
+    except (errors.IntegrityError, errors.DataError):
+        connection.rollback()
+        inserted = []
+        for line, params in batch:
+            try:
+                cursor.execute(query, params)
+                inserted.append(params)
+            except (errors.IntegrityError, errors.DataError) as e:
+                report.errors.append((line, e.msg))
+    if after:
+        after(cursor, inserted)
+    connection.commit()
+    report.imported += len(inserted)
+
+
+def import_csv(connection, path, batch_rows=500, progress=None):
+    """Import a students or absences CSV file (the layouts of the exports).
+
+    The delimiter is sniffed (',' or ';'), the kind of file is recognized
+    from its header, and rows are streamed, validated and inserted in
+    batches of batch_rows, one transaction each. progress(report), if
+    given, is called after each batch. Returns an ImportReport.
+    """
+    with open(path, newline='', encoding='utf-8-sig') as f:  # utf-8-sig: fichiers enregistrés par Excel
+        sample = f.read(64 * 1024)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        reader = csv.reader(f, dialect)
+        header = next(reader, None)
+        if header is None:
+            raise ImportFormatError("Fichier vide")
+        columns = [CSV_COLUMNS.get(_header_key(name)) for name in header]
+        if "raison" in columns:
+            table = "absences"
+        elif {"nom", "prenom", "classe"} <= set(columns):
+            table = "etudiants"
+        else:
+            raise ImportFormatError(f"En-tête non reconnu: {', '.join(header)}")
+
+        validate = IMPORTS[table][1]
+        report = ImportReport(table)
+        batch = []
+        cursor = connection.cursor(dictionary=True)
+        try:
+            for row in reader:
+                line = reader.line_num  # Ligne du fichier (une note peut tenir sur plusieurs)
+                if not any(cell.strip() for cell in row):
+                    continue
+                report.lines += 1
+                values = {column: cell.strip() for column, cell in zip(columns, row) if column}
+                try:
+                    batch.append((line, validate(values)))
+                except ValueError as e:
+                    report.errors.append((line, str(e)))
+                    continue
+                if len(batch) >= batch_rows:
+                    _insert_batch(connection, cursor, table, batch, report)
+                    batch = []
+                    if progress:
+                        progress(report)
+            if batch:
+                _insert_batch(connection, cursor, table, batch, report)
+        except BaseException:
+            connection.rollback()
+            raise
+        finally:
+            cursor.close()
+    if progress:
+        progress(report)
+    return report
+
+
+# ------- Export des données -------
+# Les lignes arrivent d'un curseur non bufferisé (QueryCache.stream) et
+# passent par lots dans un writer: la mémoire utilisée ne dépend que de la
+# taille d'un lot, pas du nombre de lignes exportées.
+
+EXPORT_DELIMITER = ";"  # Le même pour tous les exports CSV (relus par import_csv)
+
+# (en-tête, colonne de la requête, type pour les formats typés)
+STUDENT_EXPORT_FIELDS = [
+    ("Code Massar", "code_massar", "str"),
+    ("CIN", "cin", "str"),
+    ("Nom", "nom", "str"),
+    ("Prénom", "prenom", "str"),
+    ("Classe", "classe", "str"),
+    ("Email", "email", "str"),
+    ("Date Ajout", "date_ajout", "datetime"),
+]
+ABSENCE_EXPORT_FIELDS = [
+    ("ID", "id", "int"),
+    ("Code Massar", "code_massar", "str"),
+    ("Nom", "nom", "str"),
+    ("Prénom", "prenom", "str"),
+    ("Classe", "classe", "str"),
+    ("Date", "date_absence", "date"),
+    ("Raison", "raison", "str"),
+    ("Statut", "statut", "str"),
+    ("Notes", "notes", "str"),
+]
+
+
+def students_export_query():
+    """SELECT of every student for the exports, and its parameters"""
+    return ("SELECT code_massar, cin, nom, prenom, classe, email, date_ajout FROM etudiants "
+            "ORDER BY nom, prenom, code_massar"), []
+
+
+def students_count_query():
+    return "SELECT COUNT(*) AS total FROM etudiants", []
+
+
+class CsvExportWriter:
+    """CSV with EXPORT_DELIMITER, headers of the fields"""
+
+    extension = ".csv"
+
+    def __init__(self, path, fields):
+        self.file = open(path, 'w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.file, delimiter=EXPORT_DELIMITER)
+        self.writer.writerow([header for header, _, _ in fields])
+
+    def write(self, rows):
+        self.writer.writerows(["" if value is None else str(value) for value in row] for row in rows)
+
+    def close(self):
+        self.file.close()
+
+
+class JsonLinesExportWriter:
+    """One JSON object per line, keyed by column name (dates in ISO format)"""
+
+    extension = ".jsonl"
+
+    def __init__(self, path, fields):
+        self.file = open(path, 'w', encoding='utf-8')
+        self.keys = [key for _, key, _ in fields]
+
+    def write(self, rows):
+        self.file.writelines(
+            json.dumps(dict(zip(self.keys, row)), ensure_ascii=False, default=str) + "\n" for row in rows
+        )
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetExportWriter:
+    """Columnar Parquet file (needs pyarrow), one row group per ROW_GROUP_ROWS rows"""
+
+    extension = ".parquet"
+    ROW_GROUP_ROWS = 50000
+
+    def __init__(self, path, fields):
+        global pyarrow
+        import pyarrow.parquet
+        types = {
+            "str": pyarrow.string(),
+            "int": pyarrow.int64(),
+            "date": pyarrow.date32(),
+            "datetime": pyarrow.timestamp("s"),
+        }
+        self.schema = pyarrow.schema([(key, types[kind]) for _, key, kind in fields])
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+        self.pending = []
+
+    def write(self, rows):
+        self.pending.extend(rows)
+        if len(self.pending) >= self.ROW_GROUP_ROWS:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        columns = [
+            pyarrow.array([row[index] for row in self.pending], type=column.type)
+            for index, column in enumerate(self.schema)
+        ]
+        self.writer.write_table(pyarrow.Table.from_arrays(columns, schema=self.schema))
+        self.pending = []
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self.writer.close()
+
+
+EXPORT_WRITERS = {"csv": CsvExportWriter, "jsonl": JsonLinesExportWriter}
+if importlib.util.find_spec("pyarrow") is not None:
+    EXPORT_WRITERS["parquet"] = ParquetExportWriter
+
+
+def export_rows(rows, path, fields, fmt="csv", total=None, batch_rows=1000, progress=None, cancelled=None):
+    """Write the dict rows of an iterator to path in fmt (a key of EXPORT_WRITERS).
+
+    The file is written under a temporary name and renamed once complete,
+    so a cancelled or failed export never leaves a truncated file.
+    progress(done, total) is called after each batch and cancelled() is
+    checked before each one. Returns the number of rows written, or None
+    when cancelled.
+    """
+    keys = [key for _, key, _ in fields]
+    partial = path + ".part"
+    writer = EXPORT_WRITERS[fmt](partial, fields)
+    done = 0
+    try:
+        batch = []
+        for row in rows:
+            batch.append([row[key] for key in keys])
+            if len(batch) >= batch_rows:
+                if cancelled is not None and cancelled():
+                    break
+                writer.write(batch)
+                done += len(batch)
+                batch = []
+                if progress:
+                    progress(done, total)
+        else:
+            writer.write(batch)
+            done += len(batch)
+            batch = None
+    except BaseException:
+        writer.close()
+        os.remove(partial)
+        raise
+    finally:
+        if hasattr(rows, "close"):
+            rows.close()  # Curseur vidé et rendu même si l'export s'arrête avant la fin
+    writer.close()
+    if batch is not None:
+        os.remove(partial)
+        return None
+    os.replace(partial, path)
+    if progress:
+        progress(done, total)
+    return done
+
+
+class SnapshotError(Exception):
+    """Raised when the tables cannot be locked to open consistent snapshots"""
+
+
+def iter_rows(connection, query, params=(), batch_rows=1000):
+    """Yield the dict rows of a SELECT from an unbuffered cursor, in batches.
+
+    Closing the generator early drains the rest of the result so that the
+    connection stays usable.
+    """
+    cursor = connection.cursor(dictionary=True)
+    try:
+        cursor.execute(query, params)
+        while True:
+            batch = cursor.fetchmany(batch_rows)
+            if not batch:
+                break
+            try:
+                yield from batch
+            except GeneratorExit:
+                while cursor.fetchmany(batch_rows):
+                    pass
+                raise
+    finally:
+        cursor.close()
+
+
+# Tables lues par data_version(): verrouillées le temps d'ouvrir les instantanés
+SNAPSHOT_LOCK_TABLES = "LOCK TABLES etudiants READ, absences READ, journal_suppressions READ"
+
+
+def _open_snapshots(db, connections):
+    """Start a consistent-snapshot transaction on each connection, all at the same state.
+
+    A control connection holds SNAPSHOT_LOCK_TABLES while the snapshots are
+    opened, as parallel dump tools do: no write can be committed between
+    two of them, and writers only wait for these few statements. Returns
+    the data_version() of the snapshots.
+    """
+    # Connexion interactive: celles du pool "background" sont déjà toutes empruntées par l'export
+    with db.connection("interactive") as control:
+        cursor = control.cursor()
+        try:
+            try:
+                cursor.execute(SNAPSHOT_LOCK_TABLES)
+            except errors.ProgrammingError as e:
+                raise SnapshotError(f"Le droit LOCK TABLES est nécessaire pour un export cohérent: {e.msg}") from e
+            try:
+                for connection in connections:
+                    snapshot = connection.cursor()
+                    try:
+                        snapshot.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+                        snapshot.execute("START TRANSACTION WITH CONSISTENT SNAPSHOT")
+                    finally:
+                        snapshot.close()
+            finally:
+                cursor.execute("UNLOCK TABLES")
+        finally:
+            cursor.close()
+    cursor = connections[0].cursor(dictionary=True)
+    try:
+        return data_version(cursor)
+    finally:
+        cursor.close()
+
+
+# Un seul export en instantané à la fois: il emprunte plusieurs connexions du
+# même pool, deux exports simultanés pourraient s'attendre mutuellement.
+_snapshot_lock = threading.Lock()
+
+
+def export_snapshot(db, targets, manifest_file, progress=None, cancelled=None):
+    """Export several queries in parallel from one consistent state of the database.
+
+    targets are (filename, format, (query, params), (count query, params),
+    fields) tuples. Each one is read on its own background connection in a
+    REPEATABLE READ snapshot; the snapshots are all opened while the tables
+    are locked (_open_snapshots), so the files form a referentially
+    consistent set. A JSON manifest with the row count and SHA-256 of each file is
+    written to manifest_file. Returns the manifest, or None when cancelled
+    (no file is left behind).
+    """
+    failed = threading.Event()
+    stop = lambda: failed.is_set() or (cancelled is not None and cancelled())
+    done = [0] * len(targets)
+    progress_lock = threading.Lock()
+
+    with _snapshot_lock, ExitStack() as stack:
+        connections = [stack.enter_context(db.connection("background")) for _ in targets]
+        try:
+            version = _open_snapshots(db, connections)
+            totals = []
+            for connection, (_, _, _, count, _) in zip(connections, targets):
+                cursor = connection.cursor(dictionary=True)
+                try:
+                    cursor.execute(*count)
+                    totals.append(int(cursor.fetchone()['total']))
+                finally:
+                    cursor.close()
+            total = sum(totals)
+
+            def export(index):
+                filename, fmt, query, _, fields = targets[index]
+
+                def report(rows, _):
+                    with progress_lock:
+                        done[index] = rows
+                        if progress:
+                            progress(sum(done), total)
+                try:
+                    return export_rows(iter_rows(connections[index], *query), filename, fields, fmt,
+                                       total, progress=report, cancelled=stop)
+                except BaseException:
+                    failed.set()  # Les autres exports s'arrêtent au lot suivant
+                    raise
+
+            with ThreadPoolExecutor(max_workers=len(targets)) as pool:
+                futures = [pool.submit(export, index) for index in range(len(targets))]
+            failures = [future.exception() for future in futures if future.exception() is not None]
+            rows = [None if future.exception() else future.result() for future in futures]
+        finally:
+            for connection in connections:
+                if connection.is_connected():
+                    connection.rollback()  # Fin des transactions en lecture seule
+
+    if failures or None in rows:
+        for (filename, _, _, _, _), written in zip(targets, rows):
+            if written is not None and os.path.exists(filename):
+                os.remove(filename)  # Jamais la moitié d'un export
+        if failures:
+            raise failures[0]
+        return None
+
+    manifest = {
+        'created': datetime.now().isoformat(timespec="seconds"),
+        'data_version': [None if value is None else str(value) for value in version],
+        'files': []
+    }
+    for (filename, fmt, _, _, _), written in zip(targets, rows):
+        sha256, size = file_sha256(filename)
+        manifest['files'].append({
+            'file': os.path.basename(filename),
+            'format': fmt,
+            'rows': written,
+            'bytes': size,
+            'sha256': sha256
+        })
+    with open(manifest_file, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    return manifest
+
+
+# ------- File d'envoi des emails -------
+# Chaque message attend dans le dossier outbox sous forme d'un fichier JSON
+# jusqu'à son envoi: un message non envoyé (serveur injoignable, application
+# fermée) est repris au prochain passage. Un passage envoie tous les messages
+# prêts sur une seule session SMTP authentifiée.
+
+MAIL_CONFIG_FILE = "email_config.ini"
+
+
+def read_mail_settings(path=MAIL_CONFIG_FILE):
+    """SMTP settings saved by the email dialog (section [EMAIL])"""
+    config = configparser.ConfigParser()
+    config.read(path)
+    email_config = config['EMAIL'] if 'EMAIL' in config else {}
+    return {
+        'sender': email_config.get('sender', ''),
+        'password': email_config.get('password', ''),
+        'server': email_config.get('server', 'smtp.gmail.com'),
+        'port': int(email_config.get('port', '587') or 587)
+    }
+
+
+def build_message(sender, recipient, subject, body, created, html=None, attachments=()):
+    """MIME message of a queued email (body sent once, with the footer).
+
+    html, if given, is offered as an alternative to the text body;
+    attachments are (filename, CSV text) pairs.
+    """
+    message = EmailMessage()
+    message["From"] = sender
+    message["To"] = recipient
+    message["Subject"] = subject
+    message["Date"] = email.utils.formatdate(created, localtime=True)
+    message["Message-ID"] = email.utils.make_msgid()
+    sent_on = datetime.fromtimestamp(created).strftime("%Y-%m-%d %H:%M:%S")
+    footer = f"This email was sent from Absence Management System on {sent_on}"
+    message.set_content(f"{body}\n\n{footer}")
+    if html:
+        message.add_alternative(f"{html}\n<p><small>{footer}</small></p>", subtype="html")
+    for filename, content in attachments:
+        message.add_attachment(content.encode("utf-8"), maintype="text", subtype="csv", filename=filename)
+    return message
+
+
+@dataclass
+class MailReport:
+    """Result of MailQueue.flush"""
+    sent: int = 0
+    retrying: int = 0
+    failed: int = 0
+    errors: List[str] = field(default_factory=list)
+
+    def summary(self):
+        text = f"{self.sent} email(s) envoyé(s)"
+        if self.retrying:
+            text += f", {self.retrying} en attente d'un nouvel essai"
+        if self.failed:
+            text += f", {self.failed} abandonné(s)"
+        return text
+
+
+class MailQueue:
+    """File d'envoi persistante: outbox/<id>.json, outbox/failed/ pour les abandons.
+
+    Les erreurs passagères (connexion perdue, réponse 4xx) reportent le
+    message avec un délai qui double à chaque essai (RETRY_DELAY jusqu'à
+    MAX_RETRY_DELAY); après MAX_ATTEMPTS essais, ou sur un refus définitif
+    (5xx), il est déplacé dans failed/. Une erreur d'authentification arrête
+    le passage sans compter d'essai: les paramètres sont à corriger.
+    """
+
+    RETRY_DELAY = 30
+    MAX_RETRY_DELAY = 3600
+    MAX_ATTEMPTS = 8
+    TIMEOUT = 30
+
+    def __init__(self, directory="outbox"):
+        self.directory = directory
+        self._flushing = threading.Lock()
+
+    def enqueue(self, recipients, subject, body, sender, html=None, attachments=()):
+        """Queue one message per recipient; returns their ids (see build_message for html, attachments)"""
+        os.makedirs(self.directory, exist_ok=True)
+        created = time.time()
+        ids = []
+        for recipient in recipients:
+            message_id = f"{time.time_ns():020d}_{uuid.uuid4().hex[:8]}"  # Tri = ordre d'arrivée
+            self._save({
+                'id': message_id,
+                'sender': sender,
+                'recipient': recipient,
+                'subject': subject,
+                'body': body,
+                'html': html,
+                'attachments': [list(attachment) for attachment in attachments],
+                'created': created,
+                'attempts': 0,
+                'next_attempt': created,
+                'last_error': None
+            })
+            ids.append(message_id)
+        return ids
+
+    def _path(self, message_id, folder=None):
+        directory = os.path.join(self.directory, folder) if folder else self.directory
+        return os.path.join(directory, f"{message_id}.json")
+
+    def _save(self, message, folder=None):
+        path = self._path(message['id'], folder)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", 'w', encoding='utf-8') as f:
+            json.dump(message, f, ensure_ascii=False, indent=2)
+        os.replace(path + ".tmp", path)  # Jamais de fichier à moitié écrit
+
+    def messages(self):
+        """Queued messages, oldest first"""
+        if not os.path.isdir(self.directory):
+            return []
+        messages = []
+        for filename in sorted(os.listdir(self.directory)):
+            if filename.endswith(".json"):
+                with open(os.path.join(self.directory, filename), encoding='utf-8') as f:
+                    messages.append(json.load(f))
+        return messages
+
+    def due(self, now=None):
+        """Queued messages whose next attempt time has come"""
+        now = time.time() if now is None else now
+        return [message for message in self.messages() if message['next_attempt'] <= now]
+
+    def _open_session(self, settings):
+        """Connected (STARTTLS when offered) and authenticated SMTP session"""
+        session = smtplib.SMTP(settings['server'], int(settings['port']), timeout=self.TIMEOUT)
+        try:
+            session.ehlo()
+            if session.has_extn("starttls"):
+                session.starttls()
+                session.ehlo()
+            if settings.get('password'):
+                session.login(settings['sender'], settings['password'])
+        except BaseException:
+            session.close()
+            raise
+        return session
+
+    def _retry(self, message, error, report):
+        message['attempts'] += 1
+        message['last_error'] = str(error)
+        if message['attempts'] >= self.MAX_ATTEMPTS:
+            self._give_up(message, error, report)
+            return
+        delay = min(self.RETRY_DELAY * 2 ** (message['attempts'] - 1), self.MAX_RETRY_DELAY)
+        message['next_attempt'] = time.time() + delay
+        self._save(message)
+        report.retrying += 1
+
+    def _give_up(self, message, error, report):
+        message['last_error'] = str(error)
+        self._save(message, "failed")
+        os.remove(self._path(message['id']))
+        report.failed += 1
+        report.errors.append(f"{message['recipient']}: {error}")
+
+    @staticmethod
+    def _refused(error):
+        """Whether the server answered with an error code (the connection itself is fine)"""
+        return (isinstance(error, smtplib.SMTPResponseException)
+                and not isinstance(error, smtplib.SMTPConnectError))
+
+    def flush(self, settings, progress=None):
+        """Send the due messages on one SMTP session and return a MailReport.
+
+        A session lost in the middle of the batch is reopened once before
+        the remaining messages are postponed. progress(report) is called
+        after each message. Returns an empty report if another flush is
+        already running.
+        """
+        report = MailReport()
+        if not self._flushing.acquire(blocking=False):
+            return report
+        session = None
+        reopened = False
+        try:
+            pending = self.due()
+            while pending:
+                message = pending[0]
+                try:
+                    if session is None:
+                        session = self._open_session(settings)
+                    session.send_message(build_message(
+                        message['sender'], message['recipient'], message['subject'],
+                        message['body'], message['created'],
+                        message.get('html'), message.get('attachments', ())
+                    ))
+                except smtplib.SMTPAuthenticationError:
+                    raise  # Paramètres à corriger: les messages restent dans la file
+                except smtplib.SMTPRecipientsRefused as e:
+                    self._give_up(message, e, report)
+                except OSError as e:  # Les erreurs SMTP en font partie
+                    if self._refused(e):
+                        if 400 <= e.smtp_code < 500:
+                            self._retry(message, e, report)
+                        else:
+                            self._give_up(message, e, report)
+                    else:
+                        # Connexion perdue ou impossible
+                        session = None
+                        if not reopened:
+                            reopened = True
+                            continue  # Nouvelle session, même message
+                        for message in pending:
+                            self._retry(message, e, report)
+                        break
+                else:
+                    os.remove(self._path(message['id']))
+                    report.sent += 1
+                pending.pop(0)
+                if progress:
+                    progress(report)
+        finally:
+            if session is not None:
+                try:
+                    session.quit()
+                except (smtplib.SMTPException, OSError):
+                    session.close()
+            self._flushing.release()
+        return report
+
+
+# ------- Bilans des absences par email -------
+# Bilans par classe (pour l'équipe pédagogique) et par étudiant (à son
+# adresse) sur une période. Toutes les absences de la période sont lues en
+# une seule requête, triées par classe puis par étudiant, et regroupées en
+# mémoire: des centaines de bilans personnalisés coûtent la même requête.
+# Les totaux par classe viennent de compute_statistics (cumul journalier).
+# Les bilans partent par la file d'envoi, en texte et HTML, avec le détail
+# en pièce jointe CSV.
+
+DIGEST_FREQUENCIES = ("quotidien", "hebdomadaire", "mensuel")
+DIGEST_ABSENCE_HEADER = ["Date", "Raison", "Statut", "Notes"]
+
+
+def digest_period(frequency, today):
+    """(date_from, date_to) of the last complete day, week (Monday to Sunday) or month before today"""
+    if frequency == "quotidien":
+        day = today - timedelta(days=1)
+        return day, day
+    if frequency == "hebdomadaire":
+        end = today - timedelta(days=today.weekday() + 1)
+        return end - timedelta(days=6), end
+    end = today.replace(day=1) - timedelta(days=1)
+    return end.replace(day=1), end
+
+
+@dataclass
+class StudentDigest:
+    """Absences of one student over the period of a digest"""
+    code_massar: str
+    nom: str
+    prenom: str
+    classe: str
+    email: Optional[str]
+    absences: List[list] = field(default_factory=list)  # [date, raison, statut, notes]
+
+    @property
+    def justified(self):
+        return sum(absence[2] in JUSTIFIED_STATUSES for absence in self.absences)
+
+    @property
+    def unjustified(self):
+        return len(self.absences) - self.justified
+
+
+@dataclass
+class DigestMessage:
+    """A rendered digest, in the arguments of MailQueue.enqueue"""
+    recipients: List[str]
+    subject: str
+    body: str
+    html: str
+    attachments: List[tuple]
+
+
+@dataclass
+class DigestReport:
+    """Result of queue_digests"""
+    date_from: str
+    date_to: str
+    class_digests: int = 0
+    student_digests: int = 0
+    without_email: int = 0
+
+    def summary(self):
+        text = (f"Bilans du {self.date_from} au {self.date_to} mis en file: "
+                f"{self.class_digests} par classe, {self.student_digests} par étudiant")
+        if self.without_email:
+            text += f" ({self.without_email} étudiant(s) sans email)"
+        return text
+
+
+def csv_text(rows):
+    """Rows as CSV text with EXPORT_DELIMITER (attachments)"""
+    out = io.StringIO()
+    csv.writer(out, delimiter=EXPORT_DELIMITER).writerows(rows)
+    return out.getvalue()
+
+
+def html_table(header, rows):
+    """HTML table of rows, every value escaped"""
+    lines = ["<tr>" + "".join(f"<th>{escape(str(name))}</th>" for name in header) + "</tr>"]
+    for row in rows:
+        lines.append("<tr>" + "".join(f"<td>{escape(str(value))}</td>" for value in row) + "</tr>")
+    return '<table border="1" cellpadding="4" cellspacing="0">\n' + "\n".join(lines) + "\n</table>"
+
+
+def load_digests(connection, spec):
+    """Statistics and absent students (StudentDigest) of spec, read in one snapshot.
+
+    Only the class and the period of spec are used.
+    """
+    spec = AbsenceFilter(classe=spec.classe, date_from=spec.date_from, date_to=spec.date_to)
+    conditions, params = spec.where()
+    students = []
+    with read_snapshot(connection):
+        statistics = compute_statistics(connection, spec)
+        cursor = connection.cursor(dictionary=True)
+        try:
+            cursor.execute(f"""
+                SELECT e.code_massar, e.nom, e.prenom, e.classe, e.email,
+                       a.date_absence, a.raison, a.statut, a.notes
+                FROM absences a
+                JOIN etudiants e ON a.code_massar = e.code_massar
+                WHERE 1=1{conditions}
+                ORDER BY e.classe, e.nom, e.prenom, e.code_massar, a.date_absence, a.id
+            """, params)
+            for row in cursor:
+                if not students or students[-1].code_massar != row['code_massar']:
+                    students.append(StudentDigest(row['code_massar'], row['nom'], row['prenom'],
+                                                  row['classe'], row['email']))
+                students[-1].absences.append([str(row['date_absence']), row['raison'], row['statut'],
+                                              row['notes'] or ""])
+        finally:
+            cursor.close()
+    return statistics, students
+
+
+def render_student_digest(student, date_from, date_to):
+    """DigestMessage sent to a student: their absences of the period"""
+    summary = (f"Du {date_from} au {date_to}, {len(student.absences)} absence(s) enregistrée(s): "
+               f"{student.justified} justifiée(s), {student.unjustified} non justifiée(s).")
+    body = f"Bonjour {student.prenom} {student.nom},\n\n{summary}\n\n"
+    body += "\n".join(f"- {day}: {raison} ({statut})" for day, raison, statut, _ in student.absences)
+    body += "\n\nLe détail est joint au format CSV."
+    html = (f"<p>Bonjour {escape(student.prenom)} {escape(student.nom)},</p>\n<p>{escape(summary)}</p>\n"
+            + html_table(DIGEST_ABSENCE_HEADER, student.absences))
+    return DigestMessage(
+        [student.email],
+        f"Bilan de vos absences du {date_from} au {date_to}",
+        body,
+        html,
+        [(f"absences_{student.code_massar}_{date_from}_{date_to}.csv",
+          csv_text([DIGEST_ABSENCE_HEADER] + student.absences))]
+    )
+
+
+def render_class_digest(stat, students, date_from, date_to, recipients):
+    """DigestMessage of a class (ClassStats) and its absent students, most absent first"""
+    students = sorted(students, key=lambda s: (-len(s.absences), s.nom, s.prenom))
+    header = ["Code Massar", "Nom", "Prénom", "Absences", "Justifiées", "Non justifiées"]
+    rows = [[s.code_massar, s.nom, s.prenom, len(s.absences), s.justified, s.unjustified] for s in students]
+    details = [["Code Massar", "Nom", "Prénom"] + DIGEST_ABSENCE_HEADER]
+    for student in students:
+        details.extend([student.code_massar, student.nom, student.prenom] + absence
+                       for absence in student.absences)
+    title = f"Bilan des absences {stat.classe} du {date_from} au {date_to}"
+    body = f"{title}\n\n{stat.format_report()}\nÉtudiants absents:\n"
+    body += "\n".join(f"- {nom} {prenom}: {count} absence(s), {justified} justifiée(s)"
+                      for _, nom, prenom, count, justified, _ in rows)
+    body += "\n\nLe détail des absences est joint au format CSV."
+    html = (f"<h3>{escape(title)}</h3>\n<pre>{escape(stat.format_report())}</pre>\n"
+            + html_table(header, rows))
+    return DigestMessage(
+        list(recipients),
+        title,
+        body,
+        html,
+        [(f"etudiants_{stat.classe}_{date_from}_{date_to}.csv", csv_text([header] + rows)),
+         (f"absences_{stat.classe}_{date_from}_{date_to}.csv", csv_text(details))]
+    )
+
+
+def queue_digests(connection, mail_queue, spec, sender, class_recipients=(), students=True):
+    """Queue the digests of spec: one per class with absences (to class_recipients)
+    and, with students, one per absent student having an email. Returns a DigestReport.
+    """
+    statistics, absent = load_digests(connection, spec)
+    report = DigestReport(statistics.date_from, statistics.date_to)
+    messages = []
+    if class_recipients:
+        by_class = {classe: list(group) for classe, group in itertools.groupby(absent, key=lambda s: s.classe)}
+        for stat in statistics.classes:
+            if stat.total_absences:
+                messages.append(render_class_digest(stat, by_class.get(stat.classe, []), report.date_from,
+                                                    report.date_to, class_recipients))
+                report.class_digests += 1
+    if students:
+        for student in absent:
+            if student.email:
+                messages.append(render_student_digest(student, report.date_from, report.date_to))
+                report.student_digests += 1
+            else:
+                report.without_email += 1
+    for message in messages:
+        mail_queue.enqueue(message.recipients, message.subject, message.body, sender,
+                           message.html, message.attachments)
+    return report
+
+
+def send_scheduled_digests(connection, mail_queue, frequency, today, sender, class_recipients=(), students=True):
+    """Queue the digests of the last complete period, unless it was already sent.
+
+    The period is claimed in envois_bilans first, so that several
+    computers running the schedule send it once; the claim is released if
+    the digests could not be queued. Returns the DigestReport, or None if
+    the period was already sent.
+    """
+    date_from, date_to = digest_period(frequency, today)
+    cursor = connection.cursor()
+    try:
+        cursor.execute("INSERT IGNORE INTO envois_bilans (date_debut, date_fin) VALUES (%s, %s)",
+                       (date_from, date_to))
+        claimed = cursor.rowcount == 1
+        connection.commit()
+        if not claimed:
+            return None
+        try:
+            return queue_digests(connection, mail_queue,
+                                 AbsenceFilter(date_from=date_from.isoformat(), date_to=date_to.isoformat()),
+                                 sender, class_recipients, students)
+        except BaseException:
+            connection.rollback()
+            cursor.execute("DELETE FROM envois_bilans WHERE date_debut = %s AND date_fin = %s",
+                           (date_from, date_to))
+            connection.commit()
+            raise
+    finally:
+        cursor.close()
@@ -1,28 +1,45 @@
 # ------ Modules pour l'interface graphique avec PyQt5 -------
 from PyQt5.QtCore import QDate, Qt, QTimer                  # Gestion des dates, constantes Qt et minuteur (auto-sauvegarde)
+from PyQt5.QtCore import QAbstractTableModel, QModelIndex   # Modèle de données virtualisé pour les grandes tables
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal  # Exécution des requêtes en arrière-plan
+from PyQt5.QtCore import QStringListModel                   # Suggestions de la recherche d'étudiants
 from PyQt5.QtGui import QIcon, QPixmap, QColor, QFont       # Gestion des icônes, images, couleurs, polices
 from PyQt5.QtWidgets import (                               
     QApplication, QWidget, QPushButton, QVBoxLayout, QHBoxLayout,
-    QLineEdit, QLabel, QTabWidget, QTableWidget, QTableWidgetItem,
+    QLineEdit, QLabel, QTabWidget, QTableWidget, QTableWidgetItem, QTableView,
     QComboBox, QMessageBox, QHeaderView, QDateEdit, QFormLayout,
     QFileDialog, QTextEdit, QStatusBar, QDialog, QDialogButtonBox,
-    QGroupBox, QMainWindow, QAction, QToolBar, QSystemTrayIcon
+    QGroupBox, QMainWindow, QAction, QToolBar, QSystemTrayIcon, QProgressBar,
+    QCheckBox, QSpinBox, QListWidget, QListWidgetItem, QCompleter, QProgressDialog
 )  # Composants principaux pour construire l'interface utilisateur
 
 # ------- Connexion à la base de données MySQL -------
 import mysql.connector                 # Connexion à MySQL
 from mysql.connector import Error     # Gestion des erreurs MySQL
+from absences_core import DatabasePool  # Pools de connexions avec reconnexion automatique
+from absences_core import migrate, check_query_plans, QueryPlanError  # Migrations du schéma
+from absences_core import compute_statistics  # Statistiques des absences en une seule requête
+from absences_core import rollup_keys, refresh_rollup, rebuild_rollup  # Cumul journalier des absences
+from absences_core import BackupChain, record_deletion  # Sauvegardes complètes et incrémentales
+from absences_core import import_csv  # Import CSV en lots
+from absences_core import data_version  # Détection des modifications faites par d'autres postes
+from absences_core import AbsenceFilter, absences_query, absences_count_query  # Filtre et requêtes des absences
+from absences_core import StudentDirectory  # Annuaire des étudiants en mémoire
+from absences_core import QueryCache  # Résultats des requêtes répétées
+from absences_core import EXPORT_WRITERS, export_rows, export_snapshot  # Exports CSV, JSON Lines, Parquet
+from absences_core import STUDENT_EXPORT_FIELDS, ABSENCE_EXPORT_FIELDS, students_export_query, students_count_query
 
 # -------- Gestion de l'application --------
 import sys                            # Utilisé pour gérer les arguments de la ligne de commande et quitter l'application
+import threading                      # Drapeaux d'annulation partagés avec les threads de requêtes
 
 # ------- Création et gestion de fichiers CSV -------
 import csv                            # Pour exporter les données vers des fichiers CSV
 
 # ------- Envoi d'emails -------
-from email.mime.text import MIMEText          # Pour créer une partie texte simple dans un email
-from email.mime.multipart import MIMEMultipart  # Pour créer un email avec plusieurs parties (texte, HTML, pièces jointes)
-import smtplib                                # 
+from absences_core import MailQueue, read_mail_settings  # File d'envoi en arrière-plan (dossier outbox)
+from absences_core import EMAIL_PATTERN, DIGEST_FREQUENCIES, queue_digests, send_scheduled_digests  # Bilans
+import re                                     # Séparation des destinataires
 # ------- Fichier de configuration -------
 import configparser                  # Pour lire/écrire des fichiers INI contenant les paramètres (ex: email, SMTP, etc.)
 # ------- Gestion du système de fichiers -------
@@ -30,11 +47,17 @@ import os                            # Pour interagir avec le système (fichiers
 
 # ------- Dates et heures -------
 from datetime import datetime        # Pour récupérer ou formater la date et l'heure actuelles
+import time                          # Durée des sauvegardes automatiques
+
+# ------- Stockage compact en colonnes -------
+import bisect                        # Pages du filtre servi localement (recherche dichotomique)
+from array import array              # Tableau d'entiers compact pour les identifiants d'absences
 
 
 class EmailSender(QDialog):
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, subject="Absence Report", message="", mail_queue=None):
         super().__init__(parent)
+        self.mail_queue = mail_queue  # Les emails partent de la file, pas de ce dialogue
         self.setWindowTitle("Send Absence Report via Email")  # Titre de la fenêtre de dialogue
         self.setWindowIcon(parent.windowIcon())  # Utilise l'icône de la fenêtre principale
         self.setModal(True)  # Bloque les interactions avec la fenêtre principale tant que ce dialogue est ouvert
@@ -65,17 +88,18 @@ class EmailSender(QDialog):
         content_layout = QVBoxLayout()  # Layout vertical
 
         # Destinataire
-        self.recipient_label = QLabel("Recipient Email:")
+        self.recipient_label = QLabel("Recipient Email(s), separated by commas:")
         self.recipient_input = QLineEdit()
 
         # Sujet
         self.subject_label = QLabel("Subject:")
-        self.subject_input = QLineEdit("Absence Report")  # Sujet par défaut
+        self.subject_input = QLineEdit(subject)  # Sujet par défaut
 
         # Message
         self.message_label = QLabel("Message:")
         self.message_input = QTextEdit()
         self.message_input.setPlaceholderText("Enter your message here.")  # Aide dans le champ
+        self.message_input.setPlainText(message)  # Rapport pré-rempli (onglet Statistiques)
 
         # Ajouter les champs dans le layout
         content_layout.addWidget(self.recipient_label)
@@ -129,55 +153,665 @@ class EmailSender(QDialog):
             config.write(configfile)
 
     def send_email(self):
-        """Fonction qui prépare et envoie l'email via SMTP"""
+        """Met l'email dans la file d'envoi (un message par destinataire)"""
         # Récupération des données du formulaire
         sender_email = self.sender_email.text().strip()
-        sender_password = self.sender_password.text().strip()
-        recipient = self.recipient_input.text().strip()
+        recipients = [address.strip() for address in re.split(r"[,;]", self.recipient_input.text())
+                      if address.strip()]
         subject = self.subject_input.text().strip()
         message_body = self.message_input.toPlainText().strip()
-        smtp_server = self.smtp_server.text().strip()
-        smtp_port = self.smtp_port.text().strip()
 
         # Vérification des champs obligatoires
-        if not all([sender_email, recipient, subject]):
+        if not all([sender_email, recipients, subject]):
             QMessageBox.warning(self, "Missing Fields", "Please fill all required fields before sending.")
             return
 
         try:
-            msg = MIMEMultipart()  # Crée un email multi-parties
-            msg["From"] = sender_email
-            msg["To"] = recipient
-            msg["Subject"] = subject
+            # Sauvegarde la configuration (lue par la file au moment de l'envoi)
+            self.save_config()
+            self.mail_queue.enqueue(recipients, subject, message_body, sender_email)
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Failed to queue email:\n{str(e)}")
+            return
 
-            # Ajoute le message texte
-            msg.attach(MIMEText(message_body, "plain"))
+        QMessageBox.information(self, "Success",
+                                f"Email queued for {len(recipients)} recipient(s), it will be sent in the background.")
+        self.accept()  # Ferme la boîte de dialogue
 
-            # Ajoute la date d'envoi dans le pied du message
-            current_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            footer = f"\n\nThis email was sent from Absence Management System on {current_date}"
-            msg.attach(MIMEText(message_body + footer, "plain"))
 
-            # Sauvegarde la configuration 
-            self.save_config()
+class SettingsDialog(QDialog):
+    """Paramètres de l'application (sauvegardes automatiques, bilans par email)"""
 
-            try:
-                # Connexion et envoi de l’email via SMTP
-                server = smtplib.SMTP(smtp_server, int(smtp_port))
-                server.starttls()  # Sécurise la connexion
-                server.login(sender_email, sender_password)  # Connexion au serveur SMTP
-                server.send_message(msg)  # Envoi du message
-                server.quit()
-
-                QMessageBox.information(self, "Success", "Email sent successfully!")
-                self.accept()  # Ferme la boîte de dialogue
-            except Exception as e:
-                QMessageBox.critical(self, "Error", f"Failed to send email:\n{str(e)}")
+    def __init__(self, backup_settings, digest_settings, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Paramètres")
+        self.setModal(True)
+
+        layout = QVBoxLayout()
+
+        # ----- Section sauvegardes automatiques -----
+        backup_group = QGroupBox("Sauvegardes automatiques")
+        backup_layout = QFormLayout()
+
+        self.backup_enabled = QCheckBox("Activer")
+        self.backup_enabled.setChecked(backup_settings['enabled'])
+        self.backup_interval = QSpinBox()
+        self.backup_interval.setRange(5, 24 * 60)
+        self.backup_interval.setSuffix(" min")
+        self.backup_interval.setValue(backup_settings['interval'])
+        self.backup_retention = QSpinBox()
+        self.backup_retention.setRange(1, 100)
+        self.backup_retention.setValue(backup_settings['retention'])
+        self.backup_full_every = QSpinBox()
+        self.backup_full_every.setRange(1, 100)
+        self.backup_full_every.setValue(backup_settings['full_every'])
+        self.backup_directory = QLineEdit(backup_settings['directory'])
+        browse_btn = QPushButton("Parcourir...")
+        browse_btn.clicked.connect(self.choose_directory)
+        directory_layout = QHBoxLayout()
+        directory_layout.addWidget(self.backup_directory)
+        directory_layout.addWidget(browse_btn)
+
+        backup_layout.addRow(QLabel("Sauvegarde auto:"), self.backup_enabled)
+        backup_layout.addRow(QLabel("Intervalle:"), self.backup_interval)
+        backup_layout.addRow(QLabel("Chaînes conservées:"), self.backup_retention)
+        backup_layout.addRow(QLabel("Complète toutes les:"), self.backup_full_every)
+        backup_layout.addRow(QLabel("Dossier:"), directory_layout)
+        backup_group.setLayout(backup_layout)
+
+        # ----- Section bilans des absences par email -----
+        digest_group = QGroupBox("Bilans des absences par email")
+        digest_layout = QFormLayout()
+
+        self.digest_enabled = QCheckBox("Activer")
+        self.digest_enabled.setChecked(digest_settings['enabled'])
+        self.digest_frequency = QComboBox()
+        self.digest_frequency.addItems(DIGEST_FREQUENCIES)
+        self.digest_frequency.setCurrentText(digest_settings['frequency'])
+        self.digest_hour = QSpinBox()
+        self.digest_hour.setRange(0, 23)
+        self.digest_hour.setSuffix(" h")
+        self.digest_hour.setValue(digest_settings['hour'])
+        self.digest_recipients = QLineEdit(digest_settings['recipients'])
+        self.digest_recipients.setPlaceholderText("adresses séparées par des virgules")
+        self.digest_students = QCheckBox("Envoyer à chaque étudiant absent son propre bilan")
+        self.digest_students.setChecked(digest_settings['students'])
+
+        digest_layout.addRow(QLabel("Envoi programmé:"), self.digest_enabled)
+        digest_layout.addRow(QLabel("Fréquence:"), self.digest_frequency)
+        digest_layout.addRow(QLabel("À partir de:"), self.digest_hour)
+        digest_layout.addRow(QLabel("Bilans par classe à:"), self.digest_recipients)
+        digest_layout.addRow(QLabel("Étudiants:"), self.digest_students)
+        digest_group.setLayout(digest_layout)
+
+        button_box = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        button_box.accepted.connect(self.accept)
+        button_box.rejected.connect(self.reject)
+
+        layout.addWidget(backup_group)
+        layout.addWidget(digest_group)
+        layout.addWidget(button_box)
+        self.setLayout(layout)
+
+    def choose_directory(self):
+        """Pick the backup directory"""
+        directory = QFileDialog.getExistingDirectory(self, "Dossier des sauvegardes", self.backup_directory.text())
+        if directory:
+            self.backup_directory.setText(directory)
+
+    def backup_settings(self):
+        """Return the edited backup settings"""
+        return {
+            'enabled': self.backup_enabled.isChecked(),
+            'interval': self.backup_interval.value(),
+            'retention': self.backup_retention.value(),
+            'full_every': self.backup_full_every.value(),
+            'directory': self.backup_directory.text().strip() or "backups"
+        }
+
+    def digest_settings(self):
+        """Return the edited digest settings"""
+        return {
+            'enabled': self.digest_enabled.isChecked(),
+            'frequency': self.digest_frequency.currentText(),
+            'hour': self.digest_hour.value(),
+            'recipients': self.digest_recipients.text().strip(),
+            'students': self.digest_students.isChecked()
+        }
+
+
+class RollCallDialog(QDialog):
+    """Appel: saisie des absences de toute une classe pour une date"""
+
+    def __init__(self, load_students, reasons, statuses, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Appel de la classe")
+        self.setModal(True)
+        self.resize(420, 560)
+        self.load_students = load_students  # load_students(classe, date, callback)
+
+        layout = QVBoxLayout()
+        form_layout = QFormLayout()
+
+        self.classe = QComboBox()
+        self.classe.addItems(["BTS1", "BTS2"])
+        self.date = QDateEdit()
+        self.date.setDisplayFormat("yyyy-MM-dd")
+        self.date.setDate(QDate.currentDate())
+        self.reason = QComboBox()
+        self.reason.addItems(reasons)
+        self.status = QComboBox()
+        self.status.addItems(statuses)
+        self.notes = QLineEdit()
+        self.notes.setPlaceholderText("Notes supplémentaires...")
+
+        form_layout.addRow(QLabel("Classe:"), self.classe)
+        form_layout.addRow(QLabel("Date:"), self.date)
+        form_layout.addRow(QLabel("Raison:"), self.reason)
+        form_layout.addRow(QLabel("Statut:"), self.status)
+        form_layout.addRow(QLabel("Notes:"), self.notes)
+
+        # Élèves de la classe: cocher les absents
+        self.students = QListWidget()
+        self.students.itemChanged.connect(self.update_count)
+        self.count_label = QLabel()
+
+        button_box = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        button_box.button(QDialogButtonBox.Ok).setText("Enregistrer")
+        button_box.accepted.connect(self.accept)
+        button_box.rejected.connect(self.reject)
+
+        layout.addLayout(form_layout)
+        layout.addWidget(self.students)
+        layout.addWidget(self.count_label)
+        layout.addWidget(button_box)
+        self.setLayout(layout)
+
+        self.classe.currentTextChanged.connect(self.reload)
+        self.date.dateChanged.connect(self.reload)
+        self.reload()
+
+    def reload(self):
+        """Ask for the students of the selected class"""
+        self.students.clear()
+        self.count_label.setText("Chargement...")
+        self.load_students(self.classe.currentText(), self.date.date().toString("yyyy-MM-dd"),
+                           self.fill_students)
+
+    def fill_students(self, students):
+        """List the students; those already absent that day cannot be checked again"""
+        self.students.blockSignals(True)
+        self.students.clear()
+        for student in students:
+            item = QListWidgetItem(f"{student['nom']} {student['prenom']} ({student['code_massar']})")
+            item.setData(Qt.UserRole, (student['code_massar'], f"{student['nom']} {student['prenom']}"))
+            if student['deja_absent']:
+                item.setText(item.text() + " - déjà absent")
+                item.setFlags(Qt.ItemIsEnabled)
+            else:
+                item.setFlags(Qt.ItemIsEnabled | Qt.ItemIsUserCheckable)
+                item.setCheckState(Qt.Unchecked)
+            self.students.addItem(item)
+        self.students.blockSignals(False)
+        self.update_count()
+
+    def checked_students(self):
+        """(code_massar, nom complet) of the checked students"""
+        return [self.students.item(row).data(Qt.UserRole) for row in range(self.students.count())
+                if self.students.item(row).checkState() == Qt.Checked]
+
+    def update_count(self, item=None):
+        self.count_label.setText(f"{len(self.checked_students())} absent(s) sur {self.students.count()} étudiant(s)")
+
+    def roll_call(self):
+        """Return the entered absences: class, date, reason, status, notes and students"""
+        return {
+            'classe': self.classe.currentText(),
+            'date': self.date.date().toString("yyyy-MM-dd"),
+            'raison': self.reason.currentText(),
+            'statut': self.status.currentText(),
+            'notes': self.notes.text().strip(),
+            'students': self.checked_students()
+        }
+
+
+class StudentPicker(QLineEdit):
+    """Choix d'un étudiant par saisie (code Massar, CIN, nom ou prénom).
+
+    Les suggestions viennent de la recherche par préfixes de l'annuaire des
+    étudiants et alimentent le QCompleter par un petit QStringListModel:
+    seules MAX_SUGGESTIONS lignes existent côté widget, quel que soit le
+    nombre d'étudiants.
+    """
+
+    MAX_SUGGESTIONS = 20
+
+    def __init__(self, directory, parent=None):
+        super().__init__(parent)
+        self.directory = directory  # directory(): annuaire courant (StudentDirectory)
+        self._code = None
+        self._suggestions = {}  # texte affiché -> code Massar
+        self._model = QStringListModel(self)
+        completer = QCompleter(self._model, self)
+        completer.setCompletionMode(QCompleter.UnfilteredPopupCompletion)
+        completer.setMaxVisibleItems(self.MAX_SUGGESTIONS)
+        completer.activated[str].connect(self._choose)
+        self.setCompleter(completer)
+        self.setPlaceholderText("Code Massar, CIN, nom ou prénom...")
+        self.textEdited.connect(self._suggest)
+
+    @staticmethod
+    def display_text(student):
+        return f"{student['code_massar']} - {student['nom']} {student['prenom']}"
+
+    def _suggest(self, text):
+        self._code = None
+        students = self.directory().search(text, self.MAX_SUGGESTIONS)
+        self._suggestions = {self.display_text(student): student['code_massar'] for student in students}
+        self._model.setStringList(list(self._suggestions))
+        # Un code Massar saisi en entier vaut sélection
+        exact = [code for code in self._suggestions.values() if code.lower() == text.strip().lower()]
+        if exact:
+            self._code = exact[0]
+        if students:
+            self.completer().complete()
+
+    def _choose(self, text):
+        self._code = self._suggestions.get(text)
+
+    def current_code(self):
+        """Code Massar of the chosen student, or None"""
+        return self._code
+
+    def set_code(self, code_massar):
+        """Show a student of the directory (None or unknown code: clear)"""
+        student = self.directory().get(code_massar) if code_massar else None
+        self._code = student['code_massar'] if student else None
+        self.setText(self.display_text(student) if student else "")
+
+    def refresh(self):
+        """Follow a change of the directory (student edited, deleted or reloaded)"""
+        self.set_code(self._code)
+
+
+class TaskSignals(QObject):
+    """Signals emitted by DbTask from the worker thread"""
+    finished = pyqtSignal(int, object)
+    failed = pyqtSignal(int, str)
+    progress = pyqtSignal(int, object)
+
+
+class DbTask(QRunnable):
+    """Run a callable on the thread pool and emit its result"""
+
+    def __init__(self, task_id, work, signals, cancelled, with_progress=False):
+        super().__init__()
+        self.task_id = task_id
+        self.work = work
+        self.signals = signals
+        self.cancelled = cancelled  # threading.Event posé par QueryExecutor.cancel
+        self.with_progress = with_progress
+
+    def report(self, value):
+        """Send a progress value to the GUI thread"""
+        self.signals.progress.emit(self.task_id, value)
+
+    def run(self):
+        if self.cancelled.is_set():
+            return
+        try:
+            result = self.work(self.report) if self.with_progress else self.work()
         except Exception as e:
-            QMessageBox.critical(self, "Error", f"Failed to prepare email:\n{str(e)}")
+            self.signals.failed.emit(self.task_id, str(e))
+        else:
+            self.signals.finished.emit(self.task_id, result)
+
+
+class QueryExecutor(QObject):
+    """Exécute les requêtes hors du thread graphique.
+
+    Chaque requête est soumise sous une clé ("students", "absences_count"...);
+    une nouvelle soumission sur la même clé annule la précédente, dont le
+    résultat sera ignoré. Les résultats reviennent par signaux dans le thread
+    graphique, et une barre de progression indique le travail en cours.
+    """
+
+    def __init__(self, status_bar, parent=None):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(4)
+        self.db = None
+        self.signals = TaskSignals()
+        self.signals.finished.connect(self._on_finished)
+        self.signals.failed.connect(self._on_failed)
+        self.signals.progress.connect(self._on_progress)
+        self._next_id = 0
+        self._tasks = {}    # task id -> (key, cancelled event, on_result, on_error, on_progress, on_cancel)
+        self._latest = {}   # key -> id of the most recent task
+
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, 0)  # Indicateur d'activité
+        self.progress_bar.setMaximumWidth(150)
+        self.progress_bar.hide()
+        status_bar.addPermanentWidget(self.progress_bar)
+
+    def set_database(self, db):
+        """Set the DatabasePool used by submit (None when disconnected)"""
+        self.db = db
+
+    def submit(self, key, job, on_result, on_error=None, role="interactive", on_progress=None, retry=False,
+               on_cancel=None):
+        """Run job(connection) on a pooled connection; stale tasks with the same key are cancelled.
+
+        With on_progress, the job is called as job(connection, report) and
+        each report(value) reaches on_progress(value) in the GUI thread.
+        With retry, the job is run again on a fresh connection when the
+        server connection is lost (see DatabasePool.run). Only read-only
+        jobs (pages, counts, statistics, student directory) are safe to run
+        twice: jobs that write (import, restore, backup, digests) keep the
+        default and report the lost connection instead.
+        on_cancel() is called instead of on_result/on_error when the task is
+        cancelled (resubmitted key, disconnection).
+        """
+        db = self.db
+        if on_progress is None:
+            work = lambda: db.run(job, role, retry)
+        else:
+            work = lambda report: db.run(lambda connection: job(connection, report), role, retry)
+        return self.run_in_background(key, work, on_result, on_error, on_progress, on_cancel)
+
+    def run_in_background(self, key, work, on_result, on_error=None, on_progress=None, on_cancel=None):
+        """Run work() in the thread pool (work(report) with on_progress); stale tasks with the same key are cancelled"""
+        self.cancel(key)
+        self._next_id += 1
+        cancelled = threading.Event()
+        self._tasks[self._next_id] = (key, cancelled, on_result, on_error, on_progress, on_cancel)
+        self._latest[key] = self._next_id
+        self.progress_bar.show()
+        self.pool.start(DbTask(self._next_id, work, self.signals, cancelled, on_progress is not None))
+        return self._next_id
+
+    def is_pending(self, key):
+        """Whether a task submitted under key has not finished yet"""
+        return key in self._latest
+
+    def cancel(self, key):
+        """Cancel the pending task for key: a queued task never runs, a running one is ignored.
+
+        Its on_cancel hook, if any, is called instead of the dropped callbacks.
+        """
+        task_id = self._latest.pop(key, None)
+        if task_id is None or task_id not in self._tasks:
+            return
+        entry = self._tasks.pop(task_id)
+        entry[1].set()
+        self._update_progress()
+        if entry[5]:
+            entry[5]()
+
+    def cancel_all(self):
+        """Cancel every pending task (on disconnection)"""
+        for key in list(self._latest):
+            self.cancel(key)
+
+    def _on_finished(self, task_id, result):
+        entry = self._pop(task_id)
+        if entry:
+            entry[2](result)
+
+    def _on_progress(self, task_id, value):
+        entry = self._tasks.get(task_id)
+        if entry and entry[4]:
+            entry[4](value)
+
+    def _on_failed(self, task_id, message):
+        entry = self._pop(task_id)
+        if entry and entry[3]:
+            entry[3](message)
+
+    def _pop(self, task_id):
+        entry = self._tasks.pop(task_id, None)
+        if entry and self._latest.get(entry[0]) == task_id:
+            del self._latest[entry[0]]
+        self._update_progress()
+        return entry
+
+    def _update_progress(self):
+        self.progress_bar.setVisible(bool(self._tasks))
+
+
+class AbsencesTableModel(QAbstractTableModel):
+    """Modèle de la grille des absences: une page de résultats.
+
+    Les lignes de la page sont gardées en colonnes compactes; la couleur du
+    statut est calculée à l'affichage dans data().
+    """
+
+    HEADERS = ["ID", "Code Massar", "Nom", "Date", "Raison", "Statut", "Notes"]
+    STATUS_COLUMN = 5
+    JUSTIFIED_COLOR = QColor(144, 238, 144)    # Light green
+    UNJUSTIFIED_COLOR = QColor(255, 182, 193)  # Light red
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._has_next = False
+        self._clear_columns()
+
+    def _clear_columns(self):
+        """Reset the columnar store"""
+        self._ids = array('l')
+        self._codes = []
+        self._names = []
+        self._dates = []
+        self._reasons = []
+        self._statuses = []
+        self._notes = []
+
+    def set_page(self, rows, has_next=False):
+        """Display a page of tuples (id, code_massar, nom_complet, date_absence, raison, statut, notes)"""
+        self.beginResetModel()
+        self._clear_columns()
+        self._has_next = has_next
+        for absence_id, code, name, date, reason, status, notes in rows:
+            self._ids.append(absence_id)
+            # Les codes, raisons et statuts se répètent beaucoup: on partage les chaînes
+            self._codes.append(sys.intern(code))
+            self._names.append(name)
+            self._dates.append(str(date))
+            self._reasons.append(sys.intern(reason))
+            self._statuses.append(sys.intern(status))
+            self._notes.append(notes or "")
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._ids)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return super().headerData(section, orientation, role)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row, column = index.row(), index.column()
+        if role == Qt.DisplayRole:
+            if column == 0:
+                return str(self._ids[row])
+            return self._columns()[column][row]
+        if role == Qt.BackgroundRole and column == self.STATUS_COLUMN:
+            if self._statuses[row] == "Justifie":
+                return self.JUSTIFIED_COLOR
+            return self.UNJUSTIFIED_COLOR
+        return None
+
+    def _columns(self):
+        return (self._ids, self._codes, self._names, self._dates,
+                self._reasons, self._statuses, self._notes)
+
+    def insert_rows(self, rows):
+        """Insert new absences at their sorted place in the page without reloading.
+
+        Rows sorting after the last row of the page belong to the next page
+        when there is one.
+        """
+        for absence_id, code, name, date, reason, status, notes in rows:
+            key = (str(date), absence_id)
+            # Recherche dichotomique: tri par date puis id décroissants
+            low, high = 0, len(self._ids)
+            while low < high:
+                middle = (low + high) // 2
+                if (self._dates[middle], self._ids[middle]) > key:
+                    low = middle + 1
+                else:
+                    high = middle
+            if low == len(self._ids) and self._has_next:
+                continue
+            self.beginInsertRows(QModelIndex(), low, low)
+            self._ids.insert(low, absence_id)
+            self._codes.insert(low, sys.intern(code))
+            self._names.insert(low, name)
+            self._dates.insert(low, str(date))
+            self._reasons.insert(low, sys.intern(reason))
+            self._statuses.insert(low, sys.intern(status))
+            self._notes.insert(low, notes or "")
+            self.endInsertRows()
+
+    def _remove_matching(self, matches):
+        """Remove the loaded rows for which matches(row) is true"""
+        for row in reversed(range(len(self._ids))):
+            if matches(row):
+                self.beginRemoveRows(QModelIndex(), row, row)
+                for column in self._columns():
+                    del column[row]
+                self.endRemoveRows()
+
+    def remove_ids(self, ids):
+        """Remove the absences with the given ids"""
+        self._remove_matching(lambda row: self._ids[row] in ids)
+
+    def remove_student(self, code_massar):
+        """Remove the absences of a deleted student"""
+        self._remove_matching(lambda row: self._codes[row] == code_massar)
+
+    def patch_student(self, old_code, new_code, name):
+        """Show a student's new code and name on their loaded absences"""
+        for row, code in enumerate(self._codes):
+            if code == old_code:
+                self._codes[row] = sys.intern(new_code)
+                self._names[row] = name
+                self.dataChanged.emit(self.index(row, 1), self.index(row, 2))
+
+    def row_values(self, row):
+        """Return the row as a dict keyed like the absences query"""
+        return {
+            'id': self._ids[row],
+            'code_massar': self._codes[row],
+            'nom_complet': self._names[row],
+            'date_absence': self._dates[row],
+            'raison': self._reasons[row],
+            'statut': self._statuses[row],
+            'notes': self._notes[row],
+        }
+
+
+class KeysetPager:
+    """Pagination par clé (seek) avec cache des pages déjà lues.
+
+    fetch(after, before, limit, callback) demande au plus `limit` lignes dans
+    l'ordre d'affichage: celles qui suivent la clé `after` (None: depuis le
+    début) ou, si `before` est donné, celles qui la précèdent; elle appelle
+    callback(rows) quand elles sont disponibles. key(row) donne la clé de tri
+    d'une ligne et show(rows, page, has_previous, has_next) affiche la page.
+    Aucune requête n'utilise OFFSET: chaque page coûte autant que la première.
+    """
+
+    PAGE_SIZES = [50, 100, 200, 500]
+    MAX_CACHED_PAGES = 20
+
+    def __init__(self, fetch, key, show, page_size=100):
+        self.fetch = fetch
+        self.key = key
+        self.show = show
+        self.page_size = page_size
+        self._generation = 0
+        self._pages = {}  # numéro -> (lignes, page suivante?)
+        self.page = 0
+        self.rows = []
+        self.has_next = False
+
+    def first(self):
+        """Drop the cache and show the first page"""
+        self._generation += 1
+        self._pages = {}
+        self.page = 0
+        self.rows = []
+        self._request(0, None, None)
+
+    def set_page_size(self, page_size):
+        self.page_size = page_size
+        self.first()
+
+    def invalidate(self):
+        """Forget the cached pages (data changed); the current page stays displayed"""
+        self._pages = {}
+
+    def next(self):
+        if self.page + 1 in self._pages:
+            self._display(self.page + 1)
+        elif self.rows and self.has_next:
+            self._request(self.page + 1, self.key(self.rows[-1]), None)
+
+    def previous(self):
+        if self.page == 0:
+            return
+        if self.page - 1 in self._pages:
+            self._display(self.page - 1)
+        elif self.rows:
+            self._request(self.page - 1, None, self.key(self.rows[0]))
+
+    def _request(self, page, after, before):
+        generation = self._generation
+        # Une ligne de plus pour savoir s'il reste une page dans ce sens
+        self.fetch(after, before, self.page_size + 1,
+                   lambda rows: self._received(generation, page, before is not None, rows))
+
+    def _received(self, generation, page, backwards, rows):
+        if generation != self._generation:
+            return  # Réponse pour une ancienne source
+        more = len(rows) > self.page_size
+        if backwards:
+            rows = rows[-self.page_size:]
+            if not more:
+                page = 0  # Revenu au début: la numérotation repart de 1
+            self._store(page, rows, True)
+        else:
+            rows = rows[:self.page_size]
+            if not rows and page > 0:
+                self._store(page - 1, self.rows, False)  # Plus rien après la page affichée
+                page -= 1
+            else:
+                self._store(page, rows, more)
+        self._display(page)
+
+    def _store(self, page, rows, has_next):
+        self._pages[page] = (rows, has_next)
+        while len(self._pages) > self.MAX_CACHED_PAGES:
+            del self._pages[max(self._pages, key=lambda cached: abs(cached - page))]
+
+    def _display(self, page):
+        self.page = page
+        self.rows, self.has_next = self._pages[page]
+        self.show(self.rows, page, page > 0, self.has_next)
 
 
 class AbsenceApp(QMainWindow):
+    FILTER_DELAY_MS = 300  # Pause de saisie avant d'appliquer le filtre des absences
+    LOCAL_FILTER_ROWS = 5000  # Au-delà, le résultat d'un filtre reste paginé sur le serveur
+
     def __init__(self):
         super().__init__()
         self.setup_ui()
@@ -186,10 +820,51 @@ class AbsenceApp(QMainWindow):
         self.create_toolbar()
         self.setup_icon()
         
-        # Database connection
-        self.db_connection = None
-        self.cursor = None
-        
+        # Database connection pools
+        self.db = None
+        self.last_stats = None  # Dernières statistiques générées (rapport, CSV, email)
+        self._absences_spec = None  # Filtre affiché dans la grille (AbsenceFilter)
+        self._absences_loaded = None  # Dernier résultat complet: {'spec', 'rows': [(ligne, classe)]}
+        self._absences_rows = None  # Lignes du filtre affiché quand il est servi localement
+        self._absences_keys = []
+        self.data_version = None  # Version des données au dernier chargement complet
+        self.students = StudentDirectory()  # Chargé à la connexion, tenu à jour localement
+        self.query_cache = QueryCache()  # Filtres, statistiques et exports déjà lus
+        
+        # Requêtes en arrière-plan (connexions empruntées aux pools)
+        self.executor = QueryExecutor(self.status_bar, self)
+        
+        # Sauvegardes automatiques (paramètres lus dans app_config.ini)
+        self.backup_settings = {
+            'enabled': True,
+            'interval': 60,
+            'retention': 20,
+            'full_every': 7,
+            'directory': "backups"
+        }
+        self.backup_started = None  # Début de la sauvegarde en cours (jamais deux à la fois)
+        self.backup_timer = QTimer(self)
+        self.backup_timer.timeout.connect(self.auto_save_backup)
+        
+        # Emails en attente (dossier outbox), envoyés en arrière-plan
+        self.mail_queue = MailQueue("outbox")
+        self.mail_error = None  # Dernière erreur d'envoi signalée (pas de répétition à chaque passage)
+        self.mail_timer = QTimer(self)
+        self.mail_timer.timeout.connect(self.flush_mail)
+        self.mail_timer.start(60 * 1000)
+        
+        # Bilans des absences envoyés par email selon un calendrier
+        self.digest_settings = {
+            'enabled': False,
+            'frequency': "hebdomadaire",
+            'hour': 7,
+            'recipients': "",
+            'students': True
+        }
+        self.digests_sent = None  # Dernière période envoyée (ou déjà envoyée par un autre poste)
+        self.digest_timer = QTimer(self)
+        self.digest_timer.timeout.connect(self.check_digests)
+        self.digest_timer.start(10 * 60 * 1000)
         
         # Load last session
         self.load_last_session()
@@ -228,10 +903,22 @@ class AbsenceApp(QMainWindow):
         # File menu
         file_menu = menubar.addMenu("Fichier")
         
+        import_action = QAction("Importer CSV...", self)
+        import_action.triggered.connect(self.import_csv_file)
+        file_menu.addAction(import_action)
+        
         export_action = QAction("Exporter données", self)
         export_action.triggered.connect(self.export_data)
         file_menu.addAction(export_action)
         
+        backup_action = QAction("Sauvegarder maintenant", self)
+        backup_action.triggered.connect(self.auto_save_backup)
+        file_menu.addAction(backup_action)
+        
+        restore_action = QAction("Restaurer une sauvegarde...", self)
+        restore_action.triggered.connect(self.restore_backup)
+        file_menu.addAction(restore_action)
+        
         file_menu.addSeparator()
         
         exit_action = QAction("Quitter", self)
@@ -245,6 +932,14 @@ class AbsenceApp(QMainWindow):
         email_action.triggered.connect(self.open_email_dialog)
         tools_menu.addAction(email_action)
         
+        rollup_action = QAction("Reconstruire les statistiques", self)
+        rollup_action.triggered.connect(self.rebuild_stats_rollup)
+        tools_menu.addAction(rollup_action)
+        
+        verify_action = QAction("Vérifier les sauvegardes", self)
+        verify_action.triggered.connect(self.verify_backups)
+        tools_menu.addAction(verify_action)
+        
         settings_action = QAction("Paramètres", self)
         settings_action.triggered.connect(self.open_settings)
         tools_menu.addAction(settings_action)
@@ -332,12 +1027,15 @@ class AbsenceApp(QMainWindow):
         self.student_cin = QLineEdit()
         self.student_class = QComboBox()
         self.student_class.addItems(["BTS1", "BTS2"])
+        self.student_email = QLineEdit()
+        self.student_email.setPlaceholderText("Facultatif: bilans des absences par email")
         
         form_layout.addRow(QLabel("Code Massar:"), self.student_code_massar)
         form_layout.addRow(QLabel("Nom:"), self.student_name)
         form_layout.addRow(QLabel("Prénom:"), self.student_prenom)
         form_layout.addRow(QLabel("CIN:"), self.student_cin)
         form_layout.addRow(QLabel("Classe:"), self.student_class)
+        form_layout.addRow(QLabel("Email:"), self.student_email)
         form_group.setLayout(form_layout)
         
         # Action buttons
@@ -359,10 +1057,16 @@ class AbsenceApp(QMainWindow):
         btn_layout.addWidget(view_btn)
         btn_layout.addWidget(export_btn)
         
-        # Students table
+        # Students table, one page at a time
+        self.students_pager = KeysetPager(
+            self.fetch_students_page,
+            StudentDirectory.sort_key,
+            self.show_students
+        )
+        students_nav_layout, self.students_nav = self.create_pager_bar(self.students_pager)
         self.students_table = QTableWidget()
-        self.students_table.setColumnCount(5)
-        self.students_table.setHorizontalHeaderLabels(["Code Massar", "CIN", "Nom", "Prénom", "Classe"])
+        self.students_table.setColumnCount(6)
+        self.students_table.setHorizontalHeaderLabels(["Code Massar", "CIN", "Nom", "Prénom", "Classe", "Email"])
         self.students_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
         self.students_table.setSelectionBehavior(QTableWidget.SelectRows)
         self.students_table.setSelectionMode(QTableWidget.SingleSelection)
@@ -371,6 +1075,7 @@ class AbsenceApp(QMainWindow):
         layout.addWidget(form_group)
         layout.addLayout(btn_layout)
         layout.addWidget(self.students_table)
+        layout.addLayout(students_nav_layout)
         
         tab.setLayout(layout)
         return tab
@@ -384,7 +1089,7 @@ class AbsenceApp(QMainWindow):
         form_group = QGroupBox("Enregistrer une absence")
         form_layout = QFormLayout()
         
-        self.absence_student = QComboBox()
+        self.absence_student = StudentPicker(lambda: self.students)
         self.absence_date = QDateEdit()
         self.absence_date.setDisplayFormat("yyyy-MM-dd")
         self.absence_date.setDate(QDate.currentDate())
@@ -426,7 +1131,16 @@ class AbsenceApp(QMainWindow):
         filter_layout.addWidget(QLabel("À:"))
         filter_layout.addWidget(self.filter_date_to)
         
-        filter_btn = QPushButton("Filtrer")
+        # Filtrage en direct, appliqué après une pause dans les changements
+        self.filter_timer = QTimer(self)
+        self.filter_timer.setSingleShot(True)
+        self.filter_timer.setInterval(self.FILTER_DELAY_MS)
+        self.filter_timer.timeout.connect(self.filter_absences)
+        for signal in (self.filter_class.currentIndexChanged, self.filter_status.currentIndexChanged,
+                       self.filter_date_from.dateChanged, self.filter_date_to.dateChanged):
+            signal.connect(lambda *args: self.filter_timer.start())
+        
+        filter_btn = QPushButton("Filtrer")  # Relit toujours la base
         filter_btn.clicked.connect(self.view_absences)
         filter_layout.addWidget(filter_btn)
         
@@ -436,6 +1150,8 @@ class AbsenceApp(QMainWindow):
         btn_layout = QHBoxLayout()
         add_btn = QPushButton("Enregistrer")
         add_btn.clicked.connect(self.add_absence)
+        roll_call_btn = QPushButton("Appel de la classe")
+        roll_call_btn.clicked.connect(self.open_roll_call)
         update_btn = QPushButton("Modifier")
         update_btn.clicked.connect(self.update_absence)
         delete_btn = QPushButton("Supprimer")
@@ -446,24 +1162,37 @@ class AbsenceApp(QMainWindow):
         export_btn.clicked.connect(self.export_absences_csv)
         
         btn_layout.addWidget(add_btn)
+        btn_layout.addWidget(roll_call_btn)
         btn_layout.addWidget(update_btn)
         btn_layout.addWidget(delete_btn)
         btn_layout.addWidget(view_btn)
         btn_layout.addWidget(export_btn)
         
-        # Absences table
-        self.absences_table = QTableWidget()
-        self.absences_table.setColumnCount(7)
-        self.absences_table.setHorizontalHeaderLabels(["ID", "Code Massar", "Nom", "Date", "Raison", "Statut", "Notes"])
+        # Absences table (model/view), one page at a time
+        self.absences_pager = KeysetPager(
+            self.fetch_absences_page,
+            lambda absence: (absence[3], absence[0]),  # (date_absence, id)
+            self.show_absences_page
+        )
+        absences_nav_layout, self.absences_nav = self.create_pager_bar(self.absences_pager)
+        self.absences_model = AbsencesTableModel(self)
+        # Une modification locale de la page rend les autres pages en cache périmées
+        # (les écritures appellent aussi absences_changed elles-mêmes)
+        for signal in (self.absences_model.rowsInserted, self.absences_model.rowsRemoved,
+                       self.absences_model.dataChanged):
+            signal.connect(lambda *args: self.absences_changed())
+        self.absences_table = QTableView()
+        self.absences_table.setModel(self.absences_model)
         self.absences_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
-        self.absences_table.setSelectionBehavior(QTableWidget.SelectRows)
-        self.absences_table.setSelectionMode(QTableWidget.SingleSelection)
-        self.absences_table.cellClicked.connect(self.absence_table_clicked)
+        self.absences_table.setSelectionBehavior(QTableView.SelectRows)
+        self.absences_table.setSelectionMode(QTableView.SingleSelection)
+        self.absences_table.clicked.connect(self.absence_table_clicked)
         
         layout.addWidget(form_group)
         layout.addWidget(filter_group)
         layout.addLayout(btn_layout)
         layout.addWidget(self.absences_table)
+        layout.addLayout(absences_nav_layout)
         
         tab.setLayout(layout)
         return tab
@@ -501,6 +1230,18 @@ class AbsenceApp(QMainWindow):
         generate_btn.clicked.connect(self.generate_stats)
         stats_layout.addWidget(generate_btn)
         
+        export_btn = QPushButton("Exporter CSV")
+        export_btn.clicked.connect(self.export_stats_csv)
+        stats_layout.addWidget(export_btn)
+        
+        email_btn = QPushButton("Envoyer par email")
+        email_btn.clicked.connect(self.email_stats)
+        stats_layout.addWidget(email_btn)
+        
+        digest_btn = QPushButton("Envoyer les bilans")
+        digest_btn.clicked.connect(self.send_digests)
+        stats_layout.addWidget(digest_btn)
+        
         stats_group.setLayout(stats_layout)
         
         # Statistics display
@@ -515,68 +1256,79 @@ class AbsenceApp(QMainWindow):
     
     def connect_db(self):
         """Connect to the database"""
+        params = {
+            'host': self.host_input.text(),
+            'user': self.user_input.text(),
+            'password': self.password_input.text(),
+            'database': self.db_input.text()
+        }
+        self.update_status("Connexion en cours...")
+        self.executor.run_in_background(
+            "connect",
+            lambda: self.open_database(params),
+            self.on_connected,
+            self.on_connect_failed
+        )
+    
+    def open_database(self, params):
+        """Worker side of connect_db: open the connection pools and migrate the schema.
+
+        Returns the pools and a warning when a hot query plan needs attention.
+        """
+        db = DatabasePool(**params)
         try:
-            self.db_connection = mysql.connector.connect(
-                host=self.host_input.text(),
-                user=self.user_input.text(),
-                password=self.password_input.text(),
-                database=self.db_input.text()
-            )
-            self.cursor = self.db_connection.cursor(dictionary=True)
-            self.create_tables()
-            self.load_students()
-            self.view_students()
-            self.view_absences()
+            db.run(migrate, retry=False)
+            students = db.run(StudentDirectory.load)
+            try:
+                db.run(check_query_plans)
+            except QueryPlanError as e:
+                return db, students, str(e)
+        except BaseException:
+            db.close()  # on_connect_failed ne reçoit que le message
+            raise
+        return db, students, None
+    
+    def on_connected(self, result):
+        """Finish connect_db once the worker has opened the pools"""
+        db, students, plan_warning = result
+        self.data_version = students.version  # Lue dans l'instantané de l'annuaire
+        if plan_warning:
+            print(f"Plans de requêtes à vérifier:\n{plan_warning}")
+        if self.db:
+            self.db.close()
+        self.db = db
+        self.executor.set_database(db)
+        self.query_cache.clear()
+        self.apply_backup_settings()
+        self.check_digests()
+        self.show_directory(students)
+        self.view_absences()
+        if plan_warning:
+            self.update_status("Connecté — index manquants pour certaines requêtes (voir la console)")
+        else:
             self.update_status("Connecté à la base de données")
+        
+        # Enable tabs after successful connection
+        for i in range(1, self.tabs.count()):
+            self.tabs.setTabEnabled(i, True)
             
-            # Enable tabs after successful connection
-            for i in range(1, self.tabs.count()):
-                self.tabs.setTabEnabled(i, True)
-                
-            QMessageBox.information(self, "Succès", "Connexion réussie!")
-        except Error as e:
-            self.update_status("Échec de connexion")
-            QMessageBox.critical(self, "Erreur", f"Échec de connexion: {str(e)}")
+        QMessageBox.information(self, "Succès", "Connexion réussie!")
     
-    def create_tables(self):
-        """Create database tables if they don't exist"""
-        try:
-            self.cursor.execute("""
-                CREATE TABLE IF NOT EXISTS etudiants (
-                    code_massar VARCHAR(50) PRIMARY KEY,
-                    cin VARCHAR(50),
-                    nom VARCHAR(100) NOT NULL,
-                    prenom VARCHAR(100) NOT NULL,
-                    classe VARCHAR(20) NOT NULL,
-                    date_ajout TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            self.cursor.execute("""
-                CREATE TABLE IF NOT EXISTS absences (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    code_massar VARCHAR(50) NOT NULL,
-                    date_absence DATE NOT NULL,
-                    raison VARCHAR(100) NOT NULL,
-                    statut VARCHAR(20) NOT NULL,
-                    notes TEXT,
-                    date_ajout TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (code_massar) REFERENCES etudiants(code_massar)
-                    ON DELETE CASCADE
-                )
-            """)
-            self.db_connection.commit()
-            self.update_status("Tables créées avec succès")
-        except Error as e:
-            self.update_status("Erreur création tables")
-            QMessageBox.critical(self, "Erreur", f"Échec création tables: {str(e)}")
+    def on_connect_failed(self, message):
+        """Report a failed connect_db"""
+        self.update_status("Échec de connexion")
+        QMessageBox.critical(self, "Erreur", f"Échec de connexion: {message}")
     
     def disconnect_db(self):
         """Disconnect from the database"""
         try:
-            if self.cursor:
-                self.cursor.close()
-            if self.db_connection and self.db_connection.is_connected():
-                self.db_connection.close()
+            self.backup_timer.stop()
+            self.executor.cancel_all()
+            self.backup_started = None  # Rappels de la sauvegarde annulée abandonnés
+            self.executor.set_database(None)
+            if self.db:
+                self.db.close()
+            self.db = None
             self.update_status("Déconnecté de la base de données")
             
             # Disable tabs after disconnection
@@ -590,7 +1342,7 @@ class AbsenceApp(QMainWindow):
     
     def add_student(self):
         """Add a new student to the database"""
-        if not self.db_connection:
+        if not self.db:
             QMessageBox.warning(self, "Erreur", "Veuillez vous connecter d'abord")
             return
             
@@ -599,32 +1351,47 @@ class AbsenceApp(QMainWindow):
         prenom = self.student_prenom.text().strip()
         cin = self.student_cin.text().strip()
         classe = self.student_class.currentText()
+        email = self.student_email.text().strip() or None
         
         if not nom or not prenom or not classe:
             QMessageBox.warning(self, "Erreur", "Veuillez remplir tous les champs obligatoires")
             return
             
+        if email and not EMAIL_PATTERN.match(email):
+            QMessageBox.warning(self, "Erreur", "Adresse email invalide")
+            return
+            
         if not code_massar:
             code_massar = f"{nom[:3]}{prenom[:3]}{cin[-4:]}" if cin else f"{nom[:3]}{prenom[:3]}"
             
         try:
-            self.cursor.execute(
-                "INSERT INTO etudiants (code_massar, cin, nom, prenom, classe) VALUES (%s, %s, %s, %s, %s)",
-                (code_massar, cin, nom, prenom, classe)
-            )
-            self.db_connection.commit()
+            with self.db.transaction() as cursor:
+                stale = data_version(cursor) != self.data_version
+                cursor.execute(
+                    "INSERT INTO etudiants (code_massar, cin, nom, prenom, classe, email) "
+                    "VALUES (%s, %s, %s, %s, %s, %s)",
+                    (code_massar, cin, nom, prenom, classe, email)
+                )
+                version = data_version(cursor)
+                fingerprint = StudentDirectory.read_fingerprint(cursor)
+            self.query_cache.bump("etudiants")
             self.update_status(f"Étudiant {nom} {prenom} ajouté avec succès")
             QMessageBox.information(self, "Succès", "Étudiant ajouté avec succès!")
             self.clear_student_form()
-            self.load_students()
-            self.view_students()
+            if stale:
+                self.refresh_views()
+            else:
+                self.data_version = version
+                self.students.fingerprint = fingerprint
+                self.put_student_locally(None, {'code_massar': code_massar, 'cin': cin, 'nom': nom,
+                                                'prenom': prenom, 'classe': classe, 'email': email})
         except Error as e:
             self.update_status("Erreur d'ajout étudiant")
             QMessageBox.critical(self, "Erreur", f"Échec d'ajout: {str(e)}")
     
     def update_student(self):
         """Update an existing student"""
-        if not self.db_connection:
+        if not self.db:
             QMessageBox.warning(self, "Erreur", "Veuillez vous connecter d'abord")
             return
             
@@ -634,34 +1401,61 @@ class AbsenceApp(QMainWindow):
             return
             
         old_code = self.students_table.item(selected_row, 0).text()
+        old_classe = self.students_table.item(selected_row, 4).text()
         new_code = self.student_code_massar.text().strip()
         nom = self.student_name.text().strip()
         prenom = self.student_prenom.text().strip()
         cin = self.student_cin.text().strip()
         classe = self.student_class.currentText()
+        email = self.student_email.text().strip() or None
         
         if not nom or not prenom or not classe:
             QMessageBox.warning(self, "Erreur", "Veuillez remplir tous les champs obligatoires")
             return
             
+        if email and not EMAIL_PATTERN.match(email):
+            QMessageBox.warning(self, "Erreur", "Adresse email invalide")
+            return
+            
         try:
-            self.cursor.execute(
-                "UPDATE etudiants SET code_massar=%s, cin=%s, nom=%s, prenom=%s, classe=%s WHERE code_massar=%s",
-                (new_code, cin, nom, prenom, classe, old_code)
-            )
-            self.db_connection.commit()
+            with self.db.transaction() as cursor:
+                stale = data_version(cursor) != self.data_version
+                # Un changement de classe déplace les absences de l'étudiant dans le cumul journalier
+                keys = rollup_keys(cursor, "a.code_massar = %s", (old_code,))
+                cursor.execute(
+                    "UPDATE etudiants SET code_massar=%s, cin=%s, nom=%s, prenom=%s, classe=%s, email=%s "
+                    "WHERE code_massar=%s",
+                    (new_code, cin, nom, prenom, classe, email, old_code)
+                )
+                keys |= rollup_keys(cursor, "a.code_massar = %s", (new_code,))
+                refresh_rollup(cursor, keys)
+                if new_code != old_code:
+                    record_deletion(cursor, "etudiants", old_code)
+                version = data_version(cursor)
+                fingerprint = StudentDirectory.read_fingerprint(cursor)
+            self.query_cache.bump("etudiants", "absences")  # Code Massar propagé aux absences
+            self.absences_changed()
             self.update_status(f"Étudiant {nom} {prenom} mis à jour")
             QMessageBox.information(self, "Succès", "Étudiant mis à jour avec succès!")
             self.clear_student_form()
-            self.load_students()
-            self.view_students()
+            if stale:
+                self.refresh_views()
+                return
+            self.data_version = version
+            self.students.fingerprint = fingerprint
+            self.put_student_locally(old_code, {'code_massar': new_code, 'cin': cin, 'nom': nom,
+                                                'prenom': prenom, 'classe': classe, 'email': email})
+            if classe != old_classe and self.filter_class.currentText() != "Toutes":
+                self.view_absences()  # Ses absences entrent dans le filtre de classe ou en sortent
+            else:
+                self.absences_model.patch_student(old_code, new_code, f"{nom} {prenom}")
         except Error as e:
             self.update_status("Erreur de mise à jour étudiant")
             QMessageBox.critical(self, "Erreur", f"Échec de mise à jour: {str(e)}")
     
     def delete_student(self):
         """Delete a student from the database"""
-        if not self.db_connection:
+        if not self.db:
             QMessageBox.warning(self, "Erreur", "Veuillez vous connecter d'abord")
             return
             
@@ -682,13 +1476,26 @@ class AbsenceApp(QMainWindow):
         
         if reply == QMessageBox.Yes:
             try:
-                self.cursor.execute("DELETE FROM etudiants WHERE code_massar=%s", (code_massar,))
-                self.db_connection.commit()
+                with self.db.transaction() as cursor:
+                    stale = data_version(cursor) != self.data_version
+                    keys = rollup_keys(cursor, "a.code_massar = %s", (code_massar,))
+                    cursor.execute("DELETE FROM etudiants WHERE code_massar=%s", (code_massar,))
+                    refresh_rollup(cursor, keys)
+                    record_deletion(cursor, "etudiants", code_massar)
+                    version = data_version(cursor)
+                    fingerprint = StudentDirectory.read_fingerprint(cursor)
+                self.query_cache.bump("etudiants", "absences")  # Absences supprimées en cascade
+                self.absences_changed()
                 self.update_status(f"Étudiant {nom} {prenom} supprimé")
                 QMessageBox.information(self, "Succès", "Étudiant supprimé avec succès!")
                 self.clear_student_form()
-                self.load_students()
-                self.view_students()
+                if stale:
+                    self.refresh_views()
+                else:
+                    self.data_version = version
+                    self.students.fingerprint = fingerprint
+                    self.remove_student_locally(code_massar)
+                    self.absences_model.remove_student(code_massar)  # Supprimées en cascade
             except Error as e:
                 self.update_status("Erreur de suppression étudiant")
                 QMessageBox.critical(self, "Erreur", f"Échec de suppression: {str(e)}")
@@ -700,12 +1507,14 @@ class AbsenceApp(QMainWindow):
         nom = self.students_table.item(row, 2).text()
         prenom = self.students_table.item(row, 3).text()
         classe = self.students_table.item(row, 4).text()
+        email = self.students_table.item(row, 5).text()
         
         self.student_code_massar.setText(code_massar)
         self.student_name.setText(nom)
         self.student_prenom.setText(prenom)
         self.student_cin.setText(cin)
         self.student_class.setCurrentText(classe)
+        self.student_email.setText(email)
     
     def clear_student_form(self):
         """Clear the student form fields"""
@@ -713,127 +1522,351 @@ class AbsenceApp(QMainWindow):
         self.student_name.clear()
         self.student_prenom.clear()
         self.student_cin.clear()
+        self.student_email.clear()
     
     def view_students(self):
-        """Display all students in the table"""
-        if not self.db_connection:
+        """Display the first page of students in the table (revalidating the directory)"""
+        if not self.db:
             QMessageBox.warning(self, "Erreur", "Veuillez vous connecter d'abord")
             return
             
-        try:
-            self.cursor.execute("SELECT code_massar, cin, nom, prenom, classe FROM etudiants ORDER BY nom, prenom")
-            students = self.cursor.fetchall()
-            
-            self.students_table.setRowCount(len(students))
-            for row, student in enumerate(students):
-                self.students_table.setItem(row, 0, QTableWidgetItem(student['code_massar']))
-                self.students_table.setItem(row, 1, QTableWidgetItem(student['cin']))
-                self.students_table.setItem(row, 2, QTableWidgetItem(student['nom']))
-                self.students_table.setItem(row, 3, QTableWidgetItem(student['prenom']))
-                self.students_table.setItem(row, 4, QTableWidgetItem(student['classe']))
-            
-            self.students_table.resizeColumnsToContents()
-            self.update_status(f"{len(students)} étudiants chargés")
-        except Error as e:
-            self.update_status("Erreur de chargement étudiants")
-            QMessageBox.critical(self, "Erreur", f"Échec de récupération: {str(e)}")
+        self.load_students()
+    
+    def fetch_students_page(self, after, before, limit, callback):
+        """Serve a page of students to students_pager from the student directory"""
+        callback(self.students.page(after, before, limit))
+    
+    def show_students(self, students, page, has_previous, has_next):
+        """Fill the students table with a page fetched by students_pager"""
+        self.students_table.setRowCount(len(students))
+        for row, student in enumerate(students):
+            self.set_student_row(row, student)
+        
+        self.students_table.resizeColumnsToContents()
+        self.update_pager_bar(self.students_nav, self.students_pager)
+    
+    def create_pager_bar(self, pager):
+        """Previous/next buttons, page label and page size selector of a KeysetPager"""
+        nav_layout = QHBoxLayout()
+        nav = {
+            'previous': QPushButton("◀ Précédent"),
+            'label': QLabel("Page 1"),
+            'next': QPushButton("Suivant ▶"),
+            'total': None
+        }
+        nav['previous'].clicked.connect(pager.previous)
+        nav['next'].clicked.connect(pager.next)
+        nav['previous'].setEnabled(False)
+        nav['next'].setEnabled(False)
+        page_size = QComboBox()
+        page_size.addItems([str(size) for size in pager.PAGE_SIZES])
+        page_size.setCurrentText(str(pager.page_size))
+        page_size.currentTextChanged.connect(lambda size: self.db and pager.set_page_size(int(size)))
+        
+        nav_layout.addWidget(nav['previous'])
+        nav_layout.addWidget(nav['label'])
+        nav_layout.addWidget(nav['next'])
+        nav_layout.addStretch()
+        nav_layout.addWidget(QLabel("Lignes par page:"))
+        nav_layout.addWidget(page_size)
+        return nav_layout, nav
+    
+    def update_pager_bar(self, nav, pager):
+        """Show the page number (and count when known) of a pager"""
+        text = f"Page {pager.page + 1}"
+        if nav['total'] is not None:
+            pages = max(1, -(-nav['total'] // pager.page_size))
+            text += f" / {pages} ({nav['total']} lignes)"
+        nav['label'].setText(text)
+        nav['previous'].setEnabled(pager.page > 0)
+        nav['next'].setEnabled(pager.has_next)
+    
+    def set_student_row(self, row, student):
+        """Write a student dict into a row of the students table"""
+        self.students_table.setItem(row, 0, QTableWidgetItem(student['code_massar']))
+        self.students_table.setItem(row, 1, QTableWidgetItem(student['cin']))
+        self.students_table.setItem(row, 2, QTableWidgetItem(student['nom']))
+        self.students_table.setItem(row, 3, QTableWidgetItem(student['prenom']))
+        self.students_table.setItem(row, 4, QTableWidgetItem(student['classe']))
+        self.students_table.setItem(row, 5, QTableWidgetItem(student.get('email') or ""))
+    
+    def put_student_locally(self, old_code, student):
+        """Insert or replace (old_code) a student in the directory, the table and the picker"""
+        chosen = self.absence_student.current_code()
+        self.remove_student_locally(old_code or student['code_massar'])
+        self.students.put(student)
+        key = StudentDirectory.sort_key(student)
+        
+        row = 0
+        while row < self.students_table.rowCount() and StudentDirectory.sort_key(
+                self.students.get(self.students_table.item(row, 0).text())) < key:
+            row += 1
+        if row < self.students_table.rowCount() or not self.students_pager.has_next:
+            self.students_table.insertRow(row)  # Sinon il appartient à une page suivante
+            self.set_student_row(row, student)
+        
+        if chosen == (old_code or student['code_massar']):
+            self.absence_student.set_code(student['code_massar'])
+        self.students_nav['total'] = len(self.students)
+        self.update_pager_bar(self.students_nav, self.students_pager)
+    
+    def remove_student_locally(self, code_massar):
+        """Remove a student from the directory, the table and the picker"""
+        self.students.remove(code_massar)
+        for row in range(self.students_table.rowCount()):
+            if self.students_table.item(row, 0).text() == code_massar:
+                self.students_table.removeRow(row)
+                break
+        self.absence_student.refresh()
+        self.students_pager.invalidate()
+    
+    def refresh_views(self):
+        """Reload everything (the data was changed from another computer)"""
+        self.query_cache.bump()
+        self.view_students()
+        self.view_absences()
     
     def load_students(self):
-        """Load students into the absence form dropdown"""
-        if not self.db_connection:
+        """Revalidate the student directory, reloading it only when its fingerprint changed"""
+        if not self.db:
             return
             
-        try:
-            self.cursor.execute("SELECT code_massar, nom, prenom FROM etudiants ORDER BY nom, prenom")
-            students = self.cursor.fetchall()
-            
-            self.absence_student.clear()
-            for student in students:
-                display_text = f"{student['code_massar']} - {student['nom']} {student['prenom']}"
-                self.absence_student.addItem(display_text, student['code_massar'])
-        except Error as e:
-            self.update_status("Erreur chargement liste étudiants")
-            print(f"Erreur chargement étudiants: {str(e)}")
-            
+        fingerprint = self.students.fingerprint
+        
+        def job(connection):
+            cursor = connection.cursor(dictionary=True)
+            changed = StudentDirectory.read_fingerprint(cursor) != fingerprint
+            version = data_version(cursor)
+            cursor.close()
+            connection.commit()  # Termine la transaction implicite avant l'instantané de load()
+            if changed:
+                directory = StudentDirectory.load(connection)
+                return directory, directory.version
+            return None, version
+        
+        self.executor.submit(
+            "students",
+            job,
+            self.on_students_loaded,
+            lambda message: self.report_error("Erreur de chargement étudiants", f"Échec de récupération: {message}"),
+            retry=True
+        )
+    
+    def on_students_loaded(self, result):
+        """Finish load_students: swap in the reloaded directory, if any, and show it"""
+        students, self.data_version = result
+        self.show_directory(students or self.students)
+    
+    def show_directory(self, students):
+        """Use a student directory for the students table and the absence form dropdown"""
+        if students is not self.students:
+            self.students = students
+            self.absence_student.refresh()
+        self.students_nav['total'] = len(students)
+        self.students_pager.first()
+        self.update_status(f"{len(students)} étudiants chargés")
+    
+    def fetch_all(self, connection, query, params=()):
+        """Worker job: run a SELECT and return all rows as dicts"""
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute(query, params)
+        rows = cursor.fetchall()
+        cursor.close()
+        return rows
+    
+    def report_error(self, status, message):
+        """Show a failed background operation in the status bar and a dialog"""
+        self.update_status(status)
+        QMessageBox.critical(self, "Erreur", message)
         
     
     def add_absence(self):
         """Add a new absence record"""
-        if not self.db_connection:
+        if not self.db:
             QMessageBox.warning(self, "Erreur", "Veuillez vous connecter d'abord")
             return
             
-        if self.absence_student.count() == 0:
-            QMessageBox.warning(self, "Erreur", "Aucun étudiant disponible")
+        code_massar = self.absence_student.current_code()
+        if code_massar is None:
+            QMessageBox.warning(self, "Erreur", "Veuillez choisir un étudiant dans les suggestions")
             return
             
-        code_massar = self.absence_student.currentData()
         date = self.absence_date.date().toString("yyyy-MM-dd")
         reason = self.absence_reason.currentText()
         status = self.absence_status.currentText()
         notes = self.absence_notes.text().strip()
         
         try:
-            self.cursor.execute(
-                "INSERT INTO absences (code_massar, date_absence, raison, statut, notes) VALUES (%s, %s, %s, %s, %s)",
-                (code_massar, date, reason, status, notes)
-            )
-            self.db_connection.commit()
+            with self.db.transaction() as cursor:
+                stale = data_version(cursor) != self.data_version
+                cursor.execute(
+                    "INSERT INTO absences (code_massar, date_absence, raison, statut, notes) VALUES (%s, %s, %s, %s, %s)",
+                    (code_massar, date, reason, status, notes)
+                )
+                absence_id = cursor.lastrowid
+                refresh_rollup(cursor, rollup_keys(cursor, "a.id = %s", (absence_id,)))
+                student = self.student_of(code_massar)
+                version = data_version(cursor)
+            self.query_cache.bump("absences")
+            self.absences_changed()
             self.update_status("Absence enregistrée avec succès")
             QMessageBox.information(self, "Succès", "Absence enregistrée avec succès!")
             self.absence_date.setDate(QDate.currentDate())
             self.absence_notes.clear()
-            self.view_absences()
+            if stale:
+                self.refresh_views()
+            else:
+                self.data_version = version
+                if self.absence_in_scope(student['classe'], status, date):
+                    self.absences_model.insert_rows(
+                        [(absence_id, code_massar, student['nom_complet'], date, reason, status, notes)])
         except Error as e:
             self.update_status("Erreur d'enregistrement absence")
             QMessageBox.critical(self, "Erreur", f"Échec d'enregistrement: {str(e)}")
     
+    def open_roll_call(self):
+        """Record the absences of a whole class for one date"""
+        if not self.db:
+            QMessageBox.warning(self, "Erreur", "Veuillez vous connecter d'abord")
+            return
+            
+        reasons = [self.absence_reason.itemText(i) for i in range(self.absence_reason.count())]
+        statuses = [self.absence_status.itemText(i) for i in range(self.absence_status.count())]
+        dialog = RollCallDialog(self.fetch_roll_call, reasons, statuses, self)
+        accepted = dialog.exec_() == QDialog.Accepted
+        self.executor.cancel("roll_call")  # Liste demandée pour un dialogue fermé
+        if accepted:
+            self.save_roll_call(dialog.roll_call())
+    
+    def fetch_roll_call(self, classe, date, callback):
+        """List the students of a class (from the directory) and whether they are already absent on date"""
+        students = self.students.by_name(classe)
+        
+        def on_result(rows):
+            absent = {row['code_massar'] for row in rows}
+            callback([dict(student, deja_absent=student['code_massar'] in absent) for student in students])
+        
+        self.executor.submit(
+            "roll_call",
+            lambda connection: self.fetch_all(
+                connection,
+                """SELECT DISTINCT a.code_massar
+                   FROM absences a
+                   JOIN etudiants e ON a.code_massar = e.code_massar
+                   WHERE a.date_absence = %s AND e.classe = %s""",
+                (date, classe)
+            ),
+            on_result,
+            lambda message: self.report_error("Erreur de chargement", f"Échec de récupération: {message}"),
+            retry=True
+        )
+    
+    def save_roll_call(self, roll_call):
+        """Insert the absences of a roll call in one transaction and add them to the grid"""
+        students = roll_call['students']
+        if not students:
+            self.update_status("Aucun absent coché")
+            return
+            
+        notes = roll_call['notes']
+        rows = []
+        try:
+            with self.db.transaction() as cursor:
+                stale = data_version(cursor) != self.data_version
+                for code_massar, name in students:
+                    cursor.execute(
+                        "INSERT INTO absences (code_massar, date_absence, raison, statut, notes) VALUES (%s, %s, %s, %s, %s)",
+                        (code_massar, roll_call['date'], roll_call['raison'], roll_call['statut'], notes)
+                    )
+                    rows.append((cursor.lastrowid, code_massar, name, roll_call['date'],
+                                 roll_call['raison'], roll_call['statut'], notes))
+                refresh_rollup(cursor, rollup_keys(cursor, "a.date_absence = %s AND e.classe = %s",
+                                                   (roll_call['date'], roll_call['classe'])))
+                version = data_version(cursor)
+        except Error as e:
+            self.update_status("Erreur d'enregistrement de l'appel")
+            QMessageBox.critical(self, "Erreur", f"Échec d'enregistrement: {str(e)}")
+            return
+            
+        self.query_cache.bump("absences")
+        self.absences_changed()
+        if stale:
+            self.refresh_views()
+        else:
+            self.data_version = version
+            if self.absence_in_scope(roll_call['classe'], roll_call['statut'], roll_call['date']):
+                self.absences_model.insert_rows(rows)
+        self.update_status(f"Appel enregistré: {len(rows)} absence(s) en {roll_call['classe']} le {roll_call['date']}")
+    
+    def absence_in_scope(self, classe, statut, date):
+        """Whether an absence belongs to the filter currently displayed in the grid"""
+        return self._absences_spec is not None and self._absences_spec.matches(classe, statut, date)
+    
     def update_absence(self):
         """Update an existing absence record"""
-        if not self.db_connection:
+        if not self.db:
             QMessageBox.warning(self, "Erreur", "Veuillez vous connecter d'abord")
             return
             
-        selected_row = self.absences_table.currentRow()
-        if selected_row == -1:
+        absence = self.selected_absence()
+        if absence is None:
             QMessageBox.warning(self, "Erreur", "Veuillez sélectionner une absence à modifier")
             return
             
-        absence_id = self.absences_table.item(selected_row, 0).text()
-        code_massar = self.absence_student.currentData()
+        absence_id = absence['id']
+        code_massar = self.absence_student.current_code()
+        if code_massar is None:
+            QMessageBox.warning(self, "Erreur", "Veuillez choisir un étudiant dans les suggestions")
+            return
         date = self.absence_date.date().toString("yyyy-MM-dd")
         reason = self.absence_reason.currentText()
         status = self.absence_status.currentText()
         notes = self.absence_notes.text().strip()
         
         try:
-            self.cursor.execute(
-                """UPDATE absences SET code_massar=%s, date_absence=%s, raison=%s, statut=%s, notes=%s 
-                WHERE id=%s""",
-                (code_massar, date, reason, status, notes, absence_id)
-            )
-            self.db_connection.commit()
+            with self.db.transaction() as cursor:
+                stale = data_version(cursor) != self.data_version
+                keys = rollup_keys(cursor, "a.id = %s", (absence_id,))
+                cursor.execute(
+                    """UPDATE absences SET code_massar=%s, date_absence=%s, raison=%s, statut=%s, notes=%s 
+                    WHERE id=%s""",
+                    (code_massar, date, reason, status, notes, absence_id)
+                )
+                keys |= rollup_keys(cursor, "a.id = %s", (absence_id,))
+                refresh_rollup(cursor, keys)
+                student = self.student_of(code_massar)
+                version = data_version(cursor)
+            self.query_cache.bump("absences")
+            self.absences_changed()
             self.update_status("Absence mise à jour avec succès")
             QMessageBox.information(self, "Succès", "Absence mise à jour avec succès!")
-            self.view_absences()
+            if stale:
+                self.refresh_views()
+                return
+            self.data_version = version
+            # La date a pu changer: on retire la ligne puis on la replace à son rang
+            self.absences_model.remove_ids({absence_id})
+            if self.absence_in_scope(student['classe'], status, date):
+                self.absences_model.insert_rows(
+                    [(absence_id, code_massar, student['nom_complet'], date, reason, status, notes)])
         except Error as e:
             self.update_status("Erreur de mise à jour absence")
             QMessageBox.critical(self, "Erreur", f"Échec de mise à jour: {str(e)}")
     
     def delete_absence(self):
         """Delete an absence record"""
-        if not self.db_connection:
+        if not self.db:
             QMessageBox.warning(self, "Erreur", "Veuillez vous connecter d'abord")
             return
             
-        selected_row = self.absences_table.currentRow()
-        if selected_row == -1:
+        absence = self.selected_absence()
+        if absence is None:
             QMessageBox.warning(self, "Erreur", "Veuillez sélectionner une absence à supprimer")
             return
             
-        absence_id = self.absences_table.item(selected_row, 0).text()
-        student_name = self.absences_table.item(selected_row, 2).text()
-        date = self.absences_table.item(selected_row, 3).text()
+        absence_id = absence['id']
+        student_name = absence['nom_complet']
+        date = absence['date_absence']
         
         reply = QMessageBox.question(
             self, "Confirmation", 
@@ -843,27 +1876,48 @@ class AbsenceApp(QMainWindow):
         
         if reply == QMessageBox.Yes:
             try:
-                self.cursor.execute("DELETE FROM absences WHERE id=%s", (absence_id,))
-                self.db_connection.commit()
+                with self.db.transaction() as cursor:
+                    stale = data_version(cursor) != self.data_version
+                    keys = rollup_keys(cursor, "a.id = %s", (absence_id,))
+                    cursor.execute("DELETE FROM absences WHERE id=%s", (absence_id,))
+                    refresh_rollup(cursor, keys)
+                    record_deletion(cursor, "absences", absence_id)
+                    version = data_version(cursor)
+                self.query_cache.bump("absences")
+                self.absences_changed()
                 self.update_status("Absence supprimée avec succès")
                 QMessageBox.information(self, "Succès", "Absence supprimée avec succès!")
-                self.view_absences()
+                if stale:
+                    self.refresh_views()
+                else:
+                    self.data_version = version
+                    self.absences_model.remove_ids({absence_id})
             except Error as e:
                 self.update_status("Erreur de suppression absence")
                 QMessageBox.critical(self, "Erreur", f"Échec de suppression: {str(e)}")
     
-    def absence_table_clicked(self, row, column):
+    def student_of(self, code_massar):
+        """Full name and class of a student, from the student directory"""
+        student = self.students.get(code_massar)
+        return {'nom_complet': f"{student['nom']} {student['prenom']}", 'classe': student['classe']}
+    
+    def selected_absence(self):
+        """Return the selected absence row as a dict, or None"""
+        index = self.absences_table.currentIndex()
+        if not index.isValid():
+            return None
+        return self.absences_model.row_values(index.row())
+    
+    def absence_table_clicked(self, index):
         """Load absence data into form when clicked in table"""
-        code_massar = self.absences_table.item(row, 1).text()
-        date_str = self.absences_table.item(row, 3).text()
-        reason = self.absences_table.item(row, 4).text()
-        status = self.absences_table.item(row, 5).text()
-        notes = self.absences_table.item(row, 6).text() if self.absences_table.item(row, 6) else ""
+        absence = self.absences_model.row_values(index.row())
+        code_massar = absence['code_massar']
+        date_str = absence['date_absence']
+        reason = absence['raison']
+        status = absence['statut']
+        notes = absence['notes']
         
-        # Find the student in the combo box
-        index = self.absence_student.findData(code_massar)
-        if index >= 0:
-            self.absence_student.setCurrentIndex(index)
+        self.absence_student.set_code(code_massar)
         
         date = QDate.fromString(date_str, "yyyy-MM-dd")
         self.absence_date.setDate(date)
@@ -873,181 +1927,208 @@ class AbsenceApp(QMainWindow):
         self.absence_notes.setText(notes)
     
     def view_absences(self):
-        """Display filtered absences in the table"""
-        if not self.db_connection:
+        """Display filtered absences in the table, read again from the database"""
+        if not self.db:
             QMessageBox.warning(self, "Erreur", "Veuillez vous connecter d'abord")
             return
+        self._absences_loaded = None
+        self.filter_absences()
+    
+    def filter_absences(self):
+        """Apply the filter, from the last complete result set when it contains the new one"""
+        self.filter_timer.stop()
+        if not self.db:
+            return
             
-        try:
-            query = """
-                SELECT a.id, e.code_massar, CONCAT(e.nom, ' ', e.prenom) AS nom_complet,
-                       a.date_absence, a.raison, a.statut, a.notes, e.classe
-                FROM absences a
-                JOIN etudiants e ON a.code_massar = e.code_massar
-                WHERE 1=1
-            """
-            
-            params = []
-            
-            # Apply class filter
-            selected_class = self.filter_class.currentText()
-            if selected_class != "Toutes":
-                query += " AND e.classe = %s"
-                params.append(selected_class)
-            
-            # Apply status filter
-            selected_status = self.filter_status.currentText()
-            if selected_status != "Tous":
-                query += " AND a.statut = %s"
-                params.append(selected_status)
-            
-            # Apply date range filter
-            date_from = self.filter_date_from.date().toString("yyyy-MM-dd")
-            date_to = self.filter_date_to.date().toString("yyyy-MM-dd")
-            query += " AND a.date_absence BETWEEN %s AND %s"
-            params.extend([date_from, date_to])
-            
-            query += " ORDER BY a.date_absence DESC"
-            
-            self.cursor.execute(query, params)
-            absences = self.cursor.fetchall()
-            
-            self.absences_table.setRowCount(len(absences))
-            for row, absence in enumerate(absences):
-                self.absences_table.setItem(row, 0, QTableWidgetItem(str(absence['id'])))
-                self.absences_table.setItem(row, 1, QTableWidgetItem(absence['code_massar']))
-                self.absences_table.setItem(row, 2, QTableWidgetItem(absence['nom_complet']))
-                self.absences_table.setItem(row, 3, QTableWidgetItem(str(absence['date_absence'])))
-                self.absences_table.setItem(row, 4, QTableWidgetItem(absence['raison']))
-                
-                status_item = QTableWidgetItem(absence['statut'])
-                if absence['statut'] == "Justifie":
-                    status_item.setBackground(QColor(144, 238, 144))  # Light green
-                else:
-                    status_item.setBackground(QColor(255, 182, 193))  # Light red
-                self.absences_table.setItem(row, 5, status_item)
-                
-                notes_item = QTableWidgetItem(absence['notes'] if absence['notes'] else "")
-                self.absences_table.setItem(row, 6, notes_item)
-            
-            self.update_status(f"{len(absences)} absences chargées")
-        except Error as e:
-            self.update_status("Erreur de chargement absences")
-            QMessageBox.critical(self, "Erreur", f"Échec de récupération: {str(e)}")
+        spec = self.absence_filter()
+        self._absences_spec = spec
+        
+        # Filtre plus étroit que le dernier résultat complet: aucune requête
+        loaded = self._absences_loaded
+        if loaded is not None and loaded['spec'].contains(spec):
+            self.executor.cancel("absences_count")
+            self.serve_absences_locally([row for row, classe in loaded['rows']
+                                         if spec.matches(classe, row[5], row[3])])
+            return
+        
+        self._absences_rows = None
+        limit = self.LOCAL_FILTER_ROWS
+        
+        def job(connection):
+            total = self.query_cache.fetch(connection, *absences_count_query(spec))[0]['total']
+            if total > limit:
+                return total, None
+            # Assez petit pour être gardé entier et refiltré localement
+            rows = self.query_cache.fetch(connection, *absences_query(spec, "ASC"))
+            return total, [(self.grid_row(row), row['classe']) for row in rows]
+        
+        self.executor.submit(
+            "absences_count",
+            job,
+            lambda result: self.absences_loaded(spec, *result),
+            lambda message: self.report_error("Erreur de chargement absences", f"Échec de récupération: {message}"),
+            retry=True
+        )
+    
+    def absences_loaded(self, spec, total, rows):
+        """Show a filter read from the database; rows is its complete result when small enough"""
+        if rows is None:
+            self.absences_pager.first()
+            self.show_absences_count(total)
+            return
+        self._absences_loaded = {'spec': spec, 'rows': rows}
+        self.serve_absences_locally([row for row, classe in rows])
+    
+    def serve_absences_locally(self, rows):
+        """Page the grid over rows (sorted by date, id) instead of querying MySQL"""
+        self._absences_rows = rows
+        self._absences_keys = [self.absences_pager.key(row) for row in rows]
+        self.absences_pager.first()
+        self.show_absences_count(len(rows))
+    
+    def absences_changed(self):
+        """The absences were edited: cached pages and result sets are out of date.
+
+        Called after every successful write, even when the displayed page did
+        not change (row out of the filter or beyond the page, student absent
+        from the page): the model signals alone would miss those.
+        """
+        self.absences_pager.invalidate()
+        self._absences_loaded = None
+        self._absences_rows = None
+    
+    def absence_filter(self):
+        """AbsenceFilter of the values chosen in the absences tab"""
+        selected_class = self.filter_class.currentText()
+        selected_status = self.filter_status.currentText()
+        return AbsenceFilter(
+            classe=None if selected_class == "Toutes" else selected_class,
+            statut=None if selected_status == "Tous" else selected_status,
+            date_from=self.filter_date_from.date().toString("yyyy-MM-dd"),
+            date_to=self.filter_date_to.date().toString("yyyy-MM-dd")
+        )
+    
+    @staticmethod
+    def grid_row(row):
+        """Tuple shown by AbsencesTableModel for a row of absences_query"""
+        return (row['id'], row['code_massar'], row['nom_complet'], row['date_absence'],
+                row['raison'], row['statut'], row['notes'])
+    
+    def show_absences_count(self, total):
+        """Show the number of absences matching the filter"""
+        self.absences_nav['total'] = total
+        self.update_pager_bar(self.absences_nav, self.absences_pager)
+        self.update_status(f"{total} absences trouvées")
+    
+    def fetch_absences_page(self, after, before, limit, callback):
+        """Fetch a page of filtered absences for absences_pager.
+
+        Seeks on (date_absence, id) instead of using OFFSET so that any page
+        costs the same as the first one. A filter served locally is paged
+        from memory.
+        """
+        if self._absences_rows is not None:
+            # Lignes en ordre croissant, affichées de la plus récente à la plus ancienne
+            if before is not None:
+                start = bisect.bisect_right(self._absences_keys, before)
+                rows = self._absences_rows[start:start + limit]
+            else:
+                end = len(self._absences_rows) if after is None else bisect.bisect_left(self._absences_keys, after)
+                rows = self._absences_rows[max(0, end - limit):end]
+            callback(rows[::-1])
+            return
+        if before is not None:
+            query, params = absences_query(self._absences_spec, "ASC", before, limit)
+        else:
+            query, params = absences_query(self._absences_spec, "DESC", after, limit)
+        
+        def job(connection):
+            rows = [self.grid_row(row) for row in self.query_cache.fetch(connection, query, params)]
+            if before is not None:
+                rows.reverse()  # Lues à rebours, affichées dans l'ordre
+            return rows
+        
+        self.executor.submit(
+            "absences_page",
+            job,
+            callback,
+            lambda message: self.report_error("Erreur de chargement absences", f"Échec de récupération: {message}"),
+            retry=True
+        )
+    
+    def show_absences_page(self, rows, page, has_previous, has_next):
+        """Display a page fetched by absences_pager in the grid"""
+        self.absences_model.set_page(rows, has_next)
+        self.update_pager_bar(self.absences_nav, self.absences_pager)
     
     def generate_stats(self):
         """Generate absence statistiques"""
-        if not self.db_connection:
+        if not self.db:
             QMessageBox.warning(self, "Erreur", "Veuillez vous connecter d'abord")
             return
             
-        try:
-            # Determine date range based on selected period
-            period = self.stats_period.currentText()
-            date_from = self.stats_date_from.date()
-            date_to = self.stats_date_to.date()
-            
-            if period == "7 derniers jours":
-                date_from = QDate.currentDate().addDays(-7)
-            elif period == "30 derniers jours":
-                date_from = QDate.currentDate().addDays(-30)
-            elif period == "Ce mois":
-                date_from = QDate(QDate.currentDate().year(), QDate.currentDate().month(), 1)
-                date_to = QDate.currentDate()
-            elif period == "Ce semestre":
-                current_month = QDate.currentDate().month()
-                if current_month <= 6:  # First semester
-                    date_from = QDate(QDate.currentDate().year(), 1, 1)
-                    date_to = QDate(QDate.currentDate().year(), 6, 30)
-                else:  # Second semester
-                    date_from = QDate(QDate.currentDate().year(), 7, 1)
-                    date_to = QDate(QDate.currentDate().year(), 12, 31)
-            
-            # Update date fields
-            self.stats_date_from.setDate(date_from)
-            self.stats_date_to.setDate(date_to)
-            
-            date_from_str = date_from.toString("yyyy-MM-dd")
-            date_to_str = date_to.toString("yyyy-MM-dd")
-            
-            query = """
-                SELECT 
-                    e.classe,
-                    COUNT(*) AS total_absences,
-                    SUM(CASE WHEN a.statut = 'Justifié' THEN 1 ELSE 0 END) AS justified,
-                    SUM(CASE WHEN a.statut = 'Non justifié' THEN 1 ELSE 0 END) AS unjustified,
-                    COUNT(DISTINCT a.code_massar) AS students_affected,
-                    (SELECT COUNT(*) FROM etudiants WHERE classe = e.classe) AS total_students
-                FROM absences a
-                JOIN etudiants e ON a.code_massar = e.code_massar
-                WHERE a.date_absence BETWEEN %s AND %s
-            """
-            
-            params = [date_from_str, date_to_str]
-            
-            # Apply class filter
-            selected_class = self.stats_class.currentText()
-            if selected_class != "Toutes":
-                query += " AND e.classe = %s"
-                params.append(selected_class)
-            
-            query += " GROUP BY e.classe ORDER BY e.classe"
-            
-            self.cursor.execute(query, params)
-            stats = self.cursor.fetchall()
-            
-            # Generate report
-            report = f"Rapport des absences du {date_from_str} au {date_to_str}\n\n"
-            report += "="*50 + "\n\n"
-            
-            if not stats:
-                report += "Aucune absence enregistrée pour cette période.\n"
-            else:
-                for stat in stats:
-                    report += f"Classe: {stat['classe']}\n"
-                    report += f"- Total des absences: {stat['total_absences']}\n"
-                    report += f"  - Justifiées: {stat['justified']} ({stat['justified']/stat['total_absences']:.1%})\n"
-                    report += f"  - Non justifiées: {stat['unjustified']} ({stat['unjustified']/stat['total_absences']:.1%})\n"
-                    report += f"- Étudiants concernés: {stat['students_affected']}/{stat['total_students']}\n"
-                    report += f"- Taux d'absence moyen: {stat['total_absences']/stat['total_students']:.1f} absences/étudiant\n\n"
-            
-            # Add top absent students
-            query = """
-                SELECT 
-                    e.nom, e.prenom, e.classe,
-                    COUNT(*) AS absence_count
-                FROM absences a
-                JOIN etudiants e ON a.code_massar = e.code_massar
-                WHERE a.date_absence BETWEEN %s AND %s
-                GROUP BY a.code_massar
-                ORDER BY absence_count DESC
-                LIMIT 5
-            """
-            
-            self.cursor.execute(query, [date_from_str, date_to_str])
-            top_absent = self.cursor.fetchall()
-            
-            if top_absent:
-                report += "Top 5 des étudiants les plus absents:\n"
-                for i, student in enumerate(top_absent, 1):
-                    report += f"{i}. {student['nom']} {student['prenom']} ({student['classe']}): {student['absence_count']} absences\n"
-            
-            self.stats_display.setPlainText(report)
-            self.update_status("Statistiques générées avec succès")
-            
-        except Error as e:
-            self.update_status("Erreur de génération statistiques")
-            QMessageBox.critical(self, "Erreur", f"Échec de génération: {str(e)}")
+        spec = self.stats_filter()
+        self.update_status("Génération des statistiques...")
+        self.executor.submit(
+            "stats",
+            lambda connection: self.query_cache.fetch(
+                connection, "compute_statistics", spec.where()[1],
+                compute=lambda connection: compute_statistics(connection, spec),
+                tables=("absences", "etudiants", "absences_daily_rollup")
+            ),
+            self.show_stats,
+            lambda message: self.report_error("Erreur de génération statistiques", f"Échec de génération: {message}"),
+            retry=True
+        )
     
-    def export_students_csv(self):
-        """Export students data to CSV"""
-        if not self.db_connection:
-            QMessageBox.warning(self, "Erreur", "Veuillez vous connecter d'abord")
+    def stats_filter(self):
+        """AbsenceFilter of the class and period chosen in the statistics tab"""
+        # Determine date range based on selected period
+        period = self.stats_period.currentText()
+        date_from = self.stats_date_from.date()
+        date_to = self.stats_date_to.date()
+        
+        if period == "7 derniers jours":
+            date_from = QDate.currentDate().addDays(-7)
+        elif period == "30 derniers jours":
+            date_from = QDate.currentDate().addDays(-30)
+        elif period == "Ce mois":
+            date_from = QDate(QDate.currentDate().year(), QDate.currentDate().month(), 1)
+            date_to = QDate.currentDate()
+        elif period == "Ce semestre":
+            current_month = QDate.currentDate().month()
+            if current_month <= 6:  # First semester
+                date_from = QDate(QDate.currentDate().year(), 1, 1)
+                date_to = QDate(QDate.currentDate().year(), 6, 30)
+            else:  # Second semester
+                date_from = QDate(QDate.currentDate().year(), 7, 1)
+                date_to = QDate(QDate.currentDate().year(), 12, 31)
+        
+        # Update date fields
+        self.stats_date_from.setDate(date_from)
+        self.stats_date_to.setDate(date_to)
+        
+        date_from_str = date_from.toString("yyyy-MM-dd")
+        date_to_str = date_to.toString("yyyy-MM-dd")
+        selected_class = self.stats_class.currentText()
+        return AbsenceFilter(classe=None if selected_class == "Toutes" else selected_class,
+                             date_from=date_from_str, date_to=date_to_str)
+    
+    def show_stats(self, stats):
+        """Display the statistics computed by generate_stats"""
+        self.last_stats = stats
+        self.stats_display.setPlainText(stats.format_report())
+        self.update_status("Statistiques générées avec succès")
+    
+    def export_stats_csv(self):
+        """Export the last generated statistics to CSV"""
+        if self.last_stats is None:
+            QMessageBox.warning(self, "Erreur", "Veuillez d'abord générer les statistiques")
             return
             
         try:
             filename, _ = QFileDialog.getSaveFileName(
-                self, "Exporter les étudiants", "", "CSV Files (*.csv)")
+                self, "Exporter les statistiques", "", "CSV Files (*.csv)")
             
             if not filename:  # User cancelled
                 return
@@ -1056,245 +2137,505 @@ class AbsenceApp(QMainWindow):
                 filename += '.csv'
             
             with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
-                writer = csv.writer(csvfile, delimiter=',')
-                writer.writerow(['Code Massar', 'CIN', 'Nom', 'Prénom', 'Classe', 'Date Ajout'])
-                
-                # Fetch data in chunks
-                self.cursor.execute("SELECT * FROM etudiants ORDER BY nom, prenom")
-                while True:
-                    batch = self.cursor.fetchmany(100)
-                    if not batch:
-                        break
-                    for row in batch:
-                        writer.writerow([
-                            row['code_massar'],
-                            row['cin'],
-                            row['nom'],
-                            row['prenom'],
-                            row['classe'],
-                        ])
+                writer = csv.writer(csvfile, delimiter=';')
+                writer.writerows(self.last_stats.csv_rows())
             
-            self.update_status(f"Étudiants exportés vers {filename}")
+            self.update_status(f"Statistiques exportées vers {filename}")
             QMessageBox.information(self, "Succès", f"Données exportées vers {filename}")
         except Exception as e:
-            self.update_status("Erreur d'export étudiants")
+            self.update_status("Erreur d'export statistiques")
             QMessageBox.critical(self, "Erreur", f"Échec d'export: {str(e)}")
     
-    def export_absences_csv(self):
-        """Export absences data to CSV"""
-        if not self.db_connection:
+    def email_stats(self):
+        """Open the email dialog pre-filled with the last generated report"""
+        if self.last_stats is None:
+            QMessageBox.warning(self, "Erreur", "Veuillez d'abord générer les statistiques")
+            return
+            
+        stats = self.last_stats
+        dialog = EmailSender(
+            self,
+            subject=f"Rapport des absences du {stats.date_from} au {stats.date_to}",
+            message=stats.format_report(),
+            mail_queue=self.mail_queue
+        )
+        if dialog.exec_() == QDialog.Accepted:
+            self.flush_mail()
+    
+    def send_digests(self):
+        """Queue the digests of the class and period of the statistics tab"""
+        if not self.db:
             QMessageBox.warning(self, "Erreur", "Veuillez vous connecter d'abord")
             return
             
-        try:
-            filename, _ = QFileDialog.getSaveFileName(
-                self, "Exporter les absences", "", "CSV Files (*.csv)")
+        sender = read_mail_settings()['sender']
+        if not sender:
+            QMessageBox.warning(self, "Erreur", "Configurez d'abord l'envoi des emails (Outils > Envoyer email)")
+            return
             
-            if not filename:  # User cancelled
-                return
-                
-            if not filename.endswith('.csv'):
-                filename += '.csv'
+        recipients = self.digest_recipients()
+        students = self.digest_settings['students']
+        if not recipients and not students:
+            QMessageBox.warning(self, "Erreur", "Aucun destinataire: voir Outils > Paramètres")
+            return
             
-            with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
-                writer = csv.writer(csvfile, delimiter=';')
-                writer.writerow(['ID', 'Code Massar', 'Nom', 'Prenom', 'Classe', 'Date', 'Raison', 'Statut', 'Notes'])
-                
-                # Build the same query as view_absences for consistency
-                query = """
-                    SELECT a.id, e.code_massar, e.nom, e.prenom, e.classe,
-                           a.date_absence, a.raison, a.statut, a.notes
-                    FROM absences a
-                    JOIN etudiants e ON a.code_massar = e.code_massar
-                    WHERE 1=1
-                """
-                
-                params = []
-                
-                # Apply class filter
-                selected_class = self.filter_class.currentText()
-                if selected_class != "Toutes":
-                    query += " AND e.classe = %s"
-                    params.append(selected_class)
-                
-                # Apply status filter
-                selected_status = self.filter_status.currentText()
-                if selected_status != "Tous":
-                    query += " AND a.statut = %s"
-                    params.append(selected_status)
-                
-                # Apply date range filter
-                date_from = self.filter_date_from.date().toString("yyyy-MM-dd")
-                date_to = self.filter_date_to.date().toString("yyyy-MM-dd")
-                query += " AND a.date_absence BETWEEN %s AND %s"
-                params.extend([date_from, date_to])
-                
-                query += " ORDER BY a.date_absence DESC"
-                
-                self.cursor.execute(query, params)
-                
-                while True:
-                    batch = self.cursor.fetchmany(100)
-                    if not batch:
-                        break
-                    for row in batch:
-                        writer.writerow([
-                            row['id'],
-                            row['code_massar'],
-                            row['nom'],
-                            row['prenom'],
-                            row['classe'],
-                            str(row['date_absence']),
-                            row['raison'],
-                            row['statut'],
-                            row['notes'] if row['notes'] else ""
-                        ])
+        spec = self.stats_filter()
+        reply = QMessageBox.question(
+            self, "Confirmation",
+            f"Envoyer les bilans des absences du {spec.date_from} au {spec.date_to}?",
+            QMessageBox.Yes | QMessageBox.No, QMessageBox.No
+        )
+        if reply != QMessageBox.Yes:
+            return
             
-            self.update_status(f"Absences exportées vers {filename}")
-            QMessageBox.information(self, "Succès", f"Données exportées vers {filename}")
-        except Exception as e:
-            self.update_status("Erreur d'export absences")
-            QMessageBox.critical(self, "Erreur", f"Échec d'export: {str(e)}")
+        self.update_status("Préparation des bilans...")
+        self.executor.submit(
+            "digests",
+            lambda connection: queue_digests(connection, self.mail_queue, spec, sender, recipients, students),
+            self.digests_done,
+            lambda message: self.report_error("Erreur de préparation des bilans", f"Échec des bilans: {message}"),
+            role="background"
+        )
     
-    def export_data(self):
-        """Export both students and absences to CSV files"""
-        if not self.db_connection:
+    def check_digests(self):
+        """Queue the scheduled digests of the last complete period once it is due"""
+        settings = self.digest_settings
+        if not self.db or not settings['enabled'] or self.executor.is_pending("digests"):
+            return
+        now = datetime.now()
+        if now.hour < settings['hour'] or self.digests_sent == (settings['frequency'], now.date()):
+            return
+        sender = read_mail_settings()['sender']
+        if not sender:
+            self.update_status("Bilans programmés: envoi des emails non configuré")
+            return
+            
+        frequency, recipients, students = settings['frequency'], self.digest_recipients(), settings['students']
+        
+        def job(connection):
+            return send_scheduled_digests(connection, self.mail_queue, frequency, now.date(), sender,
+                                          recipients, students)
+        
+        def on_result(report):
+            self.digests_sent = (frequency, now.date())  # Plus de requête avant demain
+            if report is not None:
+                self.digests_done(report)
+        
+        self.executor.submit(
+            "digests",
+            job,
+            on_result,
+            lambda message: self.update_status(f"Échec des bilans programmés: {message}"),
+            role="background"
+        )
+    
+    def digest_recipients(self):
+        """Addresses receiving the class digests (settings)"""
+        return [address.strip() for address in re.split(r"[,;]", self.digest_settings['recipients'])
+                if address.strip()]
+    
+    def digests_done(self, report):
+        """Report the queued digests and start sending them"""
+        self.update_status(report.summary())
+        self.flush_mail()
+    
+    def import_csv_file(self):
+        """Import students or absences from a CSV file in the layout of the exports"""
+        if not self.db:
             QMessageBox.warning(self, "Erreur", "Veuillez vous connecter d'abord")
             return
             
-        try:
-            # Get directory to save files
-            directory = QFileDialog.getExistingDirectory(self, "Sélectionner le dossier de destination")
-            if not directory:
-                return
-                
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        filename, _ = QFileDialog.getOpenFileName(
+            self, "Importer des étudiants ou des absences", "", "CSV Files (*.csv)")
+        
+        if not filename:  # User cancelled
+            return
             
-            # Export etudiant
-            students_file = os.path.join(directory, f"etudiants_{timestamp}.csv")
-            with open(students_file, 'w', newline='', encoding='utf-8') as csvfile:
-                writer = csv.writer(csvfile, delimiter=',')
-                writer.writerow(['Code Massar', 'CIN', 'Nom', 'Prénom', 'Classe', 'Date Ajout'])
-                
-                self.cursor.execute("SELECT * FROM etudiants ORDER BY nom, prenom")
-                for row in self.cursor:
-                    writer.writerow([
-                        row['code_massar'],
-                        row['cin'],
-                        row['nom'],
-                        row['prenom'],
-                        row['classe'],
-                        str(row['date_ajout'])
-                    ])
+        self.update_status("Import en cours...")
+        self.executor.submit(
+            "import",
+            lambda connection, report: import_csv(connection, filename, progress=report),
+            self.import_done,
+            self.import_failed,
+            role="background",
+            retry=False,  # Les lots déjà validés seraient insérés une seconde fois
+            on_progress=lambda report: self.update_status(
+                f"Import en cours: {report.imported} lignes importées, {len(report.errors)} rejetées"),
+            on_cancel=self.import_cancelled
+        )
+    
+    def import_done(self, report):
+        """Refresh the views once, then show the per-row errors of the import"""
+        self.query_cache.bump(report.table)
+        self.view_students()
+        if report.table == "absences":
+            self.view_absences()
+        self.update_status(f"Import terminé: {report.imported} lignes importées, {len(report.errors)} rejetées")
+        if report.errors:
+            QMessageBox.warning(self, "Import terminé avec des erreurs", report.summary())
+        else:
+            QMessageBox.information(self, "Succès", report.summary())
+    
+    def import_cancelled(self):
+        """Forget an import cancelled by disconnection: its result will never be shown"""
+        self.query_cache.bump()  # Les lots déjà validés restent importés
+        self.update_status("Import interrompu")
+    
+    def import_failed(self, message):
+        """Report an import that could not run (unknown layout, lost connection)"""
+        self.query_cache.bump()  # Les lots déjà validés restent importés
+        self.report_error("Erreur d'import", f"Échec d'import: {message}")
+    
+    def export_students_csv(self):
+        """Export students data (CSV, JSON Lines or Parquet)"""
+        if not self.db:
+            QMessageBox.warning(self, "Erreur", "Veuillez vous connecter d'abord")
+            return
             
-            # Export absences
-            absences_file = os.path.join(directory, f"absences_{timestamp}.csv")
-            with open(absences_file, 'w', newline='', encoding='utf-8') as csvfile:
-                writer = csv.writer(csvfile, delimiter=',')
-                writer.writerow(['ID', 'Code Massar', 'Nom', 'Prénom', 'Classe', 'Date', 'Raison', 'Statut', 'Notes'])
-                
-                self.cursor.execute("""
-                    SELECT a.id, e.code_massar, e.nom, e.prenom, e.classe,
-                           a.date_absence, a.raison, a.statut, a.notes
-                    FROM absences a
-                    JOIN etudiants e ON a.code_massar = e.code_massar
-                    ORDER BY a.date_absence DESC
-                """)
-                
-                for row in self.cursor:
-                    writer.writerow([
-                        row['id'],
-                        row['code_massar'],
-                        row['nom'],
-                        row['prenom'],
-                        row['classe'],
-                        str(row['date_absence']),
-                        row['raison'],
-                        row['statut'],
-                        row['notes'] if row['notes'] else ""
-                    ])
+        filename, fmt = self.choose_export_file("Exporter les étudiants")
+        if not filename:  # User cancelled
+            return
+        
+        self.start_export(
+            "export_students",
+            "Export des étudiants...",
+            (filename, fmt, students_export_query(), students_count_query(), STUDENT_EXPORT_FIELDS),
+            f"Étudiants exportés vers {filename}"
+        )
+    
+    def export_absences_csv(self):
+        """Export the absences of the grid's filter (CSV, JSON Lines or Parquet)"""
+        if not self.db:
+            QMessageBox.warning(self, "Erreur", "Veuillez vous connecter d'abord")
+            return
             
-            self.update_status(f"Données exportées vers {directory}")
-            QMessageBox.information(
-                self, "Succès", 
-                f"Données exportées avec succès:\n{students_file}\n{absences_file}"
-            )
-        except Exception as e:
-            self.update_status("Erreur d'export données")
-            QMessageBox.critical(self, "Erreur", f"Échec d'export: {str(e)}")
+        filename, fmt = self.choose_export_file("Exporter les absences")
+        if not filename:  # User cancelled
+            return
+        
+        spec = self.absence_filter()  # Le filtre de la grille
+        self.start_export(
+            "export_absences",
+            "Export des absences...",
+            (filename, fmt, absences_query(spec), absences_count_query(spec), ABSENCE_EXPORT_FIELDS),
+            f"Absences exportées vers {filename}"
+        )
+    
+    def export_data(self):
+        """Export both students and absences to CSV files, in parallel from one consistent snapshot"""
+        if not self.db:
+            QMessageBox.warning(self, "Erreur", "Veuillez vous connecter d'abord")
+            return
             
+        # Get directory to save files
+        directory = QFileDialog.getExistingDirectory(self, "Sélectionner le dossier de destination")
+        if not directory:
+            return
+            
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        students_file = os.path.join(directory, f"etudiants_{timestamp}.csv")
+        absences_file = os.path.join(directory, f"absences_{timestamp}.csv")
+        manifest_file = os.path.join(directory, f"export_{timestamp}.manifest.json")
+        everything = AbsenceFilter()
+        targets = [
+            (students_file, "csv", students_export_query(), students_count_query(), STUDENT_EXPORT_FIELDS),
+            (absences_file, "csv", absences_query(everything), absences_count_query(everything),
+             ABSENCE_EXPORT_FIELDS)
+        ]
+        db = self.db
+        
+        def work(report, cancelled):
+            manifest = export_snapshot(db, targets, manifest_file,
+                                       progress=lambda done, total: report((done, total)), cancelled=cancelled)
+            return None if manifest is None else sum(entry['rows'] for entry in manifest['files'])
+        
+        self.run_export(
+            "export_data",
+            "Export des données...",
+            work,
+            f"Données exportées avec succès:\n{students_file}\n{absences_file}\n{manifest_file}"
+        )
+    
+    def choose_export_file(self, title):
+        """Ask for the file of an export; returns (filename, format) or (None, None)"""
+        names = {"csv": "CSV", "jsonl": "JSON Lines", "parquet": "Parquet"}
+        filters = {f"{names[fmt]} (*{writer.extension})": fmt for fmt, writer in EXPORT_WRITERS.items()}
+        filename, selected = QFileDialog.getSaveFileName(self, title, "", ";;".join(filters))
+        if not filename:
+            return None, None
+        for fmt, writer in EXPORT_WRITERS.items():
+            if filename.lower().endswith(writer.extension):
+                return filename, fmt
+        fmt = filters.get(selected, "csv")
+        return filename + EXPORT_WRITERS[fmt].extension, fmt
+    
+    def start_export(self, key, title, target, message):
+        """Stream one export (filename, format, (query, params), (count query, params), fields)"""
+        filename, fmt, query, count, fields = target
+        db = self.db
+        
+        def job(connection, report, cancelled):
+            total = self.query_cache.fetch(connection, *count)[0]['total']
+            return export_rows(self.query_cache.stream(connection, *query), filename, fields, fmt, total,
+                               progress=lambda done, total: report((done, total)), cancelled=cancelled)
+        
+        self.run_export(
+            key, title,
+            lambda report, cancelled: db.run(lambda connection: job(connection, report, cancelled), "background"),
+            message
+        )
+    
+    def run_export(self, key, title, work, message):
+        """Run work(report, cancelled) in the background behind a progress dialog.
+
+        work reports (done, total) row counts and returns the number of rows
+        written, or None once cancelled() turned true: "Annuler" stops the
+        export after the current batch and removes the unfinished files.
+        """
+        stop = threading.Event()
+        dialog = QProgressDialog(title, "Annuler", 0, 100, self)
+        dialog.setWindowTitle("Export")
+        dialog.setAutoClose(False)
+        dialog.setAutoReset(False)
+        dialog.setMinimumDuration(0)
+        dialog.canceled.connect(stop.set)
+        dialog.show()
+        
+        def progress(value):
+            done, total = value
+            dialog.setValue(int(done * 100 / total) if total else 100)
+            self.update_status(f"{title} {done}/{total} lignes")
+        
+        def finished(rows):
+            dialog.reset()
+            dialog.hide()
+            if rows is None:
+                self.update_status("Export annulé")
+            else:
+                self.export_done(f"Export terminé: {rows} lignes", message)
+        
+        def failed(error):
+            dialog.reset()
+            dialog.hide()
+            self.report_error("Erreur d'export", f"Échec d'export: {error}")
+        
+        def cancelled():
+            # Tâche annulée par sa clé (déconnexion, nouvel export): finished ne viendra pas
+            stop.set()
+            dialog.reset()
+            dialog.hide()
+            self.update_status("Export annulé")
+        
+        self.executor.run_in_background(key, lambda report: work(report, stop.is_set), finished, failed, progress,
+                                        on_cancel=cancelled)
+    
+    def export_done(self, status, message):
+        """Report a finished background export"""
+        self.update_status(status)
+        QMessageBox.information(self, "Succès", message)
+    
+    def apply_backup_settings(self):
+        """Start or stop the automatic backup timer according to the settings"""
+        if self.db and self.backup_settings['enabled']:
+            self.backup_timer.start(self.backup_settings['interval'] * 60 * 1000)
+        else:
+            self.backup_timer.stop()
+    
     def auto_save_backup(self):
         """Automatically save backup at regular intervals"""
-        if not self.db_connection:
+        if not self.db:
             return
             
-        try:
-            # Create backup directory if it doesn't exist
-            backup_dir = "backups"
-            if not os.path.exists(backup_dir):
-                os.makedirs(backup_dir)
-                
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            backup_file = os.path.join(backup_dir, f"auto_backup_{timestamp}.sql")
+        if self.backup_started is not None:
+            self.update_status("Sauvegarde déjà en cours")
+            return
+            
+        chain = BackupChain(
+            self.backup_settings['directory'],
+            full_every=self.backup_settings['full_every'],
+            keep_chains=self.backup_settings['retention']
+        )
+        self.backup_started = time.monotonic()
+        self.update_status("Sauvegarde en cours...")
+        self.executor.submit(
+            "backup",
+            lambda connection, report: chain.run(connection, progress=lambda table, rows: report((table, rows))),
+            self.backup_done,
+            self.backup_failed,
+            role="background",
+            on_progress=lambda value: self.update_status(f"Sauvegarde en cours: {value[0]} ({value[1]} lignes)")
+        )
+    
+    def backup_done(self, backup_file):
+        """Report a finished automatic backup with its duration"""
+        duration = time.monotonic() - self.backup_started
+        self.backup_started = None
+        self.update_status(f"Sauvegarde automatique créée en {duration:.1f} s: {backup_file}")
+    
+    def backup_failed(self, message):
+        """Report a failed automatic backup"""
+        self.backup_started = None
+        self.update_status("Erreur de sauvegarde automatique")
+        print(f"Erreur de sauvegarde automatique: {message}")
+    
+    def restore_backup(self):
+        """Replace the data with a backup chosen in the backup directory"""
+        if not self.db:
+            QMessageBox.warning(self, "Erreur", "Veuillez vous connecter d'abord")
+            return
+            
+        directory = self.backup_settings['directory']
+        path, _ = QFileDialog.getOpenFileName(
+            self, "Restaurer une sauvegarde", directory,
+            "Sauvegardes (auto_backup_*.sql auto_backup_*.sql.gz)"
+        )
+        if not path:
+            return
             
-            # Get all tables data
-            tables = ['etudiants', 'absences']
+        chain = BackupChain(os.path.dirname(path))
+        reply = QMessageBox.question(
+            self, "Confirmation",
+            f"Restaurer {os.path.basename(path)} ?\n"
+            "Toutes les données actuelles des étudiants et des absences seront remplacées.",
+            QMessageBox.Yes | QMessageBox.No
+        )
+        if reply != QMessageBox.Yes:
+            return
             
-            with open(backup_file, 'w', encoding='utf-8') as f:
-                for table in tables:
-                    # ecrire les table 
-                    self.cursor.execute(f"SHOW CREATE TABLE {table}")
-                    create_table = self.cursor.fetchone()['Create Table']
-                    f.write(f"{create_table};\n\n")
-                    
-                    # Write table data
-                    self.cursor.execute(f"SELECT * FROM {table}")
-                    rows = self.cursor.fetchall()
-                    
-                    if rows:
-                        columns = list(rows[0].keys())
-                        f.write(f"INSERT INTO {table} ({', '.join(columns)}) VALUES\n")
-                        
-                        for i, row in enumerate(rows):
-                            values = []
-                            for col in columns:
-                                val = row[col]
-                                if val is None:
-                                    values.append("NULL")
-                                elif isinstance(val, (int, float)):
-                                    values.append(str(val))
-                                else:
-                                    values.append(f"'{str(val).replace("'", "''")}'")
-                            
-                            f.write(f"({', '.join(values)})")
-                            if i < len(rows) - 1:
-                                f.write(",\n")
-                            else:
-                                f.write(";\n\n")
+        # Vérifié après les dialogues: le minuteur a pu lancer une sauvegarde entre-temps
+        if self.executor.is_pending("backup"):
+            QMessageBox.warning(self, "Erreur",
+                                "Une sauvegarde est en cours: réessayez la restauration une fois terminée")
+            return
             
-            #
-            backups = sorted([f for f in os.listdir(backup_dir) if f.startswith("auto_backup_")])
-            while len(backups) > 5:
-                os.remove(os.path.join(backup_dir, backups[0]))
-                backups = backups[1:]
+        self.backup_timer.stop()  # Pas de sauvegarde pendant la restauration
+        self.update_status("Restauration en cours...")
+        self.executor.submit(
+            "restore",
+            lambda connection, report: chain.restore(
+                connection, os.path.basename(path), progress=lambda rows, rate: report((rows, rate))),
+            self.restore_done,
+            self.restore_failed,
+            role="background",
+            on_progress=lambda value: self.update_status(
+                f"Restauration en cours: {value[0]} lignes ({value[1]:.0f} lignes/s)")
+        )
+    
+    def restore_done(self, rows):
+        """Reload the views once the backup is restored"""
+        self.apply_backup_settings()
+        self.refresh_views()  # Vide aussi le cache (statistiques du cumul restauré)
+        self.update_status(f"Restauration terminée: {rows} lignes")
+    
+    def restore_failed(self, message):
+        """Report a failed restore (it resumes where it stopped when run again)"""
+        self.query_cache.bump()
+        self.apply_backup_settings()
+        self.report_error("Erreur de restauration",
+                          f"Échec de restauration: {message}\n"
+                          "Relancez la restauration pour reprendre au dernier lot validé.")
+    
+    def verify_backups(self):
+        """Check every backup of the directory against its manifest"""
+        chain = BackupChain(self.backup_settings['directory'])
+        self.update_status("Vérification des sauvegardes...")
+        self.executor.run_in_background(
+            "verify_backups",
+            chain.verify,
+            self.show_backup_verification,
+            lambda message: self.report_error("Erreur de vérification", f"Échec de vérification: {message}")
+        )
+    
+    def show_backup_verification(self, results):
+        """Display the result of verify_backups"""
+        if not results:
+            self.update_status("Aucune sauvegarde à vérifier")
+            return
+        damaged = {filename: problems for filename, problems in results.items() if problems}
+        legacy = [filename for filename, problems in results.items() if problems is None]
+        checked = len(results) - len(legacy)
+        status = f"{checked - len(damaged)}/{checked} sauvegardes intactes"
+        if legacy:
+            status += f", {len(legacy)} ancienne(s) non vérifiable(s) (pas de manifeste)"
+        self.update_status(status)
+        if damaged:
+            details = "\n".join(f"{filename}: {'; '.join(problems)}" for filename, problems in damaged.items())
+            QMessageBox.warning(self, "Vérification des sauvegardes", details)
+        else:
+            QMessageBox.information(self, "Vérification des sauvegardes", status + ".")
+    
+    def rebuild_stats_rollup(self):
+        """Regenerate the daily absences rollup used by the statistics"""
+        if not self.db:
+            QMessageBox.warning(self, "Erreur", "Veuillez vous connecter d'abord")
+            return
             
-            self.update_status(f"Sauvegarde automatique créée: {backup_file}")
-        except Exception as e:
-            self.update_status("Erreur de sauvegarde automatique")
-            print(f"Erreur de sauvegarde automatique: {str(e)}")
+        db = self.db
+        
+        def job():
+            with db.transaction(role="background") as cursor:
+                rebuild_rollup(cursor)
+        
+        self.update_status("Reconstruction du cumul des absences...")
+        self.executor.run_in_background(
+            "rollup",
+            job,
+            self.rollup_rebuilt,
+            lambda message: self.report_error("Erreur de reconstruction", f"Échec de reconstruction: {message}")
+        )
+    
+    def rollup_rebuilt(self, _):
+        """Drop the statistics computed from the old rollup"""
+        self.query_cache.bump("absences_daily_rollup")
+        self.update_status("Cumul des absences reconstruit")
     
     def open_email_dialog(self):
         """Open the email sending dialog"""
-        if not self.db_connection:
+        if not self.db:
             QMessageBox.warning(self, "Erreur", "Veuillez vous connecter d'abord")
             return
             
-        dialog = EmailSender(self)
-        dialog.exec_()
+        dialog = EmailSender(self, mail_queue=self.mail_queue)
+        if dialog.exec_() == QDialog.Accepted:
+            self.flush_mail()
+    
+    def flush_mail(self):
+        """Send the queued emails that are due, on one SMTP session in the background"""
+        if self.executor.is_pending("mail") or not self.mail_queue.due():
+            return
+        settings = read_mail_settings()
+        self.executor.run_in_background(
+            "mail",
+            lambda: self.mail_queue.flush(settings),
+            self.mail_done,
+            self.mail_failed
+        )
+    
+    def mail_done(self, report):
+        """Report a pass of the mail queue"""
+        self.mail_error = None
+        if report.sent or report.retrying or report.failed:
+            self.update_status(report.summary())
+        if report.failed:
+            QMessageBox.warning(self, "Emails non envoyés", "\n".join(report.errors))
+    
+    def mail_failed(self, message):
+        """Report a pass stopped by the SMTP settings (the emails stay queued)"""
+        self.update_status("Erreur d'envoi des emails")
+        if message != self.mail_error:
+            self.mail_error = message
+            QMessageBox.critical(self, "Erreur", f"Échec d'envoi des emails: {message}\n"
+                                                 "Les emails restent en attente; vérifiez les paramètres SMTP.")
     
     def open_settings(self):
         """Open application settings dialog"""
-        QMessageBox.information(self, "Paramètres", "Cette fonctionnalité est en développement.")
+        dialog = SettingsDialog(self.backup_settings, self.digest_settings, self)
+        if dialog.exec_() == QDialog.Accepted:
+            self.backup_settings = dialog.backup_settings()
+            self.digest_settings = dialog.digest_settings()
+            self.save_session()
+            self.apply_backup_settings()
+            self.update_status("Paramètres enregistrés")
     
     def show_about(self):
         """Show about dialog"""
@@ -1321,6 +2662,24 @@ class AbsenceApp(QMainWindow):
                 self.host_input.setText(config['DATABASE'].get('host', 'localhost'))
                 self.user_input.setText(config['DATABASE'].get('user', 'root'))
                 self.db_input.setText(config['DATABASE'].get('database', 'gestion_absences_BTS'))
+            if 'BACKUP' in config:
+                backup = config['BACKUP']
+                self.backup_settings = {
+                    'enabled': backup.getboolean('enabled', True),
+                    'interval': backup.getint('interval', 60),
+                    'retention': backup.getint('retention', 20),
+                    'full_every': backup.getint('full_every', 7),
+                    'directory': backup.get('directory', "backups")
+                }
+            if 'DIGEST' in config:
+                digest = config['DIGEST']
+                self.digest_settings = {
+                    'enabled': digest.getboolean('enabled', False),
+                    'frequency': digest.get('frequency', "hebdomadaire"),
+                    'hour': digest.getint('hour', 7),
+                    'recipients': digest.get('recipients', ""),
+                    'students': digest.getboolean('students', True)
+                }
     
     def save_session(self):
         """Save current session settings"""
@@ -1330,6 +2689,8 @@ class AbsenceApp(QMainWindow):
             'user': self.user_input.text(),
             'database': self.db_input.text()
         }
+        config['BACKUP'] = {key: str(value) for key, value in self.backup_settings.items()}
+        config['DIGEST'] = {key: str(value) for key, value in self.digest_settings.items()}
         with open('app_config.ini', 'w') as configfile:
             config.write(configfile)
     
@@ -1364,7 +2725,7 @@ class AbsenceApp(QMainWindow):
             QLineEdit:focus, QComboBox:focus, QDateEdit:focus, QTextEdit:focus {
                 border: 1px solid #4CAF50;
             }
-            QTableWidget {
+            QTableWidget, QTableView {
                 border: 1px solid #ddd;
                 background-color: white;
                 gridline-color: #eee;